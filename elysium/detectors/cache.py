@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+
+from eth_utils import keccak
+
+from modules.evm_cfg_builder.cfg.cache import evict
+
+class DetectorCache(object):
+    """ Content-addressed on-disk cache of detector results. Entries are keyed by the keccak256 hash of
+    the runtime bytecode (without metadata), the detector, the digest of its docker image and its options,
+    so byte-identical contracts are only analyzed once, whatever path or address they come from. When
+    the cache grows beyond max_size bytes, the least recently used entries are evicted. """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def get_key(self, runtime_bytecode, detector, image_digest, options):
+        configuration = hashlib.sha256((detector.lower()+"\n"+image_digest+"\n"+options).encode("utf-8")).hexdigest()
+        return keccak(hexstr=runtime_bytecode).hex().replace("0x", "")+"_"+detector.lower()+"_"+configuration[:16]
+
+    def get(self, key):
+        """ Returns the cached bugs of key, None on a cache miss. """
+        path = os.path.join(self.directory, key+".json")
+        try:
+            with open(path, "r") as f:
+                bugs = json.load(f)
+            # The modification time records the last use of an entry
+            os.utime(path, None)
+            return bugs
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, key, bugs):
+        """ Stores the bugs of key sorted by pc and type, then evicts least recently used entries. """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = os.path.join(self.directory, key+".json")
+        with open(path+".tmp", "w") as f:
+            json.dump(sorted(bugs, key=lambda bug: (bug["pc"], bug["type"])), f, indent=4)
+        os.replace(path+".tmp", path)
+        self.evict()
+
+    def evict(self):
+        evict(self.directory, self.max_size, ".json")
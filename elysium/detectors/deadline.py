@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+
+class Deadline(object):
+    """ Kills the container of a detector once its timeout (in seconds) expires. Killing the container
+    ends its log stream, so the detector returns the bugs it has parsed until then. """
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.expired = False
+        self.container = None
+        self.timer = None
+
+    def start(self, container):
+        self.container = container
+        if self.timeout:
+            self.timer = threading.Timer(self.timeout, self._expire)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _expire(self):
+        self.expired = True
+        print("Warning:", self.name, "exceeded its deadline of", self.timeout, "seconds. Stopping", self.name+"...")
+        try:
+            self.container.kill()
+        except Exception:
+            # The container already exited
+            pass
+
+    def cancel(self):
+        if self.timer:
+            self.timer.cancel()
@@ -5,12 +5,18 @@ import time
 import json
 import docker
 
-def run_mythril_bytecode_analyzer(bytecode, debug=False):
+IMAGE = "christoftorres/mythril"
+OPTIONS = "--parallel-solving -o json --execution-timeout 120"
+MODULES = "UncheckedRetval,EtherThief,AccidentallyKillable,ArbitraryDelegateCall,TxOrigin"
+
+def run_mythril_bytecode_analyzer(bytecode, debug=False, deadline=None):
     print("Running Mythril...")
     bugs = list()
     start = time.time()
     client = docker.from_env()
-    container = client.containers.run('christoftorres/mythril', '-v 5 analyze -m UncheckedRetval,EtherThief,AccidentallyKillable,ArbitraryDelegateCall,TxOrigin --bin-runtime -c '+bytecode+' --parallel-solving -o json --execution-timeout 120', detach=True, remove=True)
+    container = client.containers.run(IMAGE, '-v 5 analyze -m '+MODULES+' --bin-runtime -c '+bytecode+' '+OPTIONS, detach=True, remove=True)
+    if deadline:
+        deadline.start(container)
     code_coverage = 0.0
     for line in container.logs(stream=True):
         if line.strip().decode("utf-8").startswith("mythril.laser.plugin.plugins.coverage.coverage_plugin [INFO]: Achieved"):
@@ -65,6 +71,8 @@ def run_mythril_bytecode_analyzer(bytecode, debug=False):
                     else:
                         if debug:
                             print(issue)
+    if deadline:
+        deadline.cancel()
     end = time.time()
     for bug in bugs:
         bug["code_coverage"] = code_coverage
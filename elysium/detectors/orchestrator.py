@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import queue
+import docker
+import threading
+
+from detectors import osiris, oyente, mythril
+from detectors.deadline import Deadline
+
+# Analyzer, docker image and options of every detector
+DETECTORS = {
+    "osiris": (osiris.run_osiris_bytecode_analyzer, osiris.IMAGE, osiris.OPTIONS),
+    "oyente": (oyente.run_oyente_bytecode_analyzer, oyente.IMAGE, oyente.OPTIONS),
+    "mythril": (mythril.run_mythril_bytecode_analyzer, mythril.IMAGE, mythril.MODULES+" "+mythril.OPTIONS)
+}
+
+def get_image_digest(image):
+    try:
+        return docker.from_env().images.get(image).id
+    except Exception:
+        return None
+
+def run_detectors(bytecode, detectors, timeouts=None, cache=None, debug=False):
+    '''
+        Runs the detectors concurrently, each one in its own thread and with its own deadline
+        (see detectors.deadline.Deadline), and yields the results of the detectors in the order
+        in which they finish. Detectors whose results are in the cache (see detectors.cache.DetectorCache)
+        are not run, complete results of the other detectors are added to the cache.
+    Args:
+        detectors (list): names of the detectors to run, e.g. ["Osiris", "Mythril"].
+        timeouts (dict): timeout in seconds per lower case detector name, detectors without a timeout run until they finish.
+    Yields:
+        tuple: the name of a detector and the list of bugs it detected.
+    '''
+    if timeouts is None:
+        timeouts = dict()
+    results = queue.Queue()
+
+    def run(detector, key):
+        analyzer = DETECTORS[detector.lower()][0]
+        deadline = Deadline(detector, timeouts.get(detector.lower()))
+        try:
+            bugs = analyzer(bytecode, debug=debug, deadline=deadline)
+            if key and not deadline.expired:
+                cache.put(key, bugs)
+        except Exception as e:
+            print("Error: Detector", detector, "failed:", repr(e))
+            bugs = list()
+        results.put((detector, bugs))
+
+    threads = list()
+    for detector in detectors:
+        key = None
+        if cache:
+            _, image, options = DETECTORS[detector.lower()]
+            image_digest = get_image_digest(image)
+            if image_digest:
+                key = cache.get_key(bytecode, detector, image_digest, options)
+                bugs = cache.get(key)
+                if bugs is not None:
+                    print("Using cached results of", detector+".")
+                    results.put((detector, bugs))
+                    continue
+        thread = threading.Thread(target=run, args=(detector, key))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for _ in detectors:
+        yield results.get()
@@ -5,12 +5,17 @@ import time
 import json
 import docker
 
-def run_osiris_bytecode_analyzer(bytecode, debug=False):
+IMAGE = "christoftorres/osiris"
+OPTIONS = "-glt 1800 -b --debug"
+
+def run_osiris_bytecode_analyzer(bytecode, debug=False, deadline=None):
     print("Running Osiris...")
     bugs = list()
     start = time.time()
     client = docker.from_env()
-    container = client.containers.run('christoftorres/osiris', "/bin/bash -c \"echo '"+bytecode+"' > bytecode.evm; python osiris/osiris.py -s bytecode.evm -glt 1800 -b --debug\"", detach=True, remove=True)
+    container = client.containers.run(IMAGE, "/bin/bash -c \"echo '"+bytecode+"' > bytecode.evm; python osiris/osiris.py -s bytecode.evm "+OPTIONS+"\"", detach=True, remove=True)
+    if deadline:
+        deadline.start(container)
     code_coverage, end_of_execution = 0.0, False
     previous_line = ""
     for line in container.logs(stream=True):
@@ -35,6 +40,8 @@ def run_osiris_bytecode_analyzer(bytecode, debug=False):
                         bug["opcode"] = json.loads(current_line.replace("'", '"').replace('<', '"<').replace('>', '>"').lower())["opcode"].upper()
                         bugs.append(bug)
             previous_line = current_line
+    if deadline:
+        deadline.cancel()
     end = time.time()
     for bug in bugs:
         bug["code_coverage"] = code_coverage
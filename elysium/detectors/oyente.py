@@ -4,12 +4,17 @@
 import time
 import docker
 
-def run_oyente_bytecode_analyzer(bytecode, debug=False):
+IMAGE = "christoftorres/oyente"
+OPTIONS = "-b"
+
+def run_oyente_bytecode_analyzer(bytecode, debug=False, deadline=None):
     print("Running Oyente...")
     bugs = []
     start = time.time()
     client = docker.from_env()
-    container = client.containers.run('christoftorres/oyente', "/bin/bash -c \"echo '"+bytecode+"' > bytecode.evm; python3 oyente/oyente.py -s bytecode.evm -b\"", detach=True, remove=True)
+    container = client.containers.run(IMAGE, "/bin/bash -c \"echo '"+bytecode+"' > bytecode.evm; python3 oyente/oyente.py -s bytecode.evm "+OPTIONS+"\"", detach=True, remove=True)
+    if deadline:
+        deadline.start(container)
     code_coverage = 0.0
     previous_line = ""
     for line in container.logs(stream=True):
@@ -27,6 +32,8 @@ def run_oyente_bytecode_analyzer(bytecode, debug=False):
                 bug["pc"] = pc
                 bug["type"] = "reentrancy"
                 bugs.append(bug)
+    if deadline:
+        deadline.cancel()
     end = time.time()
     for bug in bugs:
         bug["code_coverage"] = code_coverage
@@ -6,22 +6,781 @@ import math
 import time
 import json
 import argparse
-
-from web3 import Web3
-from pyevmasm import assemble_one
-from eth_utils import decode_hex, to_canonical_address
+import pyevmasm
+import hashlib
+import contextlib
+import multiprocessing
+import multiprocessing.connection
 
 from utils.utils import *
 from utils.settings import *
 
 from modules.storage_inference import *
 from modules.bytecode_rewriter import *
+from modules.analysis_context import AnalysisContext
+from modules.patch_templates import TEMPLATES_DIRECTORY, get_patch_templates, instantiate_patches
+from modules.patch_outlining import outline_patches, share_error_handlers
+from modules.peephole_optimizer import optimize_patched_basic_blocks
+from modules.gas_estimator import FORKS, GasTable, get_basic_block_gas, estimate_gas_overhead
 from modules.taint_analysis import TaintRunner
 from modules.evm_cfg_builder.cfg import CFG
 
-from detectors.osiris import run_osiris_bytecode_analyzer
-from detectors.oyente import run_oyente_bytecode_analyzer
-from detectors.mythril import run_mythril_bytecode_analyzer
+class PatchError(Exception):
+    """ Raised by patch() when a bytecode cannot be patched. Carries the exit code of elysium.py and the
+    report collected so far, None if there is no report to be written. """
+
+    def __init__(self, message, exit_code, report=None):
+        super(PatchError, self).__init__(message)
+        self.exit_code = exit_code
+        self.report = report
+
+# Options of patch(), a None CFG cache directory disables the CFG cache, a None CFG cache size does not limit it
+DEFAULT_PATCH_OPTIONS = {
+    "enable_error_handling_inference": False,
+    "cfg_cache_directory": CFG_CACHE_DIRECTORY,
+    "cfg_cache_size": CFG_CACHE_SIZE,
+    "cfg_workers": None,
+    # Do not patch the overflows and underflows that the value range analysis proves to be impossible
+    "eliminate_redundant_checks": False,
+    # Jump to one shared block per error handling sequence instead of inlining it into every patch
+    "share_error_handlers": False,
+    # Call identical patches as shared subroutines if this saves at least outline_min_bytes_saved bytes
+    "outline_patches": False,
+    "outline_min_bytes_saved": OUTLINE_MIN_BYTES_SAVED,
+    # Run the peephole optimizer on the patched basic blocks before they are relocated
+    "peephole_optimization": False,
+    # Fork of the gas costs of the gas overhead estimate
+    "gas_fork": GAS_FORK,
+    # Path prefix of the .pdf files of the original and patched control-flow graphs, None to not export them
+    "cfg_export": None
+}
+
+def patch(deployed_bytecode, deployment_bytecode=None, bugs=None, options=None):
+    """ Patches the bugs of a bytecode. Nothing is written to a file and the process is never exited, so the
+    templates, the function signatures and the CFG cache stay loaded from one call to the next.
+
+    Args:
+        deployed_bytecode (str): hex string of the deployed bytecode, with its metadata.
+        deployment_bytecode (str): hex string of the deployment bytecode, None if only the deployed bytecode is patched.
+        bugs (list): bugs to be patched, as in the bug reports.
+        options (dict): options that override DEFAULT_PATCH_OPTIONS.
+
+    Returns:
+        str: hex string of the patched bytecode, with the deployment bytecode if given. The deployed bytecode if there
+        is nothing to be patched.
+        dict: the report.
+        list: sorted (original pc, patched pc) tuples of the instructions of the deployed bytecode, None if there is
+        nothing to be patched.
+
+    Raises:
+        PatchError: if the control-flow graph cannot be recovered or the deployment bytecode is not valid.
+    """
+    options = dict(DEFAULT_PATCH_OPTIONS, **(options or dict()))
+    cfg_cache_directory = options["cfg_cache_directory"]
+    cfg_cache_size = options["cfg_cache_size"]
+    cfg_workers = options["cfg_workers"]
+    cfg_export = options["cfg_export"]
+    eliminate_redundant_checks = options["eliminate_redundant_checks"]
+    bugs = sorted(bugs or list(), key=lambda bug: bug["pc"])
+
+    metadata = extract_metadata(deployed_bytecode)
+    runtime_bytecode = remove_metadata(deployed_bytecode)
+
+    report = dict()
+    report["patches"] = list()
+    report["skipped_bugs"] = list()
+
+    if len(bugs) == 0:
+        print("No bugs detected! There is nothing to be patched!")
+        return deployed_bytecode, report, None
+
+    print("Detected", len(bugs), "bug(s):")
+    for bug in bugs:
+        if bug["type"] == "overflow" or bug["type"] == "underflow":
+            print("--> Detected", "'"+bug["type"]+"'", "("+bug["opcode"]+")", "bug at program counter address", bug["pc"], "("+hex(bug["pc"])+")", "using", bug["tool"], "with a code coverage of", str(bug["code_coverage"])+"%.")
+        else:
+            print("--> Detected", "'"+bug["type"]+"'", "bug at program counter address", bug["pc"], "("+hex(bug["pc"])+")", "using", bug["tool"], "with a code coverage of", str(bug["code_coverage"])+"%.")
+
+    # Export control-flow graph
+    if cfg_export:
+        print("Exporting original control-flow graph...")
+        if deployment_bytecode:
+            export_cfg(CFG(deployment_bytecode, cache_directory=cfg_cache_directory, cache_size=cfg_cache_size, workers=cfg_workers), cfg_export+".constructor.original", "pdf")
+        export_cfg(CFG(runtime_bytecode, cache_directory=cfg_cache_directory, cache_size=cfg_cache_size, workers=cfg_workers), cfg_export+".original", "pdf")
+
+    try:
+        print("Recovering control-flow graph...")
+        t = time.time()
+        cfg = CFG(runtime_bytecode, cache_directory=cfg_cache_directory, cache_size=cfg_cache_size, workers=cfg_workers)
+        report["control_flow_graph_recovery_time"] = time.time() - t
+        dead_basic_blocks = 0
+        for basic_block in cfg.basic_blocks:
+            if len(basic_block.all_incoming_basic_blocks) == 0 and len(basic_block.all_outgoing_basic_blocks) == 0:
+                if not (len(basic_block.instructions) == 1 and basic_block.instructions[0].mnemonic in ["STOP", "INVALID"]):
+                    dead_basic_blocks += 1
+        print("Recovered", str(round((len(cfg.basic_blocks) - dead_basic_blocks) / len(cfg.basic_blocks) * 100))+"%", "of the control-flow graph")
+        report["control_flow_graph_recovery"] = str(round((len(cfg.basic_blocks) - dead_basic_blocks) / len(cfg.basic_blocks) * 100))+"%"
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        print(repr(e))
+        report["control_flow_graph_recovery"] = repr(e)
+        raise PatchError("Control-flow graph could not be recovered!", -7, report)
+
+    # Create a copy of the original mappings
+    for basic_block in cfg.basic_blocks:
+        for instruction in basic_block.instructions:
+            instruction.pc = instruction.pc, instruction.pc
+
+    if deployment_bytecode:
+        constructor_cfg = CFG(deployment_bytecode, cache_directory=cfg_cache_directory, cache_size=cfg_cache_size, workers=cfg_workers)
+        for basic_block in constructor_cfg.basic_blocks:
+            for instruction in basic_block.instructions:
+                instruction.pc = instruction.pc, instruction.pc
+        all_codecopy_instructions = get_all_codecopy_instructions(constructor_cfg.entry_point, codecopy_instructions=list())
+        if len(all_codecopy_instructions) == 0:
+            raise PatchError("Deployment bytecode is not valid! No CODECOPY instruction found inside deployment bytecode!", -3)
+        codecopy_pc = all_codecopy_instructions[-1].pc[1]
+        codecopy_delete_sequence = ""
+        codecopy_basic_block = get_basic_block(constructor_cfg, codecopy_pc)
+        for i in range(len(codecopy_basic_block.instructions)):
+            if codecopy_basic_block.instructions[i].mnemonic == "CODECOPY":
+                codecopy_delete_sequence = " ".join([str(instruction).replace(" ", "_") for instruction in codecopy_basic_block.instructions[i-4:i+1]])
+                break
+
+    context = AnalysisContext(cfg, options["enable_error_handling_inference"])
+    free_storage_location, _ = get_free_storage_location(cfg, context.get_storage_accesses())
+
+    # Patches are collected in a patch plan and applied together once all bugs have been processed
+    patch_plan = list()
+    constructor_patch_plan = list()
+
+    for bug in bugs:
+        # TODO: Future work: Add signedness patch for multiplication
+        if bug["type"] == "overflow":
+            # Find basic block with the bug
+            buggy_basic_block = get_basic_block(cfg, bug["pc"])
+
+            # Identify error handling strategy
+            error_handling_sequence = context.get_error_handling_sequence(buggy_basic_block)
+
+            # Find integer bounds
+            integer_size = None
+            backtrace = get_backtrace(buggy_basic_block, list(), list(), bug["pc"])
+
+            taint_analysis = TaintRunner(keep_trace=False)
+            signextend_mappings = dict()
+            unsigned = True
+            for instruction in backtrace:
+                if instruction.mnemonic.startswith("PUSH"):
+                    taint_analysis.introduce_taint(instruction, instruction)
+                # Unsigned
+                elif instruction.mnemonic == "AND":
+                    taint_analysis.introduce_taint(instruction, instruction)
+                # Signed
+                elif instruction.mnemonic == "SIGNEXTEND":
+                    tainted_values, stack_values = taint_analysis.check_taint(instruction)
+                    signextend_mappings[instruction.pc[1]] = [value for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic.startswith("PUSH")][0]
+                    signextends = [value for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic == "SIGNEXTEND"]
+                    if len(signextends) > 0:
+                        taint_analysis.introduce_taint(signextends[0], instruction)
+                    else:
+                        taint_analysis.introduce_taint(instruction, instruction)
+                elif instruction.pc[1] == bug["pc"]:
+                    tainted_values, stack_values = taint_analysis.check_taint(instruction)
+                    if any([True for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic == "SIGNEXTEND"]):
+                        integer_sizes = [8 * (signextend_mappings[value.pc[1]].operand + 1) for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic == "SIGNEXTEND"]
+                        if integer_sizes:
+                            integer_size = max(integer_sizes)
+                            unsigned = False
+                    elif any([True for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic.startswith("PUSH")]) and any([True for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic == "AND"]) :
+                        # Check that integer size is a valid multiple of 8
+                        try:
+                            if stack_values and (max(stack_values) + 1) % 8 == 0:
+                                integer_size = max(stack_values)
+                                unsigned = True
+                        except:
+                            pass
+                else:
+                    taint_analysis.propagate_taint(instruction)
+
+            # Skip the patch if the overflow is proven to be impossible
+            if eliminate_redundant_checks and unsigned:
+                reason = context.get_value_ranges().get_overflow_proof(bug["pc"], integer_size or 2**256-1)
+                if reason:
+                    print("Skipping 'overflow' bug at program counter address", bug["pc"], "("+hex(bug["pc"])+"):", reason)
+                    report["skipped_bugs"].append({"bug_type": "integer_overflow", "pc": bug["pc"], "reason": reason})
+                    continue
+
+            # Generate and apply patch
+            if bug["opcode"] == "ADD":
+                if unsigned:
+                    integer_bounds = ""
+                    if integer_size:
+                        push_width = get_push_width(integer_size)
+                        integer_bounds = "PUSH"+str(push_width)+"_"+hex(integer_size)
+                    else:
+                        integer_bounds = "PUSH"+str(get_push_width(2**256-1))+"_"+hex(2**256-1)
+                    report["patches"].append({"bug_type": "integer_overflow", "pc": bug["pc"], "patch": list()})
+                    for patch in instantiate_patches("unsigned_integer_overflow_addition_patch", {"integer_bounds": integer_bounds, "error_handling_sequence": error_handling_sequence}):
+                        patch_plan.append((bug["pc"], patch))
+                        report["patches"][-1]["patch"].append(patch)
+                else:
+                    integer_bounds = "PUSH"+str(get_push_width(int(integer_size / 8 - 1)))+"_"+hex(int(integer_size / 8 - 1))+" SIGNEXTEND"
+                    int_max = 2 ** (integer_size - 1) - 1
+                    push_int_max = "PUSH"+str(get_push_width(int_max))+"_"+hex(int_max)
+                    push_int_min = push_int_max+" NOT"
+                    report["patches"].append({"bug_type": "integer_overflow", "pc": bug["pc"], "patch": list()})
+                    for patch in instantiate_patches("unsigned_integer_overflow_addition_patch", {"integer_bounds": integer_bounds, "error_handling_sequence": error_handling_sequence, "push_int_max": push_int_max, "push_int_min": push_int_min}):
+                        patch_plan.append((bug["pc"], patch))
+                        report["patches"][-1]["patch"].append(patch)
+
+            elif bug["opcode"] == "MUL":
+                if unsigned:
+                    if integer_size:
+                        push_width = get_push_width(integer_size)
+                        integer_bounds = "PUSH"+str(push_width)+"_"+hex(integer_size)
+                        report["patches"].append({"bug_type": "integer_overflow", "pc": bug["pc"], "patch": list()})
+                        for patch in instantiate_patches("unsigned_integer_overflow_multiplication_patch", {"integer_bounds": integer_bounds, "error_handling_sequence": error_handling_sequence}):
+                            patch_plan.append((bug["pc"], patch))
+                            report["patches"][-1]["patch"].append(patch)
+                    else:
+                        report["patches"].append({"bug_type": "integer_overflow", "pc": bug["pc"], "patch": list()})
+                        for patch in instantiate_patches("unsigned_integer_overflow_multiplication_256_bit_patch", {"error_handling_sequence": error_handling_sequence}):
+                            patch_plan.append((bug["pc"], patch))
+                            report["patches"][-1]["patch"].append(patch)
+                else:
+                    # TODO: Future work: Add patch for signed multiplication
+                    print("Error: Patch for signed multiplcation is missing!")
+
+        elif bug["type"] == "underflow":
+            # Find basic block with the bug
+            buggy_basic_block = get_basic_block(cfg, bug["pc"])
+
+            # Identify error handling strategy
+            error_handling_sequence = context.get_error_handling_sequence(buggy_basic_block)
+
+            # Skip the patch if the underflow is proven to be impossible
+            if eliminate_redundant_checks:
+                reason = context.get_value_ranges().get_underflow_proof(bug["pc"])
+                if reason:
+                    print("Skipping 'underflow' bug at program counter address", bug["pc"], "("+hex(bug["pc"])+"):", reason)
+                    report["skipped_bugs"].append({"bug_type": "integer_underflow", "pc": bug["pc"], "reason": reason})
+                    continue
+
+            # Generate and apply patch
+            report["patches"].append({"bug_type": "integer_undeflow", "pc": bug["pc"], "patch": list()})
+            for patch in instantiate_patches("integer_underflow_patch", {"error_handling_sequence": error_handling_sequence}):
+                patch_plan.append((bug["pc"], patch))
+                report["patches"][-1]["patch"].append(patch)
+
+        elif bug["type"] == "reentrancy":
+            # Find basic block with the bug
+            buggy_basic_block = get_basic_block(cfg, bug["pc"])
+
+            # Find free storage location
+            storage_location_sequence, free_storage_location = get_free_storage_location_sequence(free_storage_location)
+
+            # Identify error handling strategy
+            error_handling_sequence = context.get_error_handling_sequence(buggy_basic_block)
+
+            # Identify reentrancy origin function and function storage write locations
+            reentrany_origin_function = None
+            function_storage_write_locations = context.get_function_storage_writes()
+            for function in cfg.functions:
+                if function.name in function_storage_write_locations:
+                    for basic_block in function.basic_blocks:
+                        for instruction in basic_block.instructions:
+                            if instruction.pc[1] == bug["pc"]:
+                                reentrany_origin_function = function.name
+
+            patches_to_be_applied = dict()
+
+            # Generate patches for cross function reentrany locations
+            cross_function_reentrancy_locations = dict()
+            if reentrany_origin_function:
+                reentrany_origin_function_storage_locations = [storage_location[0] for storage_location in function_storage_write_locations[reentrany_origin_function]]
+                for function in function_storage_write_locations:
+                    if function != reentrany_origin_function:
+                        for storage_location in function_storage_write_locations[function]:
+                            if storage_location[0] in reentrany_origin_function_storage_locations:
+                                address = storage_location[1].pc[1]
+                                if not function in cross_function_reentrancy_locations:
+                                    cross_function_reentrancy_locations[function] = list()
+                                cross_function_reentrancy_locations[function].append(address)
+
+            for function in cross_function_reentrancy_locations:
+                max_pc = max(cross_function_reentrancy_locations[function])
+                min_pc = min(cross_function_reentrancy_locations[function])
+                for patch in instantiate_patches("reentrancy_patch", {"free_storage_location": storage_location_sequence, "error_handling_sequence": error_handling_sequence}):
+                    if patch["insert_mode"] == "after":
+                        address = max_pc
+                    else:
+                        address = min_pc
+                    if not address in patches_to_be_applied:
+                        patches_to_be_applied[address] = list()
+                    if not patch in patches_to_be_applied[address]:
+                        patches_to_be_applied[address].append(patch)
+
+            # Generate patch for reentrany origin
+            for patch in instantiate_patches("reentrancy_patch", {"free_storage_location": storage_location_sequence, "error_handling_sequence": error_handling_sequence}):
+                if not bug["pc"] in patches_to_be_applied:
+                    patches_to_be_applied[bug["pc"]] = list()
+                patches_to_be_applied[bug["pc"]].append(patch)
+
+            # Apply generated patches
+            for address in sorted(patches_to_be_applied.keys()):
+                report["patches"].append({"bug_type": "reentrancy", "pc": address, "patch": list()})
+                for patch in patches_to_be_applied[address]:
+                    patch_plan.append((address, patch))
+                    report["patches"][-1]["patch"].append(patch)
+
+        elif bug["type"] == "unhandled exception":
+            # Find basic block with the bug
+            buggy_basic_block = get_basic_block(cfg, bug["pc"])
+
+            # Identify error handling strategy
+            error_handling_sequence = context.get_error_handling_sequence(buggy_basic_block)
+
+            # Generate and apply patch
+            report["patches"].append({"bug_type": "unhandled_exception", "pc": bug["pc"], "patch": list()})
+            for patch in instantiate_patches("unhandled_exception_patch", {"error_handling_sequence": error_handling_sequence}):
+                patch_plan.append((bug["pc"], patch))
+                report["patches"][-1]["patch"].append(patch)
+
+        # TODO: Future work: Implement case 2
+        elif bug["type"] == "leaking ether" or bug["type"] == "suicidal" or bug["type"] == "unsafe delegatecall":
+            # Possible cases:
+            # 1. Access control check is completely missing.
+            # 2. Access control check is defined and used somewhere, but not in this function.
+            # 3. Access control check is defined and used for this function, but access can be set by everyone.
+
+            # Find basic block with the bug
+            buggy_basic_block = get_basic_block(cfg, bug["pc"])
+
+            # Identify error handling strategy
+            error_handling_sequence = context.get_error_handling_sequence(buggy_basic_block)
+
+            # Find free storage location
+            storage_location_sequence, free_storage_location = get_free_storage_location_sequence(free_storage_location)
+
+            # Check if buggy function contains an access control check
+            push_storage_location, push_address_mask, caller, sload = context.get_access_control_information(bug["pc"])
+            # If buggy function contains an access control check, then search for locations that are unprotected and access can be granted
+            if push_storage_location and push_address_mask and caller and sload:
+                unprotected_writes_to_storage = list()
+                storage_write_slots = context.get_storage_write_slots()
+                for pc in sorted(storage_write_slots):
+                    if storage_write_slots[pc] == push_storage_location.operand:
+                        access_control_information = context.get_access_control_information(pc)
+                        if not (access_control_information[0] and access_control_information[1] and access_control_information[2] and access_control_information[3]):
+                            unprotected_writes_to_storage.append(pc)
+                # Generate and apply patch
+                if len(unprotected_writes_to_storage) > 0:
+                    if deployment_bytecode:
+                        report["patches"].append({"bug_type": bug["type"].replace(" ", "_"), "pc": codecopy_pc, "patch": list()})
+                        for patch in instantiate_patches("access_control_patch", {"free_storage_location": storage_location_sequence}):
+                            if patch["constructor"] == True:
+                                constructor_patch_plan.append((codecopy_pc, patch))
+                                report["patches"][-1]["patch"].append(patch)
+                for pc in unprotected_writes_to_storage:
+                    report["patches"].append({"bug_type": bug["type"].replace(" ", "_"), "pc": pc, "patch": list()})
+                    for patch in instantiate_patches("access_control_patch", {"free_storage_location": storage_location_sequence, "error_handling_sequence": error_handling_sequence}):
+                        if patch["constructor"] == False:
+                            patch_plan.append((pc, patch))
+                            report["patches"][-1]["patch"].append(patch)
+            else:
+                # Generate and apply patch
+                if deployment_bytecode:
+                    report["patches"].append({"bug_type": bug["type"].replace(" ", "_"), "pc": codecopy_pc, "patch": list()})
+                    for patch in instantiate_patches("access_control_patch", {"free_storage_location": storage_location_sequence}):
+                        if patch["constructor"] == True:
+                            constructor_patch_plan.append((codecopy_pc, patch))
+                            report["patches"][-1]["patch"].append(patch)
+                report["patches"].append({"bug_type": bug["type"].replace(" ", "_"), "pc": bug["pc"], "patch": list()})
+                for patch in instantiate_patches("access_control_patch", {"free_storage_location": storage_location_sequence, "error_handling_sequence": error_handling_sequence}):
+                    if patch["constructor"] == False:
+                        patch_plan.append((bug["pc"], patch))
+                        report["patches"][-1]["patch"].append(patch)
+
+        elif bug["type"] == "transaction origin":
+            report["patches"].append({"bug_type": "transaction_origin", "pc": bug["pc"], "patch": list()})
+            for patch in instantiate_patches("transaction_origin_patch"):
+                patch_plan.append((bug["pc"], patch))
+                report["patches"][-1]["patch"].append(patch)
+
+        else:
+            print("Bug type '"+bug["type"]+"' is not supported!")
+
+    report["analysis_cache"] = context.statistics
+
+    # Share error handlers between patches
+    if options["share_error_handlers"]:
+        patch_plan, report["shared_error_handlers"] = share_error_handlers(cfg, patch_plan)
+        for error_handler in report["shared_error_handlers"]:
+            print("Shared error handler", "'"+error_handler["sequence"]+"'", "between", len(error_handler["call_sites"]), "patch(es):", error_handler["bytes_saved"], "byte(s) saved.")
+
+    # Outline identical patches into shared subroutines
+    if options["outline_patches"]:
+        patch_plan, report["outlined_patches"] = outline_patches(cfg, patch_plan, options["outline_min_bytes_saved"])
+        for subroutine in report["outlined_patches"]:
+            print("Outlined patch called from", len(subroutine["call_sites"]), "location(s):", subroutine["bytes_saved"], "byte(s) saved,", subroutine["extra_gas_per_call"], "extra gas per call.")
+
+    # Gas of the basic blocks before patching
+    gas_table = GasTable(options["gas_fork"])
+    original_gas = get_basic_block_gas(cfg, gas_table)
+
+    # Apply patches
+    report["patch_conflicts"] = list()
+    conflicts = apply_patches(cfg, patch_plan)
+    if deployment_bytecode:
+        conflicts += apply_patches(constructor_cfg, constructor_patch_plan)
+    for conflict in conflicts:
+        print("Error: Patch could not be applied at address", conflict["address"], "("+conflict["reason"]+"):", conflict["patch"])
+        report["patch_conflicts"].append({"pc": conflict["address"], "reason": conflict["reason"], "patch": conflict["patch"]})
+
+    # Remove redundant instructions from the patched basic blocks
+    if options["peephole_optimization"]:
+        report["peephole_optimizations"] = optimize_patched_basic_blocks(cfg)
+        if report["peephole_optimizations"]:
+            print("Peephole optimizer applied", len(report["peephole_optimizations"]), "rule(s):", sum(optimization["bytes_saved"] for optimization in report["peephole_optimizations"]), "byte(s) saved.")
+
+    # Estimate the gas overhead of every function
+    gas_overhead = estimate_gas_overhead(cfg, original_gas, get_basic_block_gas(cfg, gas_table))
+
+    # Recompute jump locations and assemble patched runtime bytecode
+    patched_runtime_bytecode, pc_map = relocate_and_assemble(cfg)
+    patched_runtime_bytecode = patched_runtime_bytecode.hex()
+
+    if deployment_bytecode:
+        # Align basic blocks to deployment bytecode
+        patched_deployment_bytecode, _ = relocate_and_assemble(constructor_cfg, relocate=False)
+        patched_deployment_bytecode = patched_deployment_bytecode.hex()
+
+        # Recompute codecopy location in constructor
+        codecopy_insert_sequence = ""
+        push_width = len(hex(int(len(patched_runtime_bytecode + metadata) / 2)).replace("0x", ""))
+        if push_width % 2 != 0:
+            push_width += 1
+        push_width = int(push_width / 2)
+        codecopy_insert_sequence += "PUSH" + str(push_width) + "_" + hex(int(len(patched_runtime_bytecode + metadata) / 2))
+        codecopy_insert_sequence += " DUP1 "
+        push_width = len(hex(int(len(patched_deployment_bytecode) / 2)).replace("0x", ""))
+        if push_width % 2 != 0:
+            push_width += 1
+        push_width = int(push_width / 2)
+        codecopy_insert_sequence += "PUSH" + str(push_width) + "_" + hex(int(len(patched_deployment_bytecode) / 2))
+        codecopy_insert_sequence += " PUSH1_0x0 CODECOPY"
+        print("Deployment bytecode size:", int(len(patched_deployment_bytecode) / 2), "bytes (original: "+str(int(len(deployment_bytecode) / 2))+" bytes)", str((float(len(patched_deployment_bytecode) / 2) - float(len(deployment_bytecode) / 2)) / (float(len(deployment_bytecode) / 2) / 100))+"% increase.")
+        report["original_deployment_size"] = str(int(len(deployment_bytecode) / 2))+" bytes"
+        report["patched_deployment_size"] = str(int(len(patched_deployment_bytecode) / 2))+" bytes"
+        constructor_cfg = inject_patch_at_address(constructor_cfg, {"delete": codecopy_delete_sequence, "insert": codecopy_insert_sequence, "insert_mode": "before", "constructor": True}, codecopy_pc)
+
+        # Align basic blocks to bytecode
+        patched_deployment_bytecode, _ = relocate_and_assemble(constructor_cfg, relocate=False)
+        patched_deployment_bytecode = patched_deployment_bytecode.hex()
+
+    print("Runtime bytecode size:", int(len(patched_runtime_bytecode) / 2), "bytes (original: "+str(int(len(runtime_bytecode) / 2))+" bytes)", str((float(len(patched_runtime_bytecode) / 2) - float(len(runtime_bytecode) / 2)) / (float(len(runtime_bytecode) / 2) / 100))+"% increase.")
+    report["original_runtime_size"] = str(int(len(runtime_bytecode) / 2))+" bytes"
+    report["patched_runtime_size"] = str(int(len(patched_runtime_bytecode) / 2))+" bytes"
+    for function in gas_overhead:
+        print("Gas overhead of function", function["name"], "("+gas_table.fork+"):", function["min_gas_overhead"], "to", function["max_gas_overhead"], "gas.")
+    report["gas_overhead"] = {"fork": gas_table.fork, "functions": gas_overhead}
+
+    if metadata:
+        print("Metadata:", "0x"+metadata)
+
+    # Assemble patched deployment bytecode, patched runtime bytecode, and metadata
+    if deployment_bytecode:
+        patched_bytecode = patched_deployment_bytecode + patched_runtime_bytecode + metadata
+    else:
+        patched_bytecode = patched_runtime_bytecode + metadata
+
+    # Export control-flow graph
+    if cfg_export:
+        print("Exporting patched control-flow graph...")
+        if deployment_bytecode:
+            export_cfg(CFG(patched_deployment_bytecode, cache_directory=cfg_cache_directory, cache_size=cfg_cache_size, workers=cfg_workers), cfg_export+".constructor.patched", "pdf")
+        export_cfg(CFG(patched_runtime_bytecode, cache_directory=cfg_cache_directory, cache_size=cfg_cache_size, workers=cfg_workers), cfg_export+".patched", "pdf")
+
+    return patched_bytecode, report, pc_map
+
+def run_job(job, options=None):
+    """ Runs a patching job and returns its result. The output of the patching is written to stderr, errors are
+    returned in the result instead of being raised.
+
+    Args:
+        job (dict): "bytecode" (hex string) or "bytecode_file", "bugs" or "bug_report" (.json file), and optionally
+        an "id" that is copied to the result and "options" that override the options.
+        options (dict): options of patch().
+
+    Returns:
+        dict: "id", "patched_bytecode", "report", "pc_map" and "execution_time", or "error" (and "exit_code" if the
+        bytecode could not be patched).
+    """
+    result = {"id": job.get("id")}
+    execution_start = time.time()
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            bytecode = job.get("bytecode")
+            if bytecode is None:
+                with open(job["bytecode_file"]) as f:
+                    bytecode = f.read()
+            deployment_bytecode, deployed_bytecode = split_bytecode(bytecode)
+            bugs = job.get("bugs")
+            if bugs is None:
+                with open(job["bug_report"]) as f:
+                    bugs = json.load(f)
+            patched_bytecode, report, pc_map = patch(deployed_bytecode, deployment_bytecode, bugs, dict(options or dict(), **job.get("options", dict())))
+            result["patched_bytecode"] = patched_bytecode
+            result["report"] = report
+            result["pc_map"] = pc_map
+        except PatchError as e:
+            result["error"] = str(e)
+            result["exit_code"] = e.exit_code
+            result["report"] = e.report
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            result["error"] = repr(e)
+    result["execution_time"] = time.time() - execution_start
+    return result
+
+def worker():
+    """ Reads patching jobs as JSON lines on stdin and writes their results as JSON lines on stdout, in the same
+    order (see run_job). The process is kept alive between jobs, so its caches stay hot. """
+    parser = argparse.ArgumentParser(prog="elysium.py worker", description="Patch the jobs read as JSON lines on stdin and write their results as JSON lines on stdout.")
+
+    parser.add_argument(
+        "--enable-error-handling-inference", help="Enable error handling inference instead of default error handling based on 'REVERT'.", action="store_true")
+
+    parser.add_argument(
+        "--disable-cfg-cache", help="Always recover control-flow graphs instead of loading them from the cache.", action="store_true")
+
+    parser.add_argument(
+        "--cfg-workers", type=int, help="Recover the control-flow graphs of the functions in parallel in this number of worker processes.")
+    args = parser.parse_args(sys.argv[2:])
+
+    options = {
+        "enable_error_handling_inference": args.enable_error_handling_inference,
+        "cfg_cache_directory": None if args.disable_cfg_cache else CFG_CACHE_DIRECTORY,
+        "cfg_workers": args.cfg_workers
+    }
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            result = {"id": None, "error": "Invalid job: "+repr(e)}
+        else:
+            result = run_job(job, options)
+        sys.stdout.write(json.dumps(result)+"\n")
+        sys.stdout.flush()
+
+def get_batch_jobs(path):
+    """ Yields the jobs of a directory or of a manifest. In a directory, every .bin file is a bytecode whose bugs are
+    either in a .bugs.json file next to it or in a .bugreport.json file of a sibling 'bugs' directory. A manifest
+    contains one job per JSON line (see run_job), lines that are not JSON objects are yielded as jobs with an error. """
+    if os.path.isdir(path):
+        for root, directories, files in os.walk(path):
+            directories.sort()
+            for file in sorted(files):
+                if not file.endswith(".bin") or file.endswith(".patched.bin"):
+                    continue
+                name = file[:-len(".bin")]
+                for bug_report in [os.path.join(root, name+".bugs.json"), os.path.join(os.path.dirname(root), "bugs", name+".bugreport.json")]:
+                    if os.path.exists(bug_report):
+                        yield {"id": os.path.join(root, file), "bytecode_file": os.path.join(root, file), "bug_report": bug_report}
+                        break
+                else:
+                    print("Warning: No bug report found for", os.path.join(root, file), file=sys.stderr)
+    else:
+        with open(path, "r") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    job = json.loads(line)
+                except ValueError as e:
+                    yield {"id": path+":"+str(number), "error": "Invalid job: "+repr(e)}
+                    continue
+                if not isinstance(job, dict):
+                    yield {"id": path+":"+str(number), "error": "Invalid job: not a JSON object"}
+                    continue
+                yield job
+
+def _run_batch_job(job, options, connection, memory_limit):
+    # Runs in a forked process, which inherits the loaded templates and signature index of the batch process
+    import resource
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit * 1024 * 1024, memory_limit * 1024 * 1024))
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+    connection.send(run_job(job, options))
+    connection.close()
+
+def get_batch_result(job, result):
+    """ Returns the line of a job in the results of a batch: the patched bytecode, the sizes, the timings, the control-flow
+    graph recovery and the errors. """
+    report = result.get("report") or dict()
+    batch_result = {"id": job.get("id"), "hash": job["hash"]}
+    for key in ["error", "exit_code", "execution_time", "patched_bytecode"]:
+        if key in result:
+            batch_result[key] = result[key]
+    for key in ["control_flow_graph_recovery", "control_flow_graph_recovery_time", "original_runtime_size", "patched_runtime_size", "original_deployment_size", "patched_deployment_size"]:
+        if key in report:
+            batch_result[key] = report[key]
+    if "patches" in report:
+        batch_result["patches"] = len(report["patches"])
+    if "skipped_bugs" in report:
+        batch_result["skipped_bugs"] = len(report["skipped_bugs"])
+    if "patch_conflicts" in report:
+        batch_result["patch_conflicts"] = len(report["patch_conflicts"])
+    if "shared_error_handlers" in report:
+        batch_result["shared_error_handlers_bytes_saved"] = sum(error_handler["bytes_saved"] for error_handler in report["shared_error_handlers"])
+    if "outlined_patches" in report:
+        batch_result["outlined_bytes_saved"] = sum(subroutine["bytes_saved"] for subroutine in report["outlined_patches"])
+    if "gas_overhead" in report:
+        batch_result["max_gas_overhead"] = max([function["max_gas_overhead"] for function in report["gas_overhead"]["functions"]] or [0])
+    if "peephole_optimizations" in report:
+        batch_result["peephole_bytes_saved"] = sum(optimization["bytes_saved"] for optimization in report["peephole_optimizations"])
+    return batch_result
+
+def batch():
+    """ Patches the jobs of a directory or of a manifest in parallel processes and writes one JSON line per job, in the
+    order in which the jobs finish. Every job runs in its own process with a time and a memory limit. Jobs are identified
+    by the sha256 hash of their bytecode, bugs and options, the jobs already in the output file are skipped. """
+    parser = argparse.ArgumentParser(prog="elysium.py batch", description="Patch the bytecodes of a directory or of a manifest in parallel.")
+
+    parser.add_argument(
+        "input", type=str, help="Directory with .bin files and their bug reports, or manifest with one job per JSON line")
+
+    parser.add_argument(
+        "-o", "--output", type=str, help="File where the results are appended as JSON lines, jobs already in this file are skipped (default: stdout)")
+
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=multiprocessing.cpu_count(), help="Number of jobs run in parallel (default: number of CPUs)")
+
+    parser.add_argument(
+        "--timeout", type=float, default=BATCH_TIMEOUT, help="Time limit of a job in seconds (default: "+str(BATCH_TIMEOUT)+")")
+
+    parser.add_argument(
+        "--memory-limit", type=int, default=BATCH_MEMORY_LIMIT, help="Memory limit of a job in megabytes, 0 for no limit (default: "+str(BATCH_MEMORY_LIMIT)+")")
+
+    parser.add_argument(
+        "--enable-error-handling-inference", help="Enable error handling inference instead of default error handling based on 'REVERT'.", action="store_true")
+
+    parser.add_argument(
+        "--disable-cfg-cache", help="Always recover control-flow graphs instead of loading them from the cache.", action="store_true")
+
+    parser.add_argument(
+        "--eliminate-redundant-checks", help="Do not patch the overflows and underflows that a value range analysis proves to be impossible.", action="store_true")
+
+    parser.add_argument(
+        "--share-error-handlers", help="Insert every error handling sequence once and jump to it from the patches, instead of inlining it into every patch.", action="store_true")
+
+    parser.add_argument(
+        "--outline-patches", help="Insert identical patches once as shared subroutines and call them, instead of inlining them at every location.", action="store_true")
+
+    parser.add_argument(
+        "--peephole", help="Remove redundant instructions from the patched basic blocks, e.g. double ISZEROs before a JUMPI or identical guards.", action="store_true")
+
+    parser.add_argument(
+        "--gas-fork", type=str, default=GAS_FORK, choices=FORKS, help="Fork of the gas costs of the gas overhead estimate in the report (default: "+GAS_FORK+")")
+    args = parser.parse_args(sys.argv[2:])
+
+    options = {
+        "enable_error_handling_inference": args.enable_error_handling_inference,
+        "cfg_cache_directory": None if args.disable_cfg_cache else CFG_CACHE_DIRECTORY,
+        "eliminate_redundant_checks": args.eliminate_redundant_checks,
+        "share_error_handlers": args.share_error_handlers,
+        "outline_patches": args.outline_patches,
+        "peephole_optimization": args.peephole,
+        "gas_fork": args.gas_fork
+    }
+
+    completed = set()
+    output = sys.stdout
+    if args.output:
+        if os.path.exists(args.output):
+            with open(args.output, "r") as f:
+                for line in f:
+                    try:
+                        completed.add(json.loads(line)["hash"])
+                    except (ValueError, KeyError):
+                        pass
+        output = open(args.output, "a")
+
+    # Loaded once in this process instead of once per job
+    for file in sorted(os.listdir(TEMPLATES_DIRECTORY)):
+        if file.endswith(".json"):
+            get_patch_templates(file[:-len(".json")])
+
+    def write_result(job, result):
+        output.write(json.dumps(get_batch_result(job, result))+"\n")
+        output.flush()
+
+    jobs = get_batch_jobs(args.input)
+    running = dict()
+    skipped = 0
+    while True:
+        while len(running) < max(args.jobs, 1):
+            job = next(jobs, None)
+            if job is None:
+                break
+            if "error" in job:
+                job["hash"] = None
+                write_result(job, {"error": job["error"]})
+                continue
+            try:
+                if job.get("bytecode") is None:
+                    with open(job["bytecode_file"], "r") as f:
+                        job["bytecode"] = f.read()
+                if job.get("bugs") is None:
+                    with open(job["bug_report"], "r") as f:
+                        job["bugs"] = json.load(f)
+                # Results of other options are not reused, the CFG cache does not change the results
+                job_options = dict(options, **job.get("options", dict()))
+                job_options.pop("cfg_cache_directory", None)
+                job_options.pop("cfg_cache_size", None)
+            except Exception as e:
+                job["hash"] = None
+                write_result(job, {"error": repr(e)})
+                continue
+            job["hash"] = hashlib.sha256((job["bytecode"].strip().replace("0x", "")+"\n"+json.dumps(job["bugs"], sort_keys=True)+"\n"+json.dumps(job_options, sort_keys=True)).encode("utf-8")).hexdigest()
+            if job["hash"] in completed:
+                skipped += 1
+                continue
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_run_batch_job, args=(job, options, sender, args.memory_limit))
+            process.start()
+            sender.close()
+            running[receiver] = (process, job, time.time())
+        if not running:
+            break
+        for receiver in multiprocessing.connection.wait(list(running), timeout=1):
+            process, job, _ = running.pop(receiver)
+            try:
+                result = receiver.recv()
+            except EOFError:
+                process.join()
+                result = {"error": "Job process exited with code "+str(process.exitcode)}
+            receiver.close()
+            process.join()
+            write_result(job, result)
+        for receiver in list(running):
+            process, job, start = running[receiver]
+            if time.time() - start > args.timeout:
+                process.kill()
+                process.join()
+                receiver.close()
+                del running[receiver]
+                write_result(job, {"error": "Timeout after "+str(args.timeout)+" second(s)", "execution_time": time.time() - start})
+
+    if skipped:
+        print("Skipped", skipped, "job(s) already in", args.output, file=sys.stderr)
+    if output is not sys.stdout:
+        output.close()
 
 def main():
     global args
@@ -48,6 +807,12 @@ def main():
     parser.add_argument(
         "-d", "--detectors", type=str, help="List of detectors to use. (default: Osiris,Oyente,Mythril)")
 
+    parser.add_argument(
+        "--detector-timeouts", type=str, help="Deadlines of the detectors in seconds, e.g. Osiris:600,Mythril:300 (default: Osiris:1800,Oyente:1800,Mythril:600)")
+
+    parser.add_argument(
+        "--disable-detector-cache", help="Always run the detectors instead of reusing cached results for identical bytecode.", action="store_true")
+
     parser.add_argument(
         "-r", "--bug-report", type=str, help="Bug report with all the bugs to be patched as .json file")
 
@@ -60,13 +825,41 @@ def main():
     parser.add_argument(
         "--enable-error-handling-inference", help="Enable error handling inference instead of default error handling based on 'REVERT'.", action="store_true")
 
+    parser.add_argument(
+        "--eliminate-redundant-checks", help="Do not patch the overflows and underflows that a value range analysis proves to be impossible.", action="store_true")
+
+    parser.add_argument(
+        "--share-error-handlers", help="Insert every error handling sequence once and jump to it from the patches, instead of inlining it into every patch.", action="store_true")
+
+    parser.add_argument(
+        "--outline-patches", help="Insert identical patches once as shared subroutines and call them, instead of inlining them at every location.", action="store_true")
+
+    parser.add_argument(
+        "--peephole", help="Remove redundant instructions from the patched basic blocks, e.g. double ISZEROs before a JUMPI or identical guards.", action="store_true")
+
+    parser.add_argument(
+        "--gas-fork", type=str, default=GAS_FORK, choices=FORKS, help="Fork of the gas costs of the gas overhead estimate in the report (default: "+GAS_FORK+")")
+
+    parser.add_argument(
+        "--outline-min-bytes-saved", type=int, default=OUTLINE_MIN_BYTES_SAVED, help="Minimum number of bytes an outlined patch has to save (default: "+str(OUTLINE_MIN_BYTES_SAVED)+")")
+
     parser.add_argument(
         "--cfg", help="Export control-flow graph to .pdf file.", action="store_true")
 
+    parser.add_argument(
+        "--disable-cfg-cache", help="Always recover control-flow graphs instead of loading them from the cache.", action="store_true")
+
+    parser.add_argument(
+        "--cfg-workers", type=int, help="Recover the control-flow graphs of the functions in parallel in this number of worker processes.")
+
     parser.add_argument(
         "-v", "--version", action="version", version="Elysium 0.0.1 - 'Elysian Fields'")
     args = parser.parse_args()
 
+    cfg_cache_directory = None
+    if not args.disable_cfg_cache:
+        cfg_cache_directory = CFG_CACHE_DIRECTORY
+
     bytecode = None
     deployment_bytecode = None
     deployed_bytecode = None
@@ -78,11 +871,7 @@ def main():
                 print("Error: Bytecode file is empty!")
                 print("Please provide a file with valid bytecode!")
                 sys.exit(-1)
-            if contains_deployment_bytecode(bytecode):
-                deployment_bytecode = extract_deployment_bytecode(bytecode)
-                deployed_bytecode = extract_deployed_bytecode(bytecode)
-            else:
-                deployed_bytecode = bytecode
+            deployment_bytecode, deployed_bytecode = split_bytecode(bytecode)
 
     contract_name = ""
     if args.source_code:
@@ -117,21 +906,23 @@ def main():
 
     if args.address:
         print("Retrieving bytecode from Ethereum mainnet...")
+        from web3 import Web3
+        from eth_utils import to_canonical_address
+        provider = Web3.WebsocketProvider(PROVIDER_URL)
         block_number = None
         address = args.address
         if ":" in address:
             address, block_number = address.split(":")
         if block_number:
-            deployed_bytecode = Web3(PROVIDER).eth.getCode(to_canonical_address(address), int(block_number)).hex().replace("0x", "")
+            deployed_bytecode = Web3(provider).eth.getCode(to_canonical_address(address), int(block_number)).hex().replace("0x", "")
         else:
-            deployed_bytecode = Web3(PROVIDER).eth.getCode(to_canonical_address(address)).hex().replace("0x", "")
+            deployed_bytecode = Web3(provider).eth.getCode(to_canonical_address(address)).hex().replace("0x", "")
         if not deployed_bytecode:
             print("Error: Address does not contain any bytecode!")
             print("Please check that the address is a contract and that it has not been destroyed!")
             sys.exit(-6)
 
     if deployed_bytecode:
-        metadata = extract_metadata(deployed_bytecode)
         runtime_bytecode = remove_metadata(deployed_bytecode)
 
     if args.inference:
@@ -139,7 +930,7 @@ def main():
 
         cfg_build_start = time.time()
         try:
-            cfg = CFG(runtime_bytecode, symbolic_stack_analysis=False)
+            cfg = CFG(runtime_bytecode, symbolic_stack_analysis=False, cache_directory=cfg_cache_directory, cache_size=CFG_CACHE_SIZE, workers=args.cfg_workers)
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -157,7 +948,7 @@ def main():
 
         cfg_build_start = time.time()
         try:
-            cfg = CFG(runtime_bytecode, symbolic_stack_analysis=True)
+            cfg = CFG(runtime_bytecode, symbolic_stack_analysis=True, cache_directory=cfg_cache_directory, cache_size=CFG_CACHE_SIZE, workers=args.cfg_workers)
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -173,7 +964,20 @@ def main():
         cfg_percentage_elysium = (len(cfg.basic_blocks) - dead_basic_blocks) / len(cfg.basic_blocks) * 100
         print("[Elysium] Recovered", str(cfg_percentage_elysium)+"%", "of the control-flow graph in", cfg_build_time_elysium, "second(s). [Elysium]")
 
-        free_storage_location, used_storage_locations = get_free_storage_location(cfg)
+        storage_analysis_start = time.time()
+        storage_accesses = get_storage_accesses(cfg)
+        for function in sorted(storage_accesses, key=lambda x: x.start_addr):
+            storage_reads, storage_writes = set(), set()
+            for instruction, locations in storage_accesses[function]:
+                for slots in get_storage_slots(locations):
+                    if instruction.mnemonic == "SLOAD":
+                        storage_reads.add(slots)
+                    else:
+                        storage_writes.add(slots)
+            if storage_reads or storage_writes:
+                print("Storage slots accessed by function", function.name+":", "reads", sorted(storage_reads), "writes", sorted(storage_writes))
+        free_storage_location, used_storage_locations = get_free_storage_location(cfg, storage_accesses)
+        print("Storage layout inferred in", time.time() - storage_analysis_start, "second(s).")
         print("Used storage locations detected:", used_storage_locations)
         print("Free storage location detected:", free_storage_location)
 
@@ -195,6 +999,27 @@ def main():
 
         sys.exit(0)
 
+    cfg_export = None
+    if args.cfg:
+        if args.bytecode:
+            cfg_export = args.bytecode.rsplit('.', 1)[0]
+        elif args.source_code:
+            cfg_export = args.source_code.replace(".sol", "")
+        elif args.address:
+            cfg_export = args.address
+    patch_options = {
+        "enable_error_handling_inference": args.enable_error_handling_inference,
+        "cfg_cache_directory": cfg_cache_directory,
+        "cfg_workers": args.cfg_workers,
+        "cfg_export": cfg_export,
+        "eliminate_redundant_checks": args.eliminate_redundant_checks,
+        "share_error_handlers": args.share_error_handlers,
+        "outline_patches": args.outline_patches,
+        "outline_min_bytes_saved": args.outline_min_bytes_saved,
+        "peephole_optimization": args.peephole,
+        "gas_fork": args.gas_fork
+    }
+
     detectors = "Osiris,Oyente,Mythril"
     if args.detectors:
         detectors = args.detectors
@@ -210,590 +1035,74 @@ def main():
             detected_bugs = sorted(detected_bugs, key=lambda bug: bug["pc"])
     else:
         print("Please wait. Scanning bytecode for bugs...")
+        # The detector back ends (docker) are only loaded when the detectors are run
+        from detectors.cache import DetectorCache
+        from detectors.orchestrator import DETECTORS, run_detectors
         for detector in detectors.split(","):
-            if detector.lower() == "osiris":
-                detected_bugs += run_osiris_bytecode_analyzer(runtime_bytecode)
-            elif detector.lower() == "oyente":
-                detected_bugs += run_oyente_bytecode_analyzer(runtime_bytecode)
-            elif detector.lower() == "mythril":
-                detected_bugs += run_mythril_bytecode_analyzer(runtime_bytecode)
-            else:
+            if not detector.lower() in DETECTORS:
                 print("Error: Detector not supported:", detector)
                 sys.exit(-4)
-        detected_bugs = sorted(detected_bugs, key=lambda bug: bug["pc"])
+        detector_timeouts = dict(DETECTOR_TIMEOUTS)
+        if args.detector_timeouts:
+            for detector_timeout in args.detector_timeouts.split(","):
+                detector, timeout = detector_timeout.split(":")
+                detector_timeouts[detector.lower()] = float(timeout)
         if args.bug_report:
-            with open(args.bug_report, "w") as json_file:
-                json.dump(detected_bugs, json_file, indent=4)
+            bug_report = args.bug_report
+        elif args.bytecode:
+            _, file_extension = os.path.splitext(args.bytecode)
+            bug_report = args.bytecode.replace(file_extension, ".bugs.json")
+        elif args.source_code:
+            bug_report = args.source_code.replace(".sol", ".bugs.json")
         else:
-            if args.bytecode:
-                _, file_extension = os.path.splitext(args.bytecode)
-                with open(args.bytecode.replace(file_extension, ".bugs.json"), "w") as json_file:
-                    json.dump(detected_bugs, json_file, indent=4)
-            elif args.source_code:
-                with open(args.source_code.replace(".sol", ".bugs.json"), "w") as json_file:
-                    json.dump(detected_bugs, json_file, indent=4)
-            elif args.address:
-                with open(args.address+".bugs.json", "w") as json_file:
-                    json.dump(detected_bugs, json_file, indent=4)
-
-    report = dict()
-    report["patches"] = list()
+            bug_report = args.address+".bugs.json"
+        detector_cache = None
+        if not args.disable_detector_cache:
+            detector_cache = DetectorCache(DETECTOR_CACHE_DIRECTORY, DETECTOR_CACHE_SIZE)
+        # Detectors run concurrently, the bug report and the patched bytecode are updated as soon as a detector finishes
+        detector_bugs = dict()
+        for detector, bugs in run_detectors(runtime_bytecode, detectors.split(","), detector_timeouts, detector_cache):
+            detector_bugs[detector] = bugs
+            detected_bugs = list()
+            for detector in detectors.split(","):
+                detected_bugs += detector_bugs.get(detector, list())
+            detected_bugs = sorted(detected_bugs, key=lambda bug: bug["pc"])
+            with open(bug_report, "w") as json_file:
+                json.dump(detected_bugs, json_file, indent=4)
+            if len(detector_bugs) < len(detectors.split(",")) and detected_bugs:
+                # The bytecode is patched from the original bytecode with all the bugs detected so far, the
+                # patched bytecode of the last detector is written below
+                print("Patching the bugs of", ", ".join(sorted(detector_bugs))+"...")
+                interim_start = time.time()
+                try:
+                    patched_bytecode, report, _ = patch(deployed_bytecode, deployment_bytecode, detected_bugs, dict(patch_options, cfg_export=None))
+                except PatchError as e:
+                    print("Warning: Bugs of", ", ".join(sorted(detector_bugs)), "could not be patched:", e)
+                    continue
+                # Only interim reports list the detectors whose bugs are patched
+                report["detectors"] = sorted(detector_bugs)
+                write_patched_bytecode_to_file(args, patched_bytecode)
+                write_report_to_file(args, interim_start, report)
 
     execution_start = time.time()
-    if len(detected_bugs) > 0:
-        print("Detected", len(detected_bugs), "bug(s):")
-        for bug in detected_bugs:
-            if bug["type"] == "overflow" or bug["type"] == "underflow":
-                print("--> Detected", "'"+bug["type"]+"'", "("+bug["opcode"]+")", "bug at program counter address", bug["pc"], "("+hex(bug["pc"])+")", "using", bug["tool"], "with a code coverage of", str(bug["code_coverage"])+"%.")
-            else:
-                print("--> Detected", "'"+bug["type"]+"'", "bug at program counter address", bug["pc"], "("+hex(bug["pc"])+")", "using", bug["tool"], "with a code coverage of", str(bug["code_coverage"])+"%.")
-
-        # Export control-flow graph
-        if args.cfg:
-            print("Exporting original control-flow graph...")
-            if args.bytecode:
-                if deployment_bytecode:
-                    export_cfg(CFG(deployment_bytecode), args.bytecode.rsplit('.', 1)[0]+".constructor.original", "pdf")
-                export_cfg(CFG(runtime_bytecode), args.bytecode.rsplit('.', 1)[0]+".original", "pdf")
-            elif args.source_code:
-                export_cfg(CFG(deployment_bytecode), args.source_code.replace(".sol", ".constructor.original"), "pdf")
-                export_cfg(CFG(runtime_bytecode), args.source_code.replace(".sol", ".original"), "pdf")
-            elif args.address:
-                export_cfg(CFG(runtime_bytecode), args.address+".original", "pdf")
-
-        try:
-            print("Recovering control-flow graph...")
-            t = time.time()
-            cfg = CFG(runtime_bytecode)
-            report["control_flow_graph_recovery_time"] = time.time() - t
-            dead_basic_blocks = 0
-            for basic_block in cfg.basic_blocks:
-                if len(basic_block.all_incoming_basic_blocks) == 0 and len(basic_block.all_outgoing_basic_blocks) == 0:
-                    if not (len(basic_block.instructions) == 1 and basic_block.instructions[0].mnemonic in ["STOP", "INVALID"]):
-                        dead_basic_blocks += 1
-            print("Recovered", str(round((len(cfg.basic_blocks) - dead_basic_blocks) / len(cfg.basic_blocks) * 100))+"%", "of the control-flow graph")
-            report["control_flow_graph_recovery"] = str(round((len(cfg.basic_blocks) - dead_basic_blocks) / len(cfg.basic_blocks) * 100))+"%"
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            print(repr(e))
-            print("Error: Control-flow graph could not be recovered!")
-            report["control_flow_graph_recovery"] = repr(e)
-            write_report_to_file(args, execution_start, report)
-            sys.exit(-7)
-
-        # Create a copy of the original mappings
-        for basic_block in cfg.basic_blocks:
-            for instruction in basic_block.instructions:
-                instruction.pc = instruction.pc, instruction.pc
+    try:
+        patched_bytecode, report, _ = patch(deployed_bytecode, deployment_bytecode, detected_bugs, patch_options)
+    except PatchError as e:
+        print("Error:", e)
+        if e.report is not None:
+            write_report_to_file(args, execution_start, e.report)
+        sys.exit(e.exit_code)
 
-        if deployment_bytecode:
-            constructor_cfg = CFG(deployment_bytecode)
-            for basic_block in constructor_cfg.basic_blocks:
-                for instruction in basic_block.instructions:
-                    instruction.pc = instruction.pc, instruction.pc
-            all_codecopy_instructions = get_all_codecopy_instructions(constructor_cfg.entry_point, codecopy_instructions=list())
-            if len(all_codecopy_instructions) == 0:
-                print("Error: Deployment bytecode is not valid! No CODECOPY instruction found inside deployment bytecode!")
-                sys.exit(-3)
-            codecopy_pc = all_codecopy_instructions[-1].pc[1]
-            codecopy_delete_sequence = ""
-            codecopy_basic_block = get_basic_block(constructor_cfg, codecopy_pc)
-            for i in range(len(codecopy_basic_block.instructions)):
-                if codecopy_basic_block.instructions[i].mnemonic == "CODECOPY":
-                    codecopy_delete_sequence = " ".join([str(instruction).replace(" ", "_") for instruction in codecopy_basic_block.instructions[i-4:i+1]])
-                    break
-
-        free_storage_location, _ = get_free_storage_location(cfg)
-
-        for bug in detected_bugs:
-            # TODO: Future work: Add signedness patch for multiplication
-            # TODO: Future work: Combine identical patches into one basicblock and simply jump to that basic block from different locations e.g. trampoline (optimization)
-            if bug["type"] == "overflow":
-                # Find basic block with the bug
-                buggy_basic_block = get_basic_block(cfg, bug["pc"])
-
-                # Identify error handling strategy
-                error_handling_sequence = get_error_handling_sequence(buggy_basic_block, args.enable_error_handling_inference)
-
-                # Find integer bounds
-                integer_size = None
-                backtrace = get_backtrace(buggy_basic_block, list(), list(), bug["pc"])
-
-                taint_analysis = TaintRunner()
-                signextend_mappings = dict()
-                unsigned = True
-                for instruction in backtrace:
-                    if instruction.mnemonic.startswith("PUSH"):
-                        taint_analysis.introduce_taint(instruction, instruction)
-                    # Unsigned
-                    elif instruction.mnemonic == "AND":
-                        taint_analysis.introduce_taint(instruction, instruction)
-                    # Signed
-                    elif instruction.mnemonic == "SIGNEXTEND":
-                        tainted_values, stack_values = taint_analysis.check_taint(instruction)
-                        signextend_mappings[instruction.pc[1]] = [value for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic.startswith("PUSH")][0]
-                        signextends = [value for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic == "SIGNEXTEND"]
-                        if len(signextends) > 0:
-                            taint_analysis.introduce_taint(signextends[0], instruction)
-                        else:
-                            taint_analysis.introduce_taint(instruction, instruction)
-                    elif instruction.pc[1] == bug["pc"]:
-                        tainted_values, stack_values = taint_analysis.check_taint(instruction)
-                        if any([True for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic == "SIGNEXTEND"]):
-                            integer_sizes = [8 * (signextend_mappings[value.pc[1]].operand + 1) for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic == "SIGNEXTEND"]
-                            if integer_sizes:
-                                integer_size = max(integer_sizes)
-                                unsigned = False
-                        elif any([True for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic.startswith("PUSH")]) and any([True for value in tainted_values if isinstance(value, pyevmasm.evmasm.Instruction) and value.mnemonic == "AND"]) :
-                            # Check that integer size is a valid multiple of 8
-                            try:
-                                if stack_values and (max(stack_values) + 1) % 8 == 0:
-                                    integer_size = max(stack_values)
-                                    unsigned = True
-                            except:
-                                pass
-                    else:
-                        taint_analysis.propagate_taint(instruction)
-
-                # Generate and apply patch
-                if bug["opcode"] == "ADD":
-                    if unsigned:
-                        integer_bounds = ""
-                        if integer_size:
-                            push_width = get_push_width(integer_size)
-                            integer_bounds = "PUSH"+str(push_width)+"_"+hex(integer_size)
-                        else:
-                            integer_bounds = "PUSH"+str(get_push_width(2**256-1))+"_"+hex(2**256-1)
-                        report["patches"].append({"bug_type": "integer_overflow", "pc": bug["pc"], "patch": list()})
-                        with open(os.path.dirname(os.path.realpath(__file__))+"/templates/unsigned_integer_overflow_addition_patch.json", "r") as f:
-                            lines = filter(None, (line.rstrip() for line in f))
-                            for patch in lines:
-                                patch = patch.replace("integer_bounds", integer_bounds)
-                                patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                                patch = json.loads(patch)
-                                cfg = inject_patch_at_address(cfg, patch, bug["pc"])
-                                report["patches"][-1]["patch"].append(patch)
-                    else:
-                        integer_bounds = "PUSH"+str(get_push_width(int(integer_size / 8 - 1)))+"_"+hex(int(integer_size / 8 - 1))+" SIGNEXTEND"
-                        int_max = 2 ** (integer_size - 1) - 1
-                        push_int_max = "PUSH"+str(get_push_width(int_max))+"_"+hex(int_max)
-                        push_int_min = push_int_max+" NOT"
-                        report["patches"].append({"bug_type": "integer_overflow", "pc": bug["pc"], "patch": list()})
-                        with open(os.path.dirname(os.path.realpath(__file__))+"/templates/unsigned_integer_overflow_addition_patch.json", "r") as f:
-                            lines = filter(None, (line.rstrip() for line in f))
-                            for patch in lines:
-                                patch = patch.replace("integer_bounds", integer_bounds)
-                                patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                                patch = patch.replace("push_int_max", push_int_max)
-                                patch = patch.replace("push_int_min", push_int_min)
-                                patch = json.loads(patch)
-                                cfg = inject_patch_at_address(cfg, patch, bug["pc"])
-                                report["patches"][-1]["patch"].append(patch)
-
-                elif bug["opcode"] == "MUL":
-                    if unsigned:
-                        if integer_size:
-                            push_width = get_push_width(integer_size)
-                            integer_bounds = "PUSH"+str(push_width)+"_"+hex(integer_size)
-                            report["patches"].append({"bug_type": "integer_overflow", "pc": bug["pc"], "patch": list()})
-                            with open(os.path.dirname(os.path.realpath(__file__))+"/templates/unsigned_integer_overflow_multiplication_patch.json", "r") as f:
-                                lines = filter(None, (line.rstrip() for line in f))
-                                for patch in lines:
-                                    patch = patch.replace("integer_bounds", integer_bounds)
-                                    patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                                    patch = json.loads(patch)
-                                    cfg = inject_patch_at_address(cfg, patch, bug["pc"])
-                                    report["patches"][-1]["patch"].append(patch)
-                        else:
-                            report["patches"].append({"bug_type": "integer_overflow", "pc": bug["pc"], "patch": list()})
-                            with open(os.path.dirname(os.path.realpath(__file__))+"/templates/unsigned_integer_overflow_multiplication_256_bit_patch.json", "r") as f:
-                                lines = filter(None, (line.rstrip() for line in f))
-                                for patch in lines:
-                                    patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                                    patch = json.loads(patch)
-                                    cfg = inject_patch_at_address(cfg, patch, bug["pc"])
-                                    report["patches"][-1]["patch"].append(patch)
-                    else:
-                        # TODO: Future work: Add patch for signed multiplication
-                        print("Error: Patch for signed multiplcation is missing!")
-
-            elif bug["type"] == "underflow":
-                # Find basic block with the bug
-                buggy_basic_block = get_basic_block(cfg, bug["pc"])
-
-                # Identify error handling strategy
-                error_handling_sequence = get_error_handling_sequence(buggy_basic_block, args.enable_error_handling_inference)
-
-                # Generate and apply patch
-                report["patches"].append({"bug_type": "integer_undeflow", "pc": bug["pc"], "patch": list()})
-                with open(os.path.dirname(os.path.realpath(__file__))+"/templates/integer_underflow_patch.json", "r") as f:
-                    lines = filter(None, (line.rstrip() for line in f))
-                    for patch in lines:
-                        patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                        patch = json.loads(patch)
-                        cfg = inject_patch_at_address(cfg, patch, bug["pc"])
-                        report["patches"][-1]["patch"].append(patch)
-
-            elif bug["type"] == "reentrancy":
-                # Find basic block with the bug
-                buggy_basic_block = get_basic_block(cfg, bug["pc"])
-
-                # Find free storage location
-                storage_location_sequence, free_storage_location = get_free_storage_location_sequence(free_storage_location)
-
-                # Identify error handling strategy
-                error_handling_sequence = get_error_handling_sequence(buggy_basic_block, args.enable_error_handling_inference)
-
-                # Identify reentrancy origin function and function storage write locations
-                reentrany_origin_function = None
-                function_storage_write_locations = dict()
-                for function in cfg.functions:
-                    if not function.name in ["_fallback", "_dispatcher"]:
-                        entry_point = None
-                        for basic_block in function.basic_blocks:
-                            if len(basic_block.incoming_basic_blocks(function.key)) == 0:
-                                entry_point = basic_block
-                            for instruction in basic_block.instructions:
-                                if instruction.pc[1] == bug["pc"]:
-                                    reentrany_origin_function = function.name
-                        function_storage_write_locations[function.name] = list()
-                        if entry_point:
-                            all_execution_paths = get_all_execution_paths(entry_point, execution_paths=list(), current_execution_path=list())
-                            for execution_path in all_execution_paths:
-                                taint_analysis = TaintRunner()
-                                for instruction in execution_path:
-                                    if instruction.mnemonic.startswith("PUSH"):
-                                        taint_analysis.introduce_taint(instruction, instruction)
-                                    elif instruction.mnemonic == "SSTORE":
-                                        storage_location = None
-                                        tainted_values, _ = taint_analysis.check_taint(instruction)
-                                        for tainted_value in tainted_values:
-                                            if isinstance(tainted_value, pyevmasm.evmasm.Instruction) and tainted_value.pc[1] != 0:
-                                                if not storage_location or tainted_value.operand < storage_location[0].operand:
-                                                    storage_location = tainted_value, instruction
-                                        if storage_location and not storage_location in function_storage_write_locations[function.name]:
-                                            function_storage_write_locations[function.name].append(storage_location)
-                                    else:
-                                        taint_analysis.propagate_taint(instruction)
-
-                patches_to_be_applied = dict()
-
-                # Generate patches for cross function reentrany locations
-                cross_function_reentrancy_locations = dict()
-                if reentrany_origin_function:
-                    reentrany_origin_function_storage_locations = [storage_location[0].operand for storage_location in function_storage_write_locations[reentrany_origin_function]]
-                    for function in function_storage_write_locations:
-                        if function != reentrany_origin_function:
-                            for storage_location in function_storage_write_locations[function]:
-                                if storage_location[0].operand in reentrany_origin_function_storage_locations:
-                                    address = storage_location[1].pc[1]
-                                    if not function in cross_function_reentrancy_locations:
-                                        cross_function_reentrancy_locations[function] = list()
-                                    cross_function_reentrancy_locations[function].append(address)
-
-                for function in cross_function_reentrancy_locations:
-                    max_pc = max(cross_function_reentrancy_locations[function])
-                    min_pc = min(cross_function_reentrancy_locations[function])
-                    with open(os.path.dirname(os.path.realpath(__file__))+"/templates/reentrancy_patch.json", "r") as f:
-                        lines = filter(None, (line.rstrip() for line in f))
-                        for patch in lines:
-                            patch = patch.replace("free_storage_location", storage_location_sequence)
-                            patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                            patch = json.loads(patch)
-                            if patch["insert_mode"] == "after":
-                                address = max_pc
-                            else:
-                                address = min_pc
-                            if not address in patches_to_be_applied:
-                                patches_to_be_applied[address] = list()
-                            if not patch in patches_to_be_applied[address]:
-                                patches_to_be_applied[address].append(patch)
-
-                # Generate patch for reentrany origin
-                with open(os.path.dirname(os.path.realpath(__file__))+"/templates/reentrancy_patch.json", "r") as f:
-                    lines = filter(None, (line.rstrip() for line in f))
-                    for patch in lines:
-                        patch = patch.replace("free_storage_location", storage_location_sequence)
-                        patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                        patch = json.loads(patch)
-                        if not bug["pc"] in patches_to_be_applied:
-                            patches_to_be_applied[bug["pc"]] = list()
-                        patches_to_be_applied[bug["pc"]].append(patch)
-
-                # Apply generated patches
-                for address in sorted(patches_to_be_applied.keys()):
-                    report["patches"].append({"bug_type": "reentrancy", "pc": address, "patch": list()})
-                    for patch in patches_to_be_applied[address]:
-                        cfg = inject_patch_at_address(cfg, patch, address)
-                        report["patches"][-1]["patch"].append(patch)
-
-            elif bug["type"] == "unhandled exception":
-                # Find basic block with the bug
-                buggy_basic_block = get_basic_block(cfg, bug["pc"])
-
-                # Identify error handling strategy
-                error_handling_sequence = get_error_handling_sequence(buggy_basic_block, args.enable_error_handling_inference)
-
-                # Generate and apply patch
-                report["patches"].append({"bug_type": "unhandled_exception", "pc": bug["pc"], "patch": list()})
-                with open(os.path.dirname(os.path.realpath(__file__))+"/templates/unhandled_exception_patch.json", "r") as f:
-                    lines = filter(None, (line.rstrip() for line in f))
-                    for patch in lines:
-                        patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                        patch = json.loads(patch)
-                        cfg = inject_patch_at_address(cfg, patch, bug["pc"])
-                        report["patches"][-1]["patch"].append(patch)
-
-            # TODO: Future work: Implement case 2
-            elif bug["type"] == "leaking ether" or bug["type"] == "suicidal" or bug["type"] == "unsafe delegatecall":
-                # Possible cases:
-                # 1. Access control check is completely missing.
-                # 2. Access control check is defined and used somewhere, but not in this function.
-                # 3. Access control check is defined and used for this function, but access can be set by everyone.
-
-                # Find basic block with the bug
-                buggy_basic_block = get_basic_block(cfg, bug["pc"])
-
-                # Identify error handling strategy
-                error_handling_sequence = get_error_handling_sequence(buggy_basic_block, args.enable_error_handling_inference)
-
-                # Find free storage location
-                storage_location_sequence, free_storage_location = get_free_storage_location_sequence(free_storage_location)
-
-                # Check if buggy function contains an access control check
-                backtrace = get_backtrace(buggy_basic_block, list(), list(), bug["pc"])
-                push_storage_location, push_address_mask, caller, sload = get_access_control_information(backtrace, TaintRunner())
-                # If buggy function contains an access control check, then search for locations that are unprotected and access can be granted
-                if push_storage_location and push_address_mask and caller and sload:
-                    all_execution_paths = get_all_execution_paths(cfg.entry_point, execution_paths=list(), current_execution_path=list())
-                    unprotected_writes_to_storage = list()
-                    for execution_path in all_execution_paths:
-                        taint_analysis = TaintRunner()
-                        for instruction in execution_path:
-                            if instruction.mnemonic.startswith("PUSH"):
-                                taint_analysis.introduce_taint(instruction, instruction)
-                            elif instruction.mnemonic == "SSTORE":
-                                tainted_values, _ = taint_analysis.check_taint(instruction)
-                                storage_location = min([tainted_value.operand for tainted_value in tainted_values])
-                                if storage_location == push_storage_location.operand:
-                                    access_control_information = get_access_control_information(get_backtrace(get_basic_block(cfg, instruction.pc[1]), list(), list(), instruction.pc[1]), TaintRunner())
-                                    if not (access_control_information[0] and access_control_information[1] and access_control_information[2] and access_control_information[3]):
-                                        unprotected_writes_to_storage.append(instruction.pc[1])
-                            else:
-                                taint_analysis.propagate_taint(instruction)
-                    # Generate and apply patch
-                    if len(unprotected_writes_to_storage) > 0:
-                        if deployment_bytecode:
-                            report["patches"].append({"bug_type": bug["type"].replace(" ", "_"), "pc": codecopy_pc, "patch": list()})
-                            with open(os.path.dirname(os.path.realpath(__file__))+"/templates/access_control_patch.json", "r") as f:
-                                lines = filter(None, (line.rstrip() for line in f))
-                                for patch in lines:
-                                    patch = patch.replace("free_storage_location", storage_location_sequence)
-                                    patch = json.loads(patch)
-                                    if patch["constructor"] == True:
-                                        constructor_cfg = inject_patch_at_address(constructor_cfg, patch, codecopy_pc)
-                                        report["patches"][-1]["patch"].append(patch)
-                    for pc in unprotected_writes_to_storage:
-                        report["patches"].append({"bug_type": bug["type"].replace(" ", "_"), "pc": pc, "patch": list()})
-                        with open(os.path.dirname(os.path.realpath(__file__))+"/templates/access_control_patch.json", "r") as f:
-                            lines = filter(None, (line.rstrip() for line in f))
-                            for patch in lines:
-                                patch = patch.replace("free_storage_location", storage_location_sequence)
-                                patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                                patch = json.loads(patch)
-                                if patch["constructor"] == False:
-                                    cfg = inject_patch_at_address(cfg, patch, pc)
-                                    report["patches"][-1]["patch"].append(patch)
-                else:
-                    # Generate and apply patch
-                    if deployment_bytecode:
-                        report["patches"].append({"bug_type": bug["type"].replace(" ", "_"), "pc": codecopy_pc, "patch": list()})
-                        with open(os.path.dirname(os.path.realpath(__file__))+"/templates/access_control_patch.json", "r") as f:
-                            lines = filter(None, (line.rstrip() for line in f))
-                            for patch in lines:
-                                patch = patch.replace("free_storage_location", storage_location_sequence)
-                                patch = json.loads(patch)
-                                if patch["constructor"] == True:
-                                    constructor_cfg = inject_patch_at_address(constructor_cfg, patch, codecopy_pc)
-                                    report["patches"][-1]["patch"].append(patch)
-                    report["patches"].append({"bug_type": bug["type"].replace(" ", "_"), "pc": bug["pc"], "patch": list()})
-                    with open(os.path.dirname(os.path.realpath(__file__))+"/templates/access_control_patch.json", "r") as f:
-                        lines = filter(None, (line.rstrip() for line in f))
-                        for patch in lines:
-                            patch = patch.replace("free_storage_location", storage_location_sequence)
-                            patch = patch.replace("error_handling_sequence", error_handling_sequence)
-                            patch = json.loads(patch)
-                            if patch["constructor"] == False:
-                                cfg = inject_patch_at_address(cfg, patch, bug["pc"])
-                                report["patches"][-1]["patch"].append(patch)
-
-            elif bug["type"] == "transaction origin":
-                report["patches"].append({"bug_type": "transaction_origin", "pc": bug["pc"], "patch": list()})
-                with open(os.path.dirname(os.path.realpath(__file__))+"/templates/transaction_origin_patch.json", "r") as f:
-                    lines = filter(None, (line.rstrip() for line in f))
-                    for patch in lines:
-                        patch = json.loads(patch)
-                        cfg = inject_patch_at_address(cfg, patch, bug["pc"])
-                        report["patches"][-1]["patch"].append(patch)
-
-            else:
-                print("Bug type '"+bug["type"]+"' is not supported!")
-
-        # Recompute jump locations
-        jump_destinations = dict()
-        conflicting_jumps = list()
-        for basic_block in sorted(cfg.basic_blocks, key=lambda x: x.start.pc, reverse=False):
-            for i in range(len(basic_block.instructions)):
-                if basic_block.instructions[i].mnemonic == "JUMPDEST":
-                    if isinstance(basic_block.instructions[i].pc, tuple):
-                        if basic_block.instructions[i].pc[1] != 0:
-                            if hex(basic_block.instructions[i].pc[1]) in jump_destinations:
-                                conflicting_jumps.append(hex(basic_block.instructions[i].pc[1]))
-                            jump_destinations[hex(basic_block.instructions[i].pc[1])] = hex(basic_block.instructions[i].pc[0])
-                        else:
-                            if hex(basic_block.instructions[i].pc[0]) in jump_destinations:
-                                conflicting_jumps.append(hex(basic_block.instructions[i].pc[0]))
-                            jump_destinations[hex(basic_block.instructions[i].pc[0])] = hex(basic_block.instructions[i].pc[0])
-        if jump_destinations:
-            for basic_block in sorted(cfg.basic_blocks, key=lambda x: x.start.pc, reverse=False):
-                for i in range(len(basic_block.instructions)):
-                    if basic_block._instructions[i].mnemonic.startswith("PUSH"):
-                        if hex(basic_block._instructions[i].operand) in jump_destinations:
-                            original_push_width = basic_block._instructions[i].operand_size
-                            push_width = get_push_width(int(jump_destinations[hex(basic_block._instructions[i].operand)], 16))
-                            if original_push_width < push_width:
-                                for destination in sorted(jump_destinations):
-                                    if int(jump_destinations[destination], 16) > basic_block._instructions[i].pc[0]:
-                                        jump_destinations[destination] = hex(int(jump_destinations[destination], 16) + push_width - original_push_width)
-            for basic_block in cfg.basic_blocks:
-                for i in range(len(basic_block.instructions)):
-                    if basic_block._instructions[i].mnemonic.startswith("PUSH"):
-                        if hex(basic_block._instructions[i].operand) in jump_destinations and hex(basic_block._instructions[i].operand) != jump_destinations[hex(basic_block._instructions[i].operand)]:
-                            if hex(basic_block._instructions[i].operand) in conflicting_jumps and basic_block._instructions[i].pc[1] == 0:
-                                continue
-                            push_width = get_push_width(int(jump_destinations[hex(basic_block._instructions[i].operand)], 16))
-                            original_push_width = basic_block._instructions[i].operand_size
-                            original_pc = basic_block._instructions[i].pc
-                            if original_push_width > push_width:
-                                push_width = original_push_width
-                            basic_block._instructions[i] = assemble_one("PUSH" + str(push_width) + " " + jump_destinations[hex(basic_block._instructions[i].operand)])
-                            basic_block._instructions[i].pc = original_pc
-
-        # Remove copy of the original mapping
-        for basic_block in cfg.basic_blocks:
-            for instruction in basic_block.instructions:
-                instruction.pc = instruction.pc[0]
-
-        # Align basic blocks to runtime bytecode
-        patched_runtime_bytecode = ""
-        sorted_basic_blocks = sorted(cfg.basic_blocks, key=lambda x: x.start.pc, reverse=False)
-        for basic_block in sorted_basic_blocks:
-            for instruction in basic_block.instructions:
-                patched_runtime_bytecode += instruction.bytes.hex()
-
-        if deployment_bytecode:
-            # Align basic blocks to deployment bytecode
-            patched_deployment_bytecode = ""
-            sorted_basic_blocks = sorted(constructor_cfg.basic_blocks, key=lambda x: x.start.pc, reverse=False)
-            for basic_block in sorted_basic_blocks:
-                for instruction in basic_block.instructions:
-                    patched_deployment_bytecode += instruction.bytes.hex()
-
-            # Recompute codecopy location in constructor
-            codecopy_insert_sequence = ""
-            push_width = len(hex(int(len(patched_runtime_bytecode + metadata) / 2)).replace("0x", ""))
-            if push_width % 2 != 0:
-                push_width += 1
-            push_width = int(push_width / 2)
-            codecopy_insert_sequence += "PUSH" + str(push_width) + "_" + hex(int(len(patched_runtime_bytecode + metadata) / 2))
-            codecopy_insert_sequence += " DUP1 "
-            push_width = len(hex(int(len(patched_deployment_bytecode) / 2)).replace("0x", ""))
-            if push_width % 2 != 0:
-                push_width += 1
-            push_width = int(push_width / 2)
-            codecopy_insert_sequence += "PUSH" + str(push_width) + "_" + hex(int(len(patched_deployment_bytecode) / 2))
-            codecopy_insert_sequence += " PUSH1_0x0 CODECOPY"
-            print("Deployment bytecode size:", int(len(patched_deployment_bytecode) / 2), "bytes (original: "+str(int(len(deployment_bytecode) / 2))+" bytes)", str((float(len(patched_deployment_bytecode) / 2) - float(len(deployment_bytecode) / 2)) / (float(len(deployment_bytecode) / 2) / 100))+"% increase.")
-            report["original_deployment_size"] = str(int(len(deployment_bytecode) / 2))+" bytes"
-            report["patched_deployment_size"] = str(int(len(patched_deployment_bytecode) / 2))+" bytes"
-            constructor_cfg = inject_patch_at_address(constructor_cfg, {"delete": codecopy_delete_sequence, "insert": codecopy_insert_sequence, "insert_mode": "before", "constructor": True}, codecopy_pc)
-
-            # Remove copy of the original mapping
-            for basic_block in constructor_cfg.basic_blocks:
-                for instruction in basic_block.instructions:
-                    instruction.pc = instruction.pc[0]
-
-            # Align basic blocks to bytecode
-            patched_deployment_bytecode = ""
-            sorted_basic_blocks = sorted(constructor_cfg.basic_blocks, key=lambda x: x.start.pc, reverse=False)
-            for basic_block in sorted_basic_blocks:
-                for instruction in basic_block.instructions:
-                    patched_deployment_bytecode += instruction.bytes.hex()
-
-        print("Runtime bytecode size:", int(len(patched_runtime_bytecode) / 2), "bytes (original: "+str(int(len(runtime_bytecode) / 2))+" bytes)", str((float(len(patched_runtime_bytecode) / 2) - float(len(runtime_bytecode) / 2)) / (float(len(runtime_bytecode) / 2) / 100))+"% increase.")
-        report["original_runtime_size"] = str(int(len(runtime_bytecode) / 2))+" bytes"
-        report["patched_runtime_size"] = str(int(len(patched_runtime_bytecode) / 2))+" bytes"
-
-        if metadata:
-            print("Metadata:", "0x"+metadata)
-
-        # Assemble patched deployment bytecode, patched runtime bytecode, and metadata
-        if deployment_bytecode:
-            patched_bytecode = patched_deployment_bytecode + patched_runtime_bytecode + metadata
-        else:
-            patched_bytecode = patched_runtime_bytecode + metadata
-
-        # Write patched bytecode to file
-        if args.output:
-            with open(args.output, "w") as file:
-                file.write(patched_bytecode)
-        else:
-            if args.bytecode:
-                filename, file_extension = os.path.splitext(args.bytecode)
-                with open(filename + ".patched" + file_extension, "w") as file:
-                    file.write(patched_bytecode)
-            elif args.source_code:
-                with open(args.source_code.replace(".sol", ".patched.bin"), "w") as file:
-                    file.write(patched_bytecode)
-            elif args.address:
-                with open(args.address + ".patched.bin", "w") as file:
-                    file.write(patched_bytecode)
-
-        # Export control-flow graph
-        if args.cfg:
-            print("Exporting patched control-flow graph...")
-            if args.bytecode:
-                if deployment_bytecode:
-                    export_cfg(CFG(patched_deployment_bytecode), args.bytecode.rsplit('.', 1)[0]+".constructor.patched", "pdf")
-                export_cfg(CFG(patched_runtime_bytecode), args.bytecode.rsplit('.', 1)[0]+".patched", "pdf")
-            elif args.source_code:
-                export_cfg(CFG(patched_deployment_bytecode), args.source_code.replace(".sol", ".constructor.patched"), "pdf")
-                export_cfg(CFG(patched_runtime_bytecode), args.source_code.replace(".sol", ".patched"), "pdf")
-            elif args.address:
-                export_cfg(CFG(patched_runtime_bytecode), args.address+".patched", "pdf")
-
-    else:
-        print("No bugs detected! There is nothing to be patched!")
-
-        # Write bytecode to file
-        if args.output:
-            with open(args.output, "w") as file:
-                file.write(deployed_bytecode)
-        else:
-            if args.bytecode:
-                filename, file_extension = os.path.splitext(args.bytecode)
-                with open(filename + ".patched" + file_extension, "w") as file:
-                    file.write(deployed_bytecode)
-            elif args.source_code:
-                with open(args.source_code.replace(".sol", ".patched.bin"), "w") as file:
-                    file.write(deployed_bytecode)
-            elif args.address:
-                with open(args.address + ".patched.bin", "w") as file:
-                    file.write(deployed_bytecode)
+    # Write patched bytecode to file
+    write_patched_bytecode_to_file(args, patched_bytecode)
 
     # Write report to file
     write_report_to_file(args, execution_start, report)
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        worker()
+    elif len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch()
+    else:
+        main()
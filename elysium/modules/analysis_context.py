@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+
+sys.path.insert(0, '..')
+
+from utils.utils import *
+
+from .taint_analysis import TaintRunner
+from .range_analysis import get_value_ranges
+from .storage_inference import get_storage_accesses, get_storage_slots
+
+class AnalysisContext(object):
+    """ Contract-level analysis summaries shared by all patch generators of a run.
+    Every summary is computed lazily on first use and then served from the cache,
+    hits and misses are counted per summary and can be written to the report. """
+
+    def __init__(self, cfg, enable_error_handling_inference=False):
+        self.cfg = cfg
+        self.enable_error_handling_inference = enable_error_handling_inference
+        self.cache = dict()
+        self.statistics = dict()
+
+    def _lookup(self, summary, key, compute):
+        if not summary in self.cache:
+            self.cache[summary] = dict()
+            self.statistics[summary] = {"hits": 0, "misses": 0}
+        if key in self.cache[summary]:
+            self.statistics[summary]["hits"] += 1
+        else:
+            self.statistics[summary]["misses"] += 1
+            self.cache[summary][key] = compute()
+        return self.cache[summary][key]
+
+    def get_storage_accesses(self):
+        """ Storage accesses of every function (see storage_inference.get_storage_accesses). """
+        return self._lookup("storage_accesses", None, lambda: get_storage_accesses(self.cfg))
+
+    def get_function_storage_writes(self):
+        """ Maps the name of every function (except the dispatcher and the fallback) to a list of
+        (storage slot, SSTORE instruction) tuples. Storage writes inserted by patches are skipped. """
+        return self._lookup("function_storage_writes", None, self._compute_function_storage_writes)
+
+    def _compute_function_storage_writes(self):
+        storage_accesses = self.get_storage_accesses()
+        function_storage_writes = dict()
+        for function in self.cfg.functions:
+            if not function.name in ["_fallback", "_dispatcher"]:
+                function_storage_writes[function.name] = list()
+                for instruction, locations in storage_accesses[function]:
+                    if instruction.mnemonic == "SSTORE" and instruction.pc[1] != 0:
+                        storage_slots = get_storage_slots(locations)
+                        if storage_slots:
+                            storage_write = min(storage_slots)[0], instruction
+                            if not storage_write in function_storage_writes[function.name]:
+                                function_storage_writes[function.name].append(storage_write)
+        return function_storage_writes
+
+    def get_storage_write_slots(self):
+        """ Maps the original pc of every SSTORE to the smallest storage slot it may write to. """
+        return self._lookup("storage_write_slots", None, self._compute_storage_write_slots)
+
+    def _compute_storage_write_slots(self):
+        storage_accesses = self.get_storage_accesses()
+        storage_write_slots = dict()
+        for function in storage_accesses:
+            for instruction, locations in storage_accesses[function]:
+                if instruction.mnemonic == "SSTORE" and instruction.pc[1] != 0:
+                    storage_slots = get_storage_slots(locations)
+                    if storage_slots:
+                        slot = min(storage_slots)[0]
+                        if not instruction.pc[1] in storage_write_slots or slot < storage_write_slots[instruction.pc[1]]:
+                            storage_write_slots[instruction.pc[1]] = slot
+        return storage_write_slots
+
+    def get_access_control_information(self, pc):
+        """ Access control check (see utils.get_access_control_information) guarding the instruction at the original pc. """
+        return self._lookup("access_control_information", pc, lambda: get_access_control_information(get_backtrace(get_basic_block(self.cfg, pc), list(), list(), pc), TaintRunner(keep_trace=False)))
+
+    def get_error_handling_sequence(self, basic_block):
+        """ Error handling sequence for patches inserted into basic_block (see utils.get_error_handling_sequence). """
+        return self._lookup("error_handling_sequence", basic_block, lambda: get_error_handling_sequence(basic_block, self.enable_error_handling_inference))
+
+    def get_value_ranges(self):
+        """ Proofs that arithmetic instructions cannot overflow or underflow (see range_analysis.get_value_ranges). """
+        return self._lookup("value_ranges", None, lambda: get_value_ranges(self.cfg))
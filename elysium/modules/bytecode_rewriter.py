@@ -1,134 +1,458 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import copy
+import bisect
+
 from pyevmasm import assemble_one
 
-def inject_patch_at_address(cfg, patch, address):
-    if patch["insert_mode"] == "after":
-        after = True
-    elif patch["insert_mode"] == "before":
-        after = False
-    else:
-        print("Error: Unknown insert mode:", patch["insert_mode"], "in patch:", patch)
-        return cfg
+# Instructions that end the execution
+HALTING_MNEMONICS = ["STOP", "RETURN", "REVERT", "INVALID", "SELFDESTRUCT"]
 
-    offset = 0
-    for basic_block in cfg.basic_blocks:
-        # Search for basic block that contains the bug
-        if address >= basic_block.start.pc[1] and address <= basic_block.end.pc[1]:
-            j = 0
-            delete_location = None, None
-            successfully_deleted = False
-            patched_instruction_sequence = list()
-            deleted_instruction_sequence = list()
-            # Delete faulty instructions from basic block
-            for i in range(len(basic_block.instructions)):
+# Instructions after which the execution never falls through to the next instruction
+TERMINATING_MNEMONICS = ["STOP", "JUMP", "RETURN", "REVERT", "INVALID", "SELFDESTRUCT"]
+
+class BasicBlockIndex(object):
+    """ Interval index of the basic blocks of a CFG on their original and on their rewritten pcs.
+    Basic blocks do not overlap and patches never reorder them, so both indexes are sorted arrays
+    of start pcs that are searched with bisect. The original pcs are recorded when the index is
+    built, the rewritten start pcs are shifted together with the instructions. """
+
+    def __init__(self, basic_blocks):
+        self.basic_blocks = sorted(basic_blocks, key=lambda basic_block: _get_original_pc(basic_block.start))
+        self.original_starts = [_get_original_pc(basic_block.start) for basic_block in self.basic_blocks]
+        self.original_ends = [_get_original_pc(basic_block.end) for basic_block in self.basic_blocks]
+        self.rewritten_starts = [_get_rewritten_pc(basic_block.start) for basic_block in self.basic_blocks]
+        self.positions = {basic_block: i for i, basic_block in enumerate(self.basic_blocks)}
+
+    def get_position(self, pc):
+        """ Returns the position of the basic block that contained the original pc, None if there is none. """
+        i = bisect.bisect_right(self.original_starts, pc) - 1
+        if i >= 0 and pc <= self.original_ends[i]:
+            return i
+        return None
+
+    def get_basic_block(self, pc):
+        """ Returns the basic block that contained the original pc, None if there is none. """
+        i = self.get_position(pc)
+        if i is not None:
+            return self.basic_blocks[i]
+        return None
+
+    def get_basic_block_at_rewritten_pc(self, pc):
+        """ Returns the basic block that contains the rewritten pc, None if there is none. """
+        i = bisect.bisect_right(self.rewritten_starts, pc) - 1
+        if i >= 0 and pc <= _get_rewritten_pc(self.basic_blocks[i].end):
+            return self.basic_blocks[i]
+        return None
+
+    def update(self, basic_block):
+        """ Updates the rewritten start pc of a basic block after its instructions changed. """
+        i = self.positions[basic_block]
+        self.rewritten_starts[i] = _get_rewritten_pc(basic_block.start)
+
+    def shift(self, address, offset):
+        """ Shifts the rewritten pcs of all basic blocks that start after the original pc address by offset. """
+        for i in range(bisect.bisect_right(self.original_starts, address), len(self.basic_blocks)):
+            self.shift_basic_block(i, offset)
+
+    def shift_basic_block(self, i, offset):
+        """ Shifts the rewritten pcs of the basic block at position i by offset. """
+        self.rewritten_starts[i] += offset
+        for instruction in self.basic_blocks[i]._instructions:
+            instruction.pc = instruction.pc[0] + offset, instruction.pc[1]
+
+def _get_original_pc(instruction):
+    if isinstance(instruction.pc, tuple):
+        return instruction.pc[1]
+    return instruction.pc
+
+def _get_rewritten_pc(instruction):
+    if isinstance(instruction.pc, tuple):
+        return instruction.pc[0]
+    return instruction.pc
+
+def _get_push_width(value):
+    return max((value.bit_length() + 7) // 8, 1)
+
+class Patch(dict):
+    """ A patch (delete, insert, insert_mode and constructor) that also carries its insert sequence
+    already assembled (see assemble_patch_sequence) in instructions. It is serialized like a dict. """
+
+    def __init__(self, patch, instructions):
+        super(Patch, self).__init__(patch)
+        self.instructions = instructions
+
+_assembled_patch_sequences = dict()
+
+def assemble_patch_sequence(sequence):
+    """ Assembles a sequence of patch codes, e.g. "PUSH1_0x0 DUP1 REVERT". Labels (PUSH_jump_loc_* and
+    JUMPDEST_jump_loc_*) and references to shared blocks (PUSH_shared_*) are kept as strings and resolved
+    when the patch is injected. Sequences are only assembled once, the returned instructions are shared
+    and have to be copied before they are changed. """
+    if not sequence in _assembled_patch_sequences:
+        instructions = list()
+        for code in sequence.split(" "):
+            if not code:
+                continue
+            if code.startswith("PUSH_jump_loc") or code.startswith("JUMPDEST_jump_loc") or code.startswith("PUSH_shared_"):
+                instructions.append(code)
+            elif code.startswith("PUSH"):
+                instructions.append(assemble_one(code.split("_")[0]+" "+code.split("_")[1]))
+            else:
+                instructions.append(assemble_one(code))
+        _assembled_patch_sequences[sequence] = instructions
+    return _assembled_patch_sequences[sequence]
+
+def get_reverse_post_order(entry_point, key):
+    """ Returns the basic blocks reachable from a basic block over the edges of a function key
+    in reverse post-order. """
+    order = list()
+    visited = set([entry_point])
+    stack = [(entry_point, iter(entry_point.outgoing_basic_blocks(key)))]
+    while stack:
+        basic_block, successors = stack[-1]
+        for successor in successors:
+            if not successor in visited:
+                visited.add(successor)
+                stack.append((successor, iter(successor.outgoing_basic_blocks(key))))
+                break
+        else:
+            stack.pop()
+            order.append(basic_block)
+    order.reverse()
+    return order
+
+def get_basic_block_index(cfg):
+    """ Returns the basic block index of the CFG. It is built on first use, which has to happen
+    before the first patch is injected. """
+    if getattr(cfg, "basic_block_index", None) is None:
+        cfg.basic_block_index = BasicBlockIndex(cfg.basic_blocks)
+    return cfg.basic_block_index
+
+def _patch_basic_block(basic_block, patch, address, after):
+    """ Deletes the delete sequence of a patch from a basic block and inserts its insert sequence
+    before or after the instruction at the original pc address. Only the rewritten pcs of the
+    instructions of the basic block are updated.
+
+    Returns:
+        int: the number of bytes the basic block grew by, None if the patch could not be applied.
+        list: the deleted instructions.
+    """
+    j = 0
+    delete_location = None, None
+    successfully_deleted = False
+    patched_instruction_sequence = list()
+    deleted_instruction_sequence = list()
+    # Delete faulty instructions from basic block
+    for i in range(len(basic_block.instructions)):
+        if str(basic_block.instructions[i]) == patch["delete"].split(" ")[j].replace("_", " "):
+            if j == 0:
+                delete_location = i, basic_block.instructions[i].pc[0]
+            deleted_instruction_sequence.append(basic_block.instructions[i])
+            if j < len(patch["delete"].split(" ")) - 1:
+                j += 1
+            else:
+                successfully_deleted = True
+        else:
+            if not successfully_deleted and j > 0:
+                patched_instruction_sequence += deleted_instruction_sequence
+                deleted_instruction_sequence = list()
+                j = 0
                 if str(basic_block.instructions[i]) == patch["delete"].split(" ")[j].replace("_", " "):
                     if j == 0:
                         delete_location = i, basic_block.instructions[i].pc[0]
                     deleted_instruction_sequence.append(basic_block.instructions[i])
-                    offset -= basic_block.instructions[i].size
                     if j < len(patch["delete"].split(" ")) - 1:
                         j += 1
                     else:
                         successfully_deleted = True
                 else:
-                    if not successfully_deleted and j > 0:
-                        patched_instruction_sequence += deleted_instruction_sequence
-                        deleted_instruction_sequence = list()
-                        j = 0
-                        if str(basic_block.instructions[i]) == patch["delete"].split(" ")[j].replace("_", " "):
-                            if j == 0:
-                                delete_location = i, basic_block.instructions[i].pc[0]
-                            deleted_instruction_sequence.append(basic_block.instructions[i])
-                            offset -= basic_block.instructions[i].size
-                            if j < len(patch["delete"].split(" ")) - 1:
-                                j += 1
-                            else:
-                                successfully_deleted = True
-                                delete_location = i - len(patch["delete"].split(" ")) + 1
-                        else:
-                            patched_instruction_sequence.append(basic_block.instructions[i])
-                    else:
-                        patched_instruction_sequence.append(basic_block.instructions[i])
-            if patch["delete"] == "":
-                for i in range(len(basic_block.instructions)):
-                    if basic_block.instructions[i].pc[1] == address:
-                        delete_location = i, basic_block.instructions[i].pc[0]
-                        successfully_deleted = True
-                        break
+                    patched_instruction_sequence.append(basic_block.instructions[i])
+            else:
+                patched_instruction_sequence.append(basic_block.instructions[i])
+    if patch["delete"] == "":
+        for i in range(len(basic_block.instructions)):
+            if basic_block.instructions[i].pc[1] == address:
+                delete_location = i, basic_block.instructions[i].pc[0]
+                successfully_deleted = True
+                break
 
-            # Insert correct instructions into basic block
-            i, pc = delete_location
-            if i and pc:
-                push_locations = {}
-                j = 0
-                while j < len(patch["insert"].split(" ")):
-                    code = patch["insert"].split(" ")[j]
-                    if after:
-                        index = i + j + 1
-                    else:
-                        index = i + j
-
-                    if code.startswith("PUSH_jump_loc"):
-                        location = code.replace("PUSH_", "")
-                        if not location in push_locations:
-                            push_locations[location] = list()
-                        push_locations[location].append(index)
-                        address_width = len(hex(pc).replace("0x", ""))
-                        if address_width % 2 != 0:
-                            address_width += 1
-                        address_width = int(address_width / 2)
-                        patched_instruction_sequence.insert(index, assemble_one("PUSH"+str(address_width)+" "+hex(pc)))
-                        patched_instruction_sequence[index].pc = pc, 0
-
-                    elif code.startswith("PUSH"):
-                        patched_instruction_sequence.insert(index, assemble_one(code.split("_")[0]+" "+code.split("_")[1]))
-                        patched_instruction_sequence[index].pc = pc, 0
-
-                    elif code.startswith("JUMPDEST_jump_loc"):
-                        location = code.replace("JUMPDEST_", "")
-                        address_width = len(hex(pc).replace("0x", ""))
-                        if address_width % 2 != 0:
-                            address_width += 1
-                        address_width = int(address_width / 2)
-                        if after:
-                            for k in push_locations[location]:
-                                original_pc = patched_instruction_sequence[k].pc
-                                patched_instruction_sequence[k] = assemble_one("PUSH"+str(address_width)+" "+hex(pc + 1))
-                                patched_instruction_sequence[k].pc = original_pc
-                        else:
-                            for k in push_locations[location]:
-                                original_pc = patched_instruction_sequence[k].pc
-                                patched_instruction_sequence[k] = assemble_one("PUSH"+str(address_width)+" "+hex(pc))
-                                patched_instruction_sequence[k].pc = original_pc
-                        patched_instruction_sequence.insert(index, assemble_one("JUMPDEST"))
-                        patched_instruction_sequence[index].pc = pc, 0
+    # Insert correct instructions into basic block, the first instruction of a basic block is at position 0
+    # and the first instruction of the code at pc 0
+    i, pc = delete_location
+    if i is not None:
+        codes = getattr(patch, "instructions", None)
+        if codes is None:
+            codes = assemble_patch_sequence(patch["insert"])
+        if after:
+            # The insert sequence starts after the instruction
+            pc += basic_block.instructions[i].size
+        push_locations = {}
+        j = 0
+        while j < len(codes):
+            code = codes[j]
+            if after:
+                index = i + j + 1
+            else:
+                index = i + j
 
-                    else:
-                        patched_instruction_sequence.insert(index, assemble_one(code))
-                        patched_instruction_sequence[index].pc = pc, 0
-
-                    pc += patched_instruction_sequence[index].size
-                    offset += patched_instruction_sequence[index].size
-                    j += 1
-
-                delta = 0
-                for k in range(len(patched_instruction_sequence)):
-                    if delta == 0 and k > 0 and patched_instruction_sequence[k].pc[0] < patched_instruction_sequence[k - 1].pc[0]:
-                        delta = patched_instruction_sequence[k - 1].pc[0] - patched_instruction_sequence[k].pc[0] + patched_instruction_sequence[k - 1].size
-                    patched_instruction_sequence[k].pc = patched_instruction_sequence[k].pc[0] + delta, patched_instruction_sequence[k].pc[1]
-
-            # Update basic block if faulty instructions were successfully detected and deleted
-            if successfully_deleted:
-                basic_block._instructions = patched_instruction_sequence
-                for instruction in basic_block.instructions:
-                    if isinstance(instruction.pc, int):
-                        instruction.pc = instruction.pc, instruction.pc
-
-    for basic_block in cfg.basic_blocks:
-        if basic_block.start.pc[1] > address:
-            for instruction in basic_block.instructions:
-                instruction.pc = instruction.pc[0] + offset, instruction.pc[1]
+            if isinstance(code, str) and code.startswith("PUSH_jump_loc"):
+                location = code.replace("PUSH_", "")
+                if not location in push_locations:
+                    push_locations[location] = list()
+                push_locations[location].append(index)
+                address_width = len(hex(pc).replace("0x", ""))
+                if address_width % 2 != 0:
+                    address_width += 1
+                address_width = int(address_width / 2)
+                patched_instruction_sequence.insert(index, assemble_one("PUSH"+str(address_width)+" "+hex(pc)))
+                patched_instruction_sequence[index].pc = pc, 0
+
+            elif isinstance(code, str) and code.startswith("PUSH_shared_"):
+                patched_instruction_sequence.insert(index, _assemble_shared_reference(code[len("PUSH_shared_"):]))
+                patched_instruction_sequence[index].pc = pc, 0
+
+            elif isinstance(code, str) and code.startswith("JUMPDEST_jump_loc"):
+                location = code.replace("JUMPDEST_", "")
+                address_width = len(hex(pc).replace("0x", ""))
+                if address_width % 2 != 0:
+                    address_width += 1
+                address_width = int(address_width / 2)
+                for k in push_locations[location]:
+                    original_pc = patched_instruction_sequence[k].pc
+                    patched_instruction_sequence[k] = assemble_one("PUSH"+str(address_width)+" "+hex(pc))
+                    patched_instruction_sequence[k].pc = original_pc
+                patched_instruction_sequence.insert(index, assemble_one("JUMPDEST"))
+                patched_instruction_sequence[index].pc = pc, 0
+
+            else:
+                patched_instruction_sequence.insert(index, copy.copy(code))
+                patched_instruction_sequence[index].pc = pc, 0
+
+            pc += patched_instruction_sequence[index].size
+            j += 1
+
+        delta = 0
+        for k in range(len(patched_instruction_sequence)):
+            if delta == 0 and k > 0 and patched_instruction_sequence[k].pc[0] < patched_instruction_sequence[k - 1].pc[0]:
+                delta = patched_instruction_sequence[k - 1].pc[0] - patched_instruction_sequence[k].pc[0] + patched_instruction_sequence[k - 1].size
+            patched_instruction_sequence[k].pc = patched_instruction_sequence[k].pc[0] + delta, patched_instruction_sequence[k].pc[1]
 
+    # Update basic block if faulty instructions were successfully detected and deleted
+    if not successfully_deleted or i is None:
+        return None, deleted_instruction_sequence
+    offset = sum([instruction.size for instruction in patched_instruction_sequence]) - sum([instruction.size for instruction in basic_block.instructions])
+    basic_block._instructions = patched_instruction_sequence
+    basic_block._symbolic_stack = None
+    for instruction in basic_block.instructions:
+        if isinstance(instruction.pc, int):
+            instruction.pc = instruction.pc, instruction.pc
+    return offset, deleted_instruction_sequence
+
+def apply_patches(cfg, patch_plan):
+    """ Applies a patch plan to a CFG in a single sweep over its basic blocks.
+
+    The patch plan is a list of (address, patch) tuples, where address is the original pc the
+    patch is applied to. Patches are applied in order of their addresses, patches with the same
+    address in the order of the plan. Instead of shifting all later basic blocks after every
+    patch, the size differences of the patches are summed up while sweeping over the basic blocks
+    and every basic block is shifted once by the sum of the patches before it.
+
+    Returns:
+        list: the conflicts of patches that could not be applied, dicts with the address, the
+        patch and the reason.
+    """
+    conflicts = list()
+    basic_block_index = get_basic_block_index(cfg)
+    patches = dict()
+    for address, patch in sorted(patch_plan, key=lambda x: x[0]):
+        i = basic_block_index.get_position(address)
+        if i is None:
+            conflicts.append({"address": address, "patch": patch, "reason": "no basic block contains the address"})
+        elif not patch["insert_mode"] in ["before", "after"]:
+            conflicts.append({"address": address, "patch": patch, "reason": "unknown insert mode: "+str(patch["insert_mode"])})
+        else:
+            if not i in patches:
+                patches[i] = list()
+            patches[i].append((address, patch))
+    if not patches:
+        return conflicts
+
+    offset = 0
+    deleted = set()
+    for i in range(min(patches), len(basic_block_index.basic_blocks)):
+        if offset != 0:
+            basic_block_index.shift_basic_block(i, offset)
+        if not i in patches:
+            continue
+        basic_block = basic_block_index.basic_blocks[i]
+        for address, patch in patches[i]:
+            if address in deleted:
+                if patch["delete"]:
+                    conflicts.append({"address": address, "patch": patch, "reason": "delete range overlaps with the delete range of a previous patch"})
+                else:
+                    conflicts.append({"address": address, "patch": patch, "reason": "instruction was deleted by a previous patch"})
+                continue
+            size, deleted_instruction_sequence = _patch_basic_block(basic_block, patch, address, patch["insert_mode"] == "after")
+            if size is None:
+                if patch["delete"]:
+                    conflicts.append({"address": address, "patch": patch, "reason": "delete sequence not found"})
+                else:
+                    conflicts.append({"address": address, "patch": patch, "reason": "instruction not found"})
+                continue
+            for instruction in deleted_instruction_sequence:
+                deleted.add(instruction.pc[1])
+            offset += size
+        basic_block_index.update(basic_block)
+    return conflicts
+
+def inject_patch_at_address(cfg, patch, address):
+    for conflict in apply_patches(cfg, [(address, patch)]):
+        print("Error: Patch could not be applied at address", address, "("+conflict["reason"]+"):", patch)
     return cfg
+
+def _assemble_shared_reference(label):
+    # The operand is a placeholder, the push width is grown by relocate_and_assemble
+    instruction = assemble_one("PUSH1 0x0")
+    instruction.shared_label = label
+    return instruction
+
+def get_label(instruction):
+    """ Returns the label of a JUMPDEST or the label a PUSH refers to: the name of a shared block label,
+    otherwise the rewritten pc (see relocate_and_assemble). """
+    shared_label = getattr(instruction, "shared_label", None)
+    if shared_label:
+        return shared_label
+    if instruction.mnemonic == "JUMPDEST":
+        return instruction.pc[0]
+    if instruction.has_operand:
+        return instruction.operand
+    return None
+
+def add_shared_block(cfg, label, sequence):
+    """ Adds a block of code that is shared by patches to a CFG, e.g. a check that is called from several
+    patches. Shared blocks are laid out after the basic blocks by relocate_and_assemble, but only if they
+    are referenced. A patch pushes the address of a shared block with PUSH_shared_<label>, the labels
+    of the sequence of a shared block (PUSH_jump_loc_* and JUMPDEST_jump_loc_*) are local to the block.
+    A block is only added once per label. """
+    if getattr(cfg, "shared_blocks", None) is None:
+        cfg.shared_blocks = dict()
+    if label in cfg.shared_blocks:
+        return
+    entry = assemble_one("JUMPDEST")
+    entry.shared_label = label
+    instructions = [entry]
+    for code in assemble_patch_sequence(sequence):
+        if isinstance(code, str) and code.startswith("PUSH_jump_loc"):
+            instruction = _assemble_shared_reference(label+"/"+code.replace("PUSH_", ""))
+        elif isinstance(code, str) and code.startswith("JUMPDEST_jump_loc"):
+            instruction = assemble_one("JUMPDEST")
+            instruction.shared_label = label+"/"+code.replace("JUMPDEST_", "")
+        elif isinstance(code, str):
+            instruction = _assemble_shared_reference(code[len("PUSH_shared_"):])
+        else:
+            instruction = copy.copy(code)
+        instructions.append(instruction)
+    for instruction in instructions:
+        instruction.pc = 0, 0
+    cfg.shared_blocks[label] = instructions
+
+def _get_referenced_shared_blocks(cfg, instructions):
+    """ Returns the labels of the shared blocks that are referenced by the instructions or by other
+    referenced shared blocks, in the order in which they were added. """
+    shared_blocks = getattr(cfg, "shared_blocks", None) or dict()
+    referenced = set()
+    worklist = [instruction.shared_label for instruction in instructions if getattr(instruction, "shared_label", None)]
+    while worklist:
+        label = worklist.pop().split("/")[0]
+        if label in shared_blocks and not label in referenced:
+            referenced.add(label)
+            worklist += [instruction.shared_label for instruction in shared_blocks[label] if getattr(instruction, "shared_label", None)]
+    return [label for label in shared_blocks if label in referenced]
+
+def relocate_and_assemble(cfg, relocate=True):
+    """ Lays out the basic blocks of a patched CFG in order of their rewritten pcs and assembles them.
+
+    Every JUMPDEST becomes a label: original JUMPDESTs are labeled by their original pc and JUMPDESTs
+    inserted by patches by the rewritten pc they were inserted at. Every PUSH whose operand is a label
+    is a reference to it, labels of the same origin (original or inserted) as the PUSH are preferred.
+    The referenced shared blocks (see add_shared_block) are laid out after the basic blocks, their
+    labels and the references to them are resolved by name, also if relocate is False. Widening a
+    reference can move the labels after it, so push widths are grown until a fixed point is reached
+    before the code is emitted. The rewritten pcs of the instructions are not updated.
+
+    Returns:
+        bytearray: the assembled bytecode.
+        list: sorted (original pc, patched pc) tuples of all original instructions.
+    """
+    instructions = list()
+    for basic_block in sorted(cfg.basic_blocks, key=lambda x: x.start.pc):
+        instructions += basic_block.instructions
+    shared_blocks = _get_referenced_shared_blocks(cfg, instructions)
+    shared_blocks_start = len(instructions)
+    if shared_blocks:
+        if instructions and not instructions[-1].mnemonic in TERMINATING_MNEMONICS:
+            stop = assemble_one("STOP")
+            stop.pc = 0, 0
+            instructions.append(stop)
+        for label in shared_blocks:
+            instructions += cfg.shared_blocks[label]
+
+    # Label table and references
+    original_labels, inserted_labels, shared_labels = dict(), dict(), dict()
+    for i in range(len(instructions)):
+        if instructions[i].mnemonic == "JUMPDEST":
+            if getattr(instructions[i], "shared_label", None):
+                shared_labels[instructions[i].shared_label] = i
+            elif i >= shared_blocks_start:
+                continue
+            elif instructions[i].pc[1] != 0:
+                original_labels[instructions[i].pc[1]] = i
+            else:
+                inserted_labels[instructions[i].pc[0]] = i
+    references = dict()
+    for i in range(len(instructions)):
+        if getattr(instructions[i], "shared_label", None) and instructions[i].mnemonic.startswith("PUSH"):
+            references[i] = shared_labels[instructions[i].shared_label]
+    if relocate:
+        for i in range(shared_blocks_start):
+            if instructions[i].mnemonic.startswith("PUSH") and not i in references:
+                operand = instructions[i].operand
+                if instructions[i].pc[1] != 0:
+                    label = original_labels.get(operand, inserted_labels.get(operand))
+                else:
+                    label = inserted_labels.get(operand, original_labels.get(operand))
+                if label is not None:
+                    references[i] = label
+
+    # Grow push widths until all labels fit
+    sizes = [instruction.size for instruction in instructions]
+    while True:
+        positions = list()
+        position = 0
+        for size in sizes:
+            positions.append(position)
+            position += size
+        changed = False
+        for i in references:
+            push_width = _get_push_width(positions[references[i]])
+            if push_width > sizes[i] - 1:
+                sizes[i] = push_width + 1
+                changed = True
+        if not changed:
+            break
+
+    bytecode = bytearray()
+    pc_map = list()
+    for i in range(len(instructions)):
+        if i in references:
+            push_width = sizes[i] - 1
+            bytecode.append(0x5f + push_width)
+            bytecode += positions[references[i]].to_bytes(push_width, "big")
+        else:
+            bytecode += instructions[i].bytes
+        if instructions[i].pc[1] != 0 or i == 0:
+            pc_map.append((instructions[i].pc[1], positions[i]))
+    pc_map.sort()
+    return bytecode, pc_map
@@ -7,7 +7,7 @@ import os
 from pkg_resources import require
 
 from crytic_compile import cryticparser, CryticCompile, InvalidCompilation, is_supported
-from .known_hashes.known_hashes import known_hashes
+from .known_hashes.index import known_hashes
 
 from .cfg import CFG
 
@@ -1,14 +1,16 @@
 import logging
 from .basic_block import BasicBlock
 from .function import Function
+from . import cache
+from . import parallel
+from .instruction_table import InstructionTable, get_opcodes
 
 __all__ = ["CFG", "BasicBlock", "Function"]
 
-from ..known_hashes.known_hashes import known_hashes
+from ..known_hashes.index import known_hashes
 from ..value_analysis.value_set_analysis import StackValueAnalysis
 
 import re
-from pyevmasm import disassemble_all
 
 logger = logging.getLogger("evm-cfg-builder")
 
@@ -67,7 +69,7 @@ class CFG(object):
     """Implements the control flow graph (CFG) of an EVM bytecode.
     """
 
-    def __init__(self, bytecode=None, remove_metadata=True, analyze=True, optimization_enabled=True, compute_cfgs=True, symbolic_stack_analysis=True):
+    def __init__(self, bytecode=None, remove_metadata=True, analyze=True, optimization_enabled=True, compute_cfgs=True, symbolic_stack_analysis=True, cache_directory=None, cache_size=None, workers=None):
         """Initialize an EVM CFG.
 
         :param bytecode: The EVM bytecode
@@ -76,6 +78,12 @@ class CFG(object):
         :type remove_metadata: bool
         :param analyze: Automatically analyze the bytecode
         :type analyze: bool
+        :param cache_directory: Directory where recovered CFGs are cached (see cache.py)
+        :type cache_directory: None, str
+        :param cache_size: Maximum size in bytes of the cache directory, None for no limit
+        :type cache_size: None, int
+        :param workers: Analyze the functions in this number of worker processes (see parallel.py)
+        :type workers: None, int
         """
         self._functions = dict()
         # __basic_blocks is a dict that matches
@@ -83,7 +91,10 @@ class CFG(object):
         # The address can be the first or the last
         # instructions
         self._basic_blocks = dict()
-        self._instructions = dict()
+        # List of the distinct basic blocks, built on first access
+        self._basic_blocks_list = None
+        # Disassembled bytecode, see instruction_table.py
+        self._instruction_table = None
 
         self._optimization_enabled = optimization_enabled
 
@@ -93,13 +104,28 @@ class CFG(object):
 
         self._symbolic_stack_analysis = symbolic_stack_analysis
 
+        self._workers = workers
+
         if remove_metadata:
             self.remove_metadata()
 
         if analyze:
+            cache_path = None
+            if cache_directory:
+                cache_path = cache.get_cache_path(cache_directory, self._bytecode, {
+                    'o': optimization_enabled,
+                    'c': compute_cfgs,
+                    's': symbolic_stack_analysis,
+                    'p': workers is not None
+                })
+                self.compute_basic_blocks()
+                if cache.load(self, cache_path):
+                    return
             self.create_functions()
             if compute_cfgs:
                 self.create_cfgs()
+            if cache_path:
+                cache.save(self, cache_path, cache_size)
 
     def __repr__(self):
         return "<CFG: {} Functions, {} Basic Blocks>".format(
@@ -124,9 +150,11 @@ class CFG(object):
     def basic_blocks(self):
         '''
         Return the list of basic_block
+        The list is cached and must not be modified
         '''
-        bbs = self._basic_blocks.values()
-        return list(set(bbs))
+        if self._basic_blocks_list is None:
+            self._basic_blocks_list = list(set(self._basic_blocks.values()))
+        return self._basic_blocks_list
 
     @property
     def entry_point(self):
@@ -147,7 +175,16 @@ class CFG(object):
         '''
         Return the list of instructions
         '''
-        return list(self._instructions.values())
+        if self._instruction_table is None:
+            return []
+        return self._instruction_table.instructions()
+
+    @property
+    def instruction_table(self):
+        '''
+        Return the InstructionTable of the bytecode
+        '''
+        return self._instruction_table
 
     def get_instruction_at(self, addr):
         '''Return the instruction at the provided address.
@@ -155,7 +192,12 @@ class CFG(object):
         :param addr: Address of instruction
         :type addr: int
         '''
-        return self._instructions.get(addr)
+        if self._instruction_table is None:
+            return None
+        i = self._instruction_table.index(addr)
+        if i is None:
+            return None
+        return self._instruction_table.instruction(i)
 
     def get_basic_block_at(self, addr):
         '''Return the basic block at the provided address.
@@ -196,16 +238,27 @@ class CFG(object):
         Compute the CFGs
         :return:
         '''
+        explored = dict()
+        if self._workers is not None:
+            # The dispatcher skips the basic blocks reacheable from the other
+            # functions, so it is analyzed once their edges are merged
+            functions = [f for f in self.functions if f.hash_id != Function.DISPATCHER_ID]
+            for function, bbs in zip(functions, parallel.analyze_functions(self, functions, self._workers)):
+                explored[function.start_addr] = bbs
+
         for function in self.functions:
 
-            vsa = StackValueAnalysis(
-                self,
-                function.entry,
-                function.hash_id,
-                enable_optimization=self._optimization_enabled,
-                symbolic_stack_analysis=self._symbolic_stack_analysis
-            )
-            bbs = vsa.analyze()
+            if function.start_addr in explored:
+                bbs = explored[function.start_addr]
+            else:
+                vsa = StackValueAnalysis(
+                    self,
+                    function.entry,
+                    function.hash_id,
+                    enable_optimization=self._optimization_enabled,
+                    symbolic_stack_analysis=self._symbolic_stack_analysis
+                )
+                bbs = vsa.analyze()
 
             function.basic_blocks = [self._basic_blocks[bb] for bb in bbs]
 
@@ -217,7 +270,9 @@ class CFG(object):
     def clear(self):
         self._functions = dict()
         self._basic_blocks = dict()
-        self._instructions = dict()
+        self._basic_blocks_list = None
+        # Disassembled bytecode, see instruction_table.py
+        self._instruction_table = None
         self._bytecode = bytes()
 
     def remove_metadata(self):
@@ -243,29 +298,45 @@ class CFG(object):
         if self._basic_blocks:
             return
 
-        bb = BasicBlock()
-
-        for instruction in disassemble_all(self.bytecode):
-            self._instructions[instruction.pc] = instruction
-
-            if instruction.name == 'JUMPDEST':
-                # JUMPDEST indicates a new BasicBlock. Set the end pc
-                # of the current block, and switch to a new one.
-                if bb._instructions:
-                    self._basic_blocks[bb.end.pc] = bb
-
-                bb = BasicBlock()
+        self._basic_blocks_list = None
 
-                self._basic_blocks[instruction.pc] = bb
+        table = InstructionTable(self.bytecode)
+        self._instruction_table = table
 
-            bb.add_instruction(instruction)
+        names, _ = get_opcodes()
+        jumpdest = names.index('JUMPDEST')
+        ends = {opcode for opcode in range(256) if names[opcode] in BASIC_BLOCK_END}
 
-            if bb.start.pc == instruction.pc:
-                self._basic_blocks[instruction.pc] = bb
+        pcs = table.pcs
+        opcodes = table.opcodes
+        block_ids = table.block_ids
+        first = None
+        block_id = -1
+        for i in range(len(table)):
+            opcode = opcodes[i]
 
-            if bb.end.name in BASIC_BLOCK_END:
-                self._basic_blocks[bb.end.pc] = bb
-                bb = BasicBlock()
+            if opcode == jumpdest and first is not None:
+                # JUMPDEST indicates a new BasicBlock. Set the end pc
+                # of the current block, and switch to a new one.
+                bb = BasicBlock(table, first, i - 1)
+                self._basic_blocks[pcs[first]] = bb
+                self._basic_blocks[pcs[i - 1]] = bb
+                first = None
+
+            if first is None:
+                first = i
+                block_id += 1
+            block_ids.append(block_id)
+
+            if opcode in ends:
+                bb = BasicBlock(table, first, i)
+                self._basic_blocks[pcs[first]] = bb
+                self._basic_blocks[pcs[i]] = bb
+                first = None
+
+        # The last bb does not end with a terminating instruction
+        if first is not None:
+            self._basic_blocks[pcs[first]] = BasicBlock(table, first, len(table) - 1)
 
     def compute_functions(self, block, is_entry_block=False):
         """
@@ -342,13 +413,15 @@ class CFG(object):
 
     def compute_reachability(self, entry_point, key):
         bbs_saw = [entry_point]
+        bbs_saw_set = {entry_point}
 
         bbs_to_explore = [entry_point]
         while bbs_to_explore:
             bb = bbs_to_explore.pop()
             for son in bb.outgoing_basic_blocks(key):
-                if not son in bbs_saw:
+                if not son in bbs_saw_set:
                     bbs_saw.append(son)
+                    bbs_saw_set.add(son)
                     bbs_to_explore.append(son)
 
         for bb in bbs_saw:
@@ -357,11 +430,11 @@ class CFG(object):
         # clean son/fathers that are created by compute_simple_edges
         # but are not reacheable
         for bb in self._basic_blocks.values():
-            if not bb in bbs_saw:
-                if key in bb._incoming_basic_blocks:
-                    bb._incoming_basic_blocks.pop(key)
-                if key in bb._outgoing_basic_blocks:
-                    bb._outgoing_basic_blocks.pop(key)
+            if not bb in bbs_saw_set:
+                if key in bb.incoming_basic_blocks_as_dict:
+                    bb.remove_incoming_basic_blocks(key)
+                if key in bb.outgoing_basic_blocks_as_dict:
+                    bb.remove_outgoing_basic_blocks(key)
 
     def output_to_dot(self, base_filename):
 
@@ -1,7 +1,13 @@
 class BasicBlock(object):
 
-    def __init__(self):
-        self._instructions = []
+    def __init__(self, instruction_table=None, first=None, last=None):
+        # The instructions of a bb created from an InstructionTable
+        # are the indexes first to last of the table, the list of
+        # Instructions is only created when it is accessed
+        self._instruction_table = instruction_table
+        self._first = first
+        self._last = last
+        self._instruction_list = None if instruction_table else []
         # incoming_basic_blocks and outgoing_basic_blocks are dict
         # The key is the function hash
         # It allows to compute the VSA only
@@ -9,12 +15,33 @@ class BasicBlock(object):
         # the merging
         self._incoming_basic_blocks = {}
         self._outgoing_basic_blocks = {}
+        # Same bbs as sets, to test if an edge exists
+        self._incoming_basic_blocks_sets = {}
+        self._outgoing_basic_blocks_sets = {}
+        # Union of the bbs of all the keys, computed on first access
+        # and cleared when an edge is added or removed
+        self._all_incoming_basic_blocks = None
+        self._all_outgoing_basic_blocks = None
 
         # List of function keys that reaches the BB
         self.reacheable = []
 
+        # Computed on first access, see symbolic_stack
+        self._symbolic_stack = None
+
+    @property
+    def _instructions(self):
+        if self._instruction_list is None:
+            self._instruction_list = self._instruction_table.instructions(self._first, self._last)
+        return self._instruction_list
+
+    @_instructions.setter
+    def _instructions(self, instructions):
+        self._instruction_list = instructions
+
     def add_instruction(self, instruction):
         self._instructions.append(instruction)
+        self._symbolic_stack = None
 
     def __repr__(self):
         return '<cfg BasicBlock@{:x}-{:x}>'.format(self.start.pc, self.end.pc)
@@ -22,12 +49,16 @@ class BasicBlock(object):
     @property
     def start(self):
         '''First instruction of the basic block.'''
-        return self._instructions[0]
+        if self._instruction_list is None:
+            return self._instruction_table.instruction(self._first)
+        return self._instruction_list[0]
 
     @property
     def end(self):
         '''Last instruction of the basic block.'''
-        return self._instructions[-1]
+        if self._instruction_list is None:
+            return self._instruction_table.instruction(self._last)
+        return self._instruction_list[-1]
 
     @property
     def instructions(self):
@@ -49,27 +80,135 @@ class BasicBlock(object):
 
     @property
     def all_incoming_basic_blocks(self):
-        bbs = self._incoming_basic_blocks.values()
-        bbs = [bb for sublist in bbs for bb in sublist]
-        return list(set(bbs))
+        '''
+        Return the incoming bbs of all the keys
+        The list is cached and must not be modified
+        '''
+        if self._all_incoming_basic_blocks is None:
+            bbs = self._incoming_basic_blocks.values()
+            bbs = [bb for sublist in bbs for bb in sublist]
+            self._all_incoming_basic_blocks = list(set(bbs))
+        return self._all_incoming_basic_blocks
 
     @property
     def all_outgoing_basic_blocks(self):
-        bbs = self._outgoing_basic_blocks.values()
-        bbs = [bb for sublist in bbs for bb in sublist]
-        return list(set(bbs))
+        '''
+        Return the outgoing bbs of all the keys
+        The list is cached and must not be modified
+        '''
+        if self._all_outgoing_basic_blocks is None:
+            bbs = self._outgoing_basic_blocks.values()
+            bbs = [bb for sublist in bbs for bb in sublist]
+            self._all_outgoing_basic_blocks = list(set(bbs))
+        return self._all_outgoing_basic_blocks
 
     def add_incoming_basic_block(self, father, key):
         if not key in self._incoming_basic_blocks:
             self._incoming_basic_blocks[key] = []
-        if father not in self._incoming_basic_blocks[key]:
+            self._incoming_basic_blocks_sets[key] = set()
+        if father not in self._incoming_basic_blocks_sets[key]:
             self._incoming_basic_blocks[key].append(father)
+            self._incoming_basic_blocks_sets[key].add(father)
+            self._all_incoming_basic_blocks = None
 
     def add_outgoing_basic_block(self, son, key):
         if not key in self._outgoing_basic_blocks:
             self._outgoing_basic_blocks[key] = []
-        if son not in self._outgoing_basic_blocks[key]:
+            self._outgoing_basic_blocks_sets[key] = set()
+        if son not in self._outgoing_basic_blocks_sets[key]:
             self._outgoing_basic_blocks[key].append(son)
+            self._outgoing_basic_blocks_sets[key].add(son)
+            self._all_outgoing_basic_blocks = None
+
+    def remove_incoming_basic_blocks(self, key):
+        '''
+        Remove the incoming bbs of a key, return them
+        '''
+        self._incoming_basic_blocks_sets.pop(key, None)
+        self._all_incoming_basic_blocks = None
+        return self._incoming_basic_blocks.pop(key, [])
+
+    def remove_outgoing_basic_blocks(self, key):
+        '''
+        Remove the outgoing bbs of a key, return them
+        '''
+        self._outgoing_basic_blocks_sets.pop(key, None)
+        self._all_outgoing_basic_blocks = None
+        return self._outgoing_basic_blocks.pop(key, [])
+
+    @property
+    def symbolic_stack(self):
+        '''
+        Constant values on the stack at the end of the BB, up to its JUMP/JUMPI
+        (the last value is the target of a JUMP/JUMPI, if it is constant).
+        Values that are not constant are None, values consumed from the stack
+        of the previous BBs are unknown.
+        Computed once, the list must not be modified.
+        '''
+        if self._symbolic_stack is None:
+            self._symbolic_stack = self._compute_symbolic_stack()
+        return self._symbolic_stack
+
+    @property
+    def jump_target(self):
+        '''Constant target of the JUMP/JUMPI of the BB, None otherwise.'''
+        if self.ends_with_jump_or_jumpi() and self.symbolic_stack:
+            return self.symbolic_stack[-1]
+        return None
+
+    def _compute_symbolic_stack(self):
+        stack = list()
+        for i in self._instructions:
+            if i.name.startswith("PUSH"):
+                stack.append(i.operand)
+            elif i.name.startswith("DUP"):
+                n = int(i.name[3:])
+                if len(stack) >= n:
+                    stack.append(stack[-n])
+                else:
+                    stack.append(None)
+            elif i.name.startswith("SWAP"):
+                n = int(i.name[4:])
+                if len(stack) > 0:
+                    if len(stack) >= (n+1):
+                        elem = stack[-1-n]
+                        top = stack[-1]
+                        stack[-1] = elem
+                        stack[-1-n] = top
+                    # if we swap more than the size of the stack,
+                    # we can assume that elements are missing on the stack
+                    else:
+                        top = stack[-1]
+                        missing_elems = n - len(stack) + 1
+                        for _ in range(0, missing_elems):
+                            stack.insert(0, None)
+                        elem = stack[-1-n]
+                        stack[-1] = elem
+                        stack[-1-n] = top
+            elif i.name == "AND":
+                try:
+                    a = stack.pop()
+                except:
+                    a = None
+                try:
+                    b = stack.pop()
+                except:
+                    b = None
+                if a is None or b is None:
+                    stack.append(None)
+                else:
+                    stack.append(a & b)
+            elif i.name in ["JUMP", "JUMPI"]:
+                return stack
+            else:
+                for _ in range(i.pops):
+                    try:
+                        stack.pop()
+                    except:
+                        pass
+                for _ in range(i.pushes):
+                    stack.append(None)
+        return stack
 
     def ends_with_jumpi(self):
         return self.end.name == 'JUMPI'
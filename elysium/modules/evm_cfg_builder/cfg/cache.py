@@ -0,0 +1,134 @@
+import os
+import json
+import zlib
+import hashlib
+import logging
+
+from .function import Function
+
+logger = logging.getLogger("evm-cfg-builder")
+
+# Version of the cache format, entries with another version are ignored and overwritten
+CFG_CACHE_VERSION = 1
+
+def get_cache_path(cache_directory, bytecode, options):
+    '''
+        Return the path of the cache entry of a bytecode
+    Args:
+        cache_directory (str)
+        bytecode (bytes): bytecode without metadata
+        options (dict): options of the CFG that change its recovery
+    Returns:
+        (str)
+    '''
+    options = ''.join(['{}{}'.format(name, int(value)) for name, value in sorted(options.items())])
+    return os.path.join(cache_directory, '{}_{}.cfg'.format(hashlib.sha256(bytecode).hexdigest(), options))
+
+def evict(directory, max_size, extension):
+    '''
+        Delete the least recently used entries (the files with the extension) of a cache directory
+        until their total size is at most max_size bytes. The modification time of an entry records
+        its last use. Entries that are deleted concurrently by another process are skipped.
+    '''
+    entries = []
+    size = 0
+    for name in os.listdir(directory):
+        if name.endswith(extension):
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            size += stat.st_size
+    for _, entry_size, name in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+        size -= entry_size
+
+def save(cfg, path, max_size=None):
+    '''
+        Serialize the recovered CFG: the functions (in the order they were found), their basic blocks
+        and attributes, and for every basic block its edges per function key and its reachability.
+        Basic blocks are referenced by their start pc, the instructions are not stored as they are
+        disassembled again when the CFG is loaded. If max_size is not None, the least recently used
+        entries are evicted when the cache grows beyond max_size bytes.
+    '''
+    functions = []
+    for function in cfg.functions:
+        functions.append([function.hash_id,
+                          function.start_addr,
+                          function.entry.start.pc,
+                          function.name,
+                          [bb.start.pc for bb in function.basic_blocks],
+                          function.attributes])
+    basic_blocks = []
+    for bb in sorted(cfg.basic_blocks, key=lambda bb: bb.start.pc):
+        basic_blocks.append([bb.start.pc,
+                             [[key, [son.start.pc for son in sons]] for key, sons in bb.outgoing_basic_blocks_as_dict.items()],
+                             [[key, [father.start.pc for father in fathers]] for key, fathers in bb.incoming_basic_blocks_as_dict.items()],
+                             bb.reacheable])
+    data = {'version': CFG_CACHE_VERSION, 'functions': functions, 'basic_blocks': basic_blocks}
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open('{}.{}.tmp'.format(path, os.getpid()), 'wb') as f:
+            f.write(zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8')))
+        os.replace('{}.{}.tmp'.format(path, os.getpid()), path)
+        if max_size is not None:
+            evict(os.path.dirname(path), max_size, '.cfg')
+    except (IOError, OSError) as e:
+        logger.info('CFG could not be cached: %s', e)
+
+def load(cfg, path):
+    '''
+        Restore the functions and edges of a CFG from a cache entry.
+        The basic blocks of the CFG have to be computed already.
+    Returns:
+        (bool): False if there is no valid cache entry
+    '''
+    try:
+        with open(path, 'rb') as f:
+            data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+    except (IOError, OSError, ValueError, zlib.error):
+        return False
+    if data.get('version') != CFG_CACHE_VERSION:
+        return False
+    try:
+        # The modification time records the last use of an entry (see evict)
+        os.utime(path, None)
+    except OSError:
+        pass
+
+    basic_blocks = cfg._basic_blocks
+    try:
+        for start, outgoing, incoming, reacheable in data['basic_blocks']:
+            bb = basic_blocks[start]
+            for key, sons in outgoing:
+                for son in sons:
+                    bb.add_outgoing_basic_block(basic_blocks[son], key)
+            for key, fathers in incoming:
+                for father in fathers:
+                    bb.add_incoming_basic_block(basic_blocks[father], key)
+            bb.reacheable = reacheable
+        for hash_id, start_addr, entry, name, function_basic_blocks, attributes in data['functions']:
+            function = Function(hash_id, start_addr, basic_blocks[entry], cfg)
+            function.name = name
+            function.basic_blocks = [basic_blocks[bb] for bb in function_basic_blocks]
+            for attribute in attributes:
+                function.add_attributes(attribute)
+            cfg.add_function(function)
+    except KeyError:
+        # The entry does not match the basic blocks of the bytecode
+        cfg._functions = dict()
+        for bb in cfg.basic_blocks:
+            for key in list(bb.outgoing_basic_blocks_as_dict):
+                bb.remove_outgoing_basic_blocks(key)
+            for key in list(bb.incoming_basic_blocks_as_dict):
+                bb.remove_incoming_basic_blocks(key)
+            bb.reacheable = []
+        return False
+    return True
@@ -0,0 +1,107 @@
+from array import array
+from bisect import bisect_left
+
+from pyevmasm import Instruction, instruction_tables, DEFAULT_FORK
+
+# Name and operand size of the 256 opcodes, per fork
+_opcodes = {}
+
+def get_opcodes(fork=DEFAULT_FORK):
+    '''
+        Return the names and operand sizes of all the opcodes of a fork,
+        undefined opcodes are INVALID
+    Returns:
+        (list, list)
+    '''
+    if not fork in _opcodes:
+        names, operand_sizes = [], []
+        for opcode in range(256):
+            instruction = instruction_tables[fork].get(opcode)
+            names.append(instruction.name if instruction else 'INVALID')
+            operand_sizes.append(instruction.operand_size if instruction else 0)
+        _opcodes[fork] = (names, operand_sizes)
+    return _opcodes[fork]
+
+class InstructionTable(object):
+    '''
+        Disassembled bytecode stored in columns: the pc, the opcode and the
+        basic block of every instruction. The operand of an instruction
+        starts at pc + 1 in the bytecode.
+
+        The Instruction objects are only created when they are accessed,
+        and created once, so an instruction is always the same object.
+    '''
+
+    def __init__(self, bytecode, fork=DEFAULT_FORK):
+        self._bytecode = bytes(bytecode)
+        self._fork = fork
+        self.pcs = array('I')
+        self.opcodes = array('B')
+        # Filled by CFG.compute_basic_blocks
+        self.block_ids = array('I')
+
+        _, operand_sizes = get_opcodes(fork)
+        pc = 0
+        size = len(self._bytecode)
+        while pc < size:
+            opcode = self._bytecode[pc]
+            # A PUSH truncated by the end of the bytecode is not an instruction
+            if pc + 1 + operand_sizes[opcode] > size:
+                break
+            self.pcs.append(pc)
+            self.opcodes.append(opcode)
+            pc += 1 + operand_sizes[opcode]
+
+        self._instructions = [None] * len(self.pcs)
+        self._jumpdests = None
+
+    def __len__(self):
+        return len(self.pcs)
+
+    @property
+    def bytecode(self):
+        return self._bytecode
+
+    @property
+    def jumpdests(self):
+        '''
+        Return the set of pcs of the JUMPDEST instructions
+        '''
+        if self._jumpdests is None:
+            jumpdest = instruction_tables[self._fork]['JUMPDEST'].opcode
+            self._jumpdests = {pc for pc, opcode in zip(self.pcs, self.opcodes) if opcode == jumpdest}
+        return self._jumpdests
+
+    def index(self, pc):
+        '''
+            Return the index of the instruction at pc, None if no instruction starts at pc
+        '''
+        i = bisect_left(self.pcs, pc)
+        if i < len(self.pcs) and self.pcs[i] == pc:
+            return i
+        return None
+
+    def instruction(self, i):
+        '''
+            Return the Instruction at index i
+        '''
+        instruction = self._instructions[i]
+        if instruction is None:
+            opcode = self.opcodes[i]
+            pc = self.pcs[i]
+            instruction = instruction_tables[self._fork].get(opcode)
+            if instruction is None:
+                instruction = Instruction(opcode, 'INVALID', 0, 0, 0, 0, 'Unspecified invalid instruction.')
+            instruction.pc = pc
+            if instruction.has_operand:
+                instruction.operand = int.from_bytes(self._bytecode[pc + 1:pc + 1 + instruction.operand_size], 'big')
+            self._instructions[i] = instruction
+        return instruction
+
+    def instructions(self, first=0, last=None):
+        '''
+            Return the Instructions from index first to index last (included)
+        '''
+        if last is None:
+            last = len(self.pcs) - 1
+        return [self.instruction(i) for i in range(first, last + 1)]
@@ -0,0 +1,80 @@
+import multiprocessing
+
+from ..value_analysis.value_set_analysis import StackValueAnalysis
+
+# CFG of the bytecode in a worker process, without edges between two analyses
+_worker_cfg = None
+
+def _init_worker(bytecode, optimization_enabled, symbolic_stack_analysis):
+    global _worker_cfg
+    from . import CFG
+    _worker_cfg = CFG(bytecode,
+                      remove_metadata=False,
+                      analyze=False,
+                      optimization_enabled=optimization_enabled,
+                      symbolic_stack_analysis=symbolic_stack_analysis)
+    _worker_cfg.compute_basic_blocks()
+
+def _analyze_function(function):
+    '''
+        Run the stack value analysis of a function on the CFG of the worker,
+        then remove the edges of the function from the CFG, so that the
+        analysis of a function never sees the edges of another one
+    Args:
+        function (tuple): hash id and start address of the function
+    Returns:
+        (tuple): the explored basic blocks, the outgoing and incoming basic blocks
+        of every basic block and the reachable basic blocks, as start pcs
+    '''
+    key, start_addr = function
+    cfg = _worker_cfg
+    vsa = StackValueAnalysis(
+        cfg,
+        cfg.get_basic_block_at(start_addr),
+        key,
+        enable_optimization=cfg._optimization_enabled,
+        symbolic_stack_analysis=cfg._symbolic_stack_analysis
+    )
+    explored = vsa.analyze()
+
+    outgoing = []
+    incoming = []
+    reacheable = []
+    for bb in sorted(cfg.basic_blocks, key=lambda bb: bb.start.pc):
+        if key in bb.outgoing_basic_blocks_as_dict:
+            outgoing.append((bb.start.pc, [son.start.pc for son in bb.remove_outgoing_basic_blocks(key)]))
+        if key in bb.incoming_basic_blocks_as_dict:
+            incoming.append((bb.start.pc, [father.start.pc for father in bb.remove_incoming_basic_blocks(key)]))
+        if key in bb.reacheable:
+            reacheable.append(bb.start.pc)
+            bb.reacheable = [k for k in bb.reacheable if k != key]
+    return explored, outgoing, incoming, reacheable
+
+def analyze_functions(cfg, functions, workers):
+    '''
+        Run the stack value analysis of the functions in a pool of worker processes
+        and add their edges to the basic blocks of the CFG, in the order of the functions.
+        Every function is analyzed without the edges of the other functions, so the CFG
+        does not depend on the number of workers or on which worker analyzes a function.
+    Args:
+        cfg (CFG)
+        functions (list): Function
+        workers (int): number of worker processes
+    Returns:
+        (list): the explored basic blocks of every function, as start pcs
+    '''
+    with multiprocessing.Pool(workers, _init_worker, (cfg.bytecode, cfg._optimization_enabled, cfg._symbolic_stack_analysis)) as pool:
+        results = pool.map(_analyze_function, [(function.hash_id, function.start_addr) for function in functions], chunksize=1)
+
+    basic_blocks = cfg._basic_blocks
+    for function, (_, outgoing, incoming, reacheable) in zip(functions, results):
+        key = function.hash_id
+        for start, sons in outgoing:
+            for son in sons:
+                basic_blocks[start].add_outgoing_basic_block(basic_blocks[son], key)
+        for start, fathers in incoming:
+            for father in fathers:
+                basic_blocks[start].add_incoming_basic_block(basic_blocks[father], key)
+        for start in reacheable:
+            basic_blocks[start].reacheable.append(key)
+    return [explored for explored, _, _, _ in results]
@@ -0,0 +1,18 @@
+'''
+    Regenerate known_hashes.bin from the function signatures of known_hashes.py
+
+    Usage (from the elysium directory):
+        python -m modules.evm_cfg_builder.known_hashes.build_index
+'''
+import sys
+
+from .index import KNOWN_HASHES_INDEX, write_index
+
+def main():
+    from .known_hashes import known_hashes
+    path = sys.argv[1] if len(sys.argv) > 1 else KNOWN_HASHES_INDEX
+    write_index(known_hashes, path)
+    print('Wrote', len(known_hashes), 'function signatures to', path)
+
+if __name__ == '__main__':
+    main()
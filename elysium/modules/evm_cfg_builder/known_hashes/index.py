@@ -0,0 +1,106 @@
+import os
+import mmap
+import struct
+import logging
+
+logger = logging.getLogger("evm-cfg-builder")
+
+# Index of the function signatures, built from known_hashes.py by build_index.py
+KNOWN_HASHES_INDEX = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'known_hashes.bin')
+
+# The index starts with a header (magic, number of records), followed by the records
+# (selector, offset of the signature) sorted by selector, followed by the signatures,
+# each one terminated by a null byte
+MAGIC = b'EKH1'
+HEADER = struct.Struct('>4sI')
+RECORD = struct.Struct('>II')
+
+def write_index(hashes, path=KNOWN_HASHES_INDEX):
+    '''
+        Write the index of a dict of function signatures by selector
+    '''
+    selectors = sorted(hashes)
+    offset = HEADER.size + RECORD.size * len(selectors)
+    records = []
+    signatures = []
+    for selector in selectors:
+        signature = hashes[selector].encode('utf-8') + b'\0'
+        records.append(RECORD.pack(selector, offset))
+        signatures.append(signature)
+        offset += len(signature)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(selectors)))
+        f.write(b''.join(records))
+        f.write(b''.join(signatures))
+    os.replace(path + '.tmp', path)
+
+class KnownHashes(object):
+    '''
+        Function signatures by selector. The index is memory-mapped on the
+        first lookup and binary searched, so only the pages of the records
+        and signatures that are looked up are read. Signatures added at
+        runtime are kept in memory.
+    '''
+
+    def __init__(self, path=KNOWN_HASHES_INDEX):
+        self._path = path
+        self._index = None
+        self._count = 0
+        self._added = {}
+
+    def _open(self):
+        if self._index is None:
+            self._index = b''
+            try:
+                with open(self._path, 'rb') as f:
+                    index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, count = HEADER.unpack_from(index, 0)
+                if magic != MAGIC:
+                    raise ValueError('invalid magic {}'.format(magic))
+                self._index = index
+                self._count = count
+            except (IOError, OSError, ValueError, struct.error) as e:
+                logger.warning('Function signatures could not be loaded: %s', e)
+        return self._index
+
+    def _lookup(self, selector):
+        index = self._open()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            record_selector, offset = RECORD.unpack_from(index, HEADER.size + RECORD.size * middle)
+            if record_selector < selector:
+                low = middle + 1
+            elif record_selector > selector:
+                high = middle
+            else:
+                return index[offset:index.find(b'\0', offset)].decode('utf-8')
+        return None
+
+    def get(self, selector, default=None):
+        if selector in self._added:
+            return self._added[selector]
+        if not isinstance(selector, int) or not 0 <= selector <= 0xffffffff:
+            return default
+        signature = self._lookup(selector)
+        if signature is None:
+            return default
+        return signature
+
+    def __contains__(self, selector):
+        return self.get(selector) is not None
+
+    def __getitem__(self, selector):
+        signature = self.get(selector)
+        if signature is None:
+            raise KeyError(selector)
+        return signature
+
+    def __setitem__(self, selector, signature):
+        self._added[selector] = signature
+
+    def __len__(self):
+        self._open()
+        return self._count + len(self._added)
+
+known_hashes = KnownHashes()
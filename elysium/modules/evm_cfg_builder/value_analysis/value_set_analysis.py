@@ -1,5 +1,7 @@
 import itertools
 
+from collections import deque
+
 from ..cfg.function import Function
 
 BASIC_BLOCK_END = ['STOP',
@@ -183,11 +185,13 @@ class Stack(object):
     def copy_stack(self, stack):
         '''
             Copy the given stack
+        The elements are shared, AbsStackElem are never modified once
+        they are on a stack
 
         Args:
             Stack: stack to copy
         '''
-        self._elems = [x.get_copy() for x in stack.get_elems()]
+        self._elems = list(stack.get_elems())
 
     def push(self, elem):
         '''
@@ -287,7 +291,7 @@ class Stack(object):
         else:
             longStack = elems2
             shortStack = elems1
-        longStack = [x.get_copy() for x in longStack]
+        longStack = list(longStack)
         # Merge elements
         for i in range(0, len(shortStack)):
             longStack[-(i+1)] = longStack[-(i+1)].merge(shortStack[-(i+1)])
@@ -342,6 +346,9 @@ class StackValueAnalysis(object):
     After each convergence, we add the new branches and re-analyze the function.
     The exploration is bounded in case the analysis is lost.
 
+    The transfer function of a basic block updates a single stack in place,
+    stacks are only copied at the start of a basic block and where paths merge.
+
     IF enable_optimization is enabled, only keep track of valid destination
     '''
 
@@ -390,15 +397,17 @@ class StackValueAnalysis(object):
         self._key = key
 
         self._basic_blocks_explored = []
+        self._basic_blocks_explored_set = set()
 
         self._to_explore = {self._entry_point}
 
-        self._outgoing_basic_blocks = []
+        # bbs to analyze, the next one is at the right end
+        self._outgoing_basic_blocks = deque()
 
         self._authorized_values = None
 
         if enable_optimization:
-            self._authorized_values = get_valid_destination(cfg.instructions)
+            self._authorized_values = cfg.instruction_table.jumpdests
 
         self._symbolic_stack_analysis = symbolic_stack_analysis
 
@@ -417,19 +426,15 @@ class StackValueAnalysis(object):
         Returns:
             bool: True if the instruction is a JUMPDEST
         '''
-        ins = self.cfg.get_instruction_at(addr)
-        if ins is None:
-            return False
-
-        return ins.name == 'JUMPDEST'
+        return addr in self.cfg.instruction_table.jumpdests
 
     def stub(self, ins, addr, stack):
         return (False, None)
 
-    def _transfer_func_ins(self, ins, addr, stackIn):
-        stack = Stack(self.authorized_values)
-        stack.copy_stack(stackIn)
-
+    def _transfer_func_ins(self, ins, addr, stack):
+        '''
+            Apply the instruction to the stack. The stack is modified
+        '''
         (is_stub, stub_ret) = self.stub(ins, addr, stack)
         if is_stub:
             return stub_ret
@@ -469,33 +474,40 @@ class StackValueAnalysis(object):
             The last jump value is returned, as the JUMP/JUMPI instruction will
             pop the value before returning the function
 
-            self.stacksOut will contain the stack of last instruction of the
-            basic block.
+            self.stacksIn and self.stacksOut will contain the stacks before
+            and after the last instruction of the basic block.
         Args:
             bb
-            stack (Stack)
+            stack (Stack): modified by the basic block
         Returns:
             AbsStackElem: last jump computed.
         '''
         last_jump = None
 
-        if not bb.start.pc in self._basic_blocks_explored:
+        if not bb.start.pc in self._basic_blocks_explored_set:
+            self._basic_blocks_explored_set.add(bb.start.pc)
             self._basic_blocks_explored.append(bb.start.pc)
 
-        ins = None
-        for ins in bb.instructions:
-            addr = ins.pc
-            self.stacksIn[addr] = stack
-            stack = self._transfer_func_ins(ins, addr, stack)
+        instructions = bb.instructions
+        if not instructions:
+            return last_jump
+
+        for ins in instructions[:-1]:
+            stack = self._transfer_func_ins(ins, ins.pc, stack)
 
-            self.stacksOut[addr] = stack
+        ins = instructions[-1]
+        addr = ins.pc
+        stackIn = Stack(self.authorized_values)
+        stackIn.copy_stack(stack)
+        self.stacksIn[addr] = stackIn
+        stack = self._transfer_func_ins(ins, addr, stack)
+        self.stacksOut[addr] = stack
 
-        if ins:
-            # if we are going to do a jump / jumpi
-            # get the destination
-            op = ins.name
-            if op == 'JUMP' or op == 'JUMPI':
-                last_jump = stack.top()
+        # if we are going to do a jump / jumpi
+        # get the destination
+        op = ins.name
+        if op == 'JUMP' or op == 'JUMPI':
+            last_jump = stack.top()
         return last_jump
 
     def _transfer_func_bb(self, bb, init=False):
@@ -526,10 +538,9 @@ class StackValueAnalysis(object):
             prev_stack = None
 
 
+        stack = Stack(self.authorized_values)
         if init and self.initStack:
-            stack = self.initStack
-        else:
-            stack = Stack(self.authorized_values)
+            stack.copy_stack(self.initStack)
 
         # Merge all the stack incoming_basic_blocks
         # We merge only father that were already analyzed
@@ -589,8 +600,10 @@ class StackValueAnalysis(object):
                 converged = True
 
         if not converged:
-            new_outgoing_basic_blocks = bb.outgoing_basic_blocks(self._key)
-            self._outgoing_basic_blocks = new_outgoing_basic_blocks + self._outgoing_basic_blocks
+            # The sons are analyzed once all the bbs already waiting were
+            # analyzed. Changing this order changes which bbs reach
+            # MAXEXPLORATION in loops that never converge
+            self._outgoing_basic_blocks.extendleft(reversed(bb.outgoing_basic_blocks(self._key)))
 
     def add_branches(self, src, dst):
         '''
@@ -617,7 +630,9 @@ class StackValueAnalysis(object):
         """
         init = False
 
-        bb = self._to_explore.pop()
+        # Explore the targets in order of their address
+        bb = min(self._to_explore, key=lambda bb: -1 if bb is None else bb.start.pc)
+        self._to_explore.remove(bb)
 
         if bb:
             if self._symbolic_stack_analysis:
@@ -676,58 +691,11 @@ class StackValueAnalysis(object):
         }
 
     def perform_symbolic_stack_analysis(self, basic_block):
-        stack = list()
-        for i in basic_block.instructions:
-            if i.name.startswith("PUSH"):
-                stack.append(i.operand)
-            elif i.name.startswith("DUP"):
-                n = int(i.name[3:])
-                if len(stack) >= n:
-                    stack.append(stack[-n])
-                else:
-                    stack.append(None)
-            elif i.name.startswith("SWAP"):
-                n = int(i.name[4:])
-                if len(stack) > 0:
-                    if len(stack) >= (n+1):
-                        elem = stack[-1-n]
-                        top = stack[-1]
-                        stack[-1] = elem
-                        stack[-1-n] = top
-                    # if we swap more than the size of the stack,
-                    # we can assume that elements are missing on the stack
-                    else:
-                        top = stack[-1]
-                        missing_elems = n - len(stack) + 1
-                        for _ in range(0, missing_elems):
-                            stack.insert(0, None)
-                        elem = stack[-1-n]
-                        stack[-1] = elem
-                        stack[-1-n] = top
-            elif i.name == "AND":
-                try:
-                    a = stack.pop()
-                except:
-                    a = None
-                try:
-                    b = stack.pop()
-                except:
-                    b = None
-                if a is None or b is None:
-                    stack.append(None)
-                else:
-                    stack.append(a & b)
-            elif i.name in ["JUMP", "JUMPI"]:
-                return stack
-            else:
-                for _ in range(i.pops):
-                    try:
-                        stack.pop()
-                    except:
-                        pass
-                for _ in range(i.pushes):
-                    stack.append(None)
-        return stack
+        '''
+            The symbolic stack only depends on the instructions of the
+            basic block, it is computed once (see BasicBlock.symbolic_stack)
+        '''
+        return basic_block.symbolic_stack
 
     def analyze(self):
         self.cfg.compute_simple_edges(self._key)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from pyevmasm.evmasm import instruction_tables
+
+from .bytecode_rewriter import TERMINATING_MNEMONICS, get_label, get_reverse_post_order
+
+# Forks with access lists (EIP-2929): the base costs of Istanbul, storage slots are cold until accessed
+ACCESS_LIST_FORKS = ["berlin", "london", "paris", "shanghai", "cancun"]
+FORKS = ["frontier", "homestead", "tangerine_whistle", "spurious_dragon", "byzantium", "constantinople", "petersburg", "istanbul"] + ACCESS_LIST_FORKS
+
+# Cost of a cold storage slot and of a warm one from Berlin on
+COLD_SLOAD_COST = 2100
+WARM_STORAGE_READ_COST = 100
+
+def get_sstore_costs(fork):
+    '''
+        SSTORE costs of a fork, without refunds and without the cost of a cold slot:
+        "set" writes a value that is not zero to a slot that is zero since the beginning of the transaction,
+        "reset" overwrites a value that was not changed by the transaction and "restore" writes back the
+        value a slot had at the beginning of the transaction, after the transaction changed it (e.g. a
+        reentrancy lock that is released).
+    Returns:
+        dict: the costs of "set", "reset" and "restore".
+    '''
+    if fork in ACCESS_LIST_FORKS:
+        # EIP-2929 and EIP-3529
+        return {"set": 20000, "reset": 5000 - COLD_SLOAD_COST, "restore": WARM_STORAGE_READ_COST}
+    if fork == "istanbul":
+        # EIP-2200
+        return {"set": 20000, "reset": 5000, "restore": 800}
+    if fork == "constantinople":
+        # EIP-1283
+        return {"set": 20000, "reset": 5000, "restore": 200}
+    return {"set": 20000, "reset": 5000, "restore": 5000}
+
+class GasTable(object):
+    '''
+        Static gas costs of the instructions of a fork: the base cost of every instruction and the costs of
+        SLOAD and SSTORE. Dynamic costs (memory expansion, copied bytes, exponent bytes, calls) are not
+        counted, they are the same in the original and in the patched code.
+    '''
+
+    def __init__(self, fork):
+        if not fork in FORKS:
+            raise ValueError("Unknown fork '"+str(fork)+"', supported forks: "+", ".join(FORKS))
+        self.fork = fork
+        self.access_lists = fork in ACCESS_LIST_FORKS
+        self.sstore_costs = get_sstore_costs(fork)
+        self._base_costs = dict()
+
+    def get_base_cost(self, instruction):
+        if not instruction.opcode in self._base_costs:
+            instruction_table = instruction_tables["istanbul" if self.access_lists else self.fork]
+            try:
+                fee = instruction_table[instruction.opcode].fee
+            except KeyError:
+                # Not an instruction of the fork (e.g. INVALID)
+                fee = instruction.fee
+            # Accounts are assumed to be warm, their cost is the same in the original and in the patched code
+            if self.access_lists and instruction.mnemonic in ["BALANCE", "EXTCODESIZE", "EXTCODECOPY", "EXTCODEHASH", "CALL", "CALLCODE", "DELEGATECALL", "STATICCALL"]:
+                fee = WARM_STORAGE_READ_COST
+            self._base_costs[instruction.opcode] = fee
+        return self._base_costs[instruction.opcode]
+
+    def get_cost(self, instructions, i, accessed_slots):
+        '''
+            Returns the cost of the instruction at position i. The slot of an SLOAD or SSTORE and the value of
+            an SSTORE are known if they are pushed right before it, accessed_slots is the set of the known slots
+            that were already accessed. Slots written by patches are free storage locations, so they are zero at
+            the beginning of the transaction: writing a value that is not zero sets them, writing zero restores
+            them. Other SSTOREs are counted as resets and unknown slots as cold.
+        '''
+        instruction = instructions[i]
+        if not instruction.mnemonic in ["SLOAD", "SSTORE"]:
+            return self.get_base_cost(instruction)
+        slot = None
+        if i > 0 and instructions[i - 1].mnemonic.startswith("PUSH"):
+            slot = instructions[i - 1].operand
+        cold = self.access_lists and not slot in accessed_slots
+        if slot is not None:
+            accessed_slots.add(slot)
+        if instruction.mnemonic == "SLOAD":
+            if not self.access_lists:
+                return self.get_base_cost(instruction)
+            return COLD_SLOAD_COST if cold else WARM_STORAGE_READ_COST
+        if slot is None or instruction.pc[1] != 0:
+            return self.sstore_costs["reset"] + (COLD_SLOAD_COST if cold else 0)
+        value = None
+        if i > 1 and instructions[i - 2].mnemonic.startswith("PUSH"):
+            value = instructions[i - 2].operand
+        if value == 0:
+            return self.sstore_costs["restore"]
+        return self.sstore_costs["set"] + (COLD_SLOAD_COST if cold else 0)
+
+def _get_jump_target(instructions, i):
+    ''' Returns the position of the JUMPDEST after position i that the PUSH at position i - 1 refers to, None if there is none. '''
+    if i == 0 or not instructions[i - 1].mnemonic.startswith("PUSH"):
+        return None
+    label = get_label(instructions[i - 1])
+    for j in range(i + 1, len(instructions)):
+        if instructions[j].mnemonic == "JUMPDEST" and instructions[j].pc[1] == 0 and get_label(instructions[j]) == label:
+            return j
+    return None
+
+def get_passing_gas(instructions, gas_table, shared_blocks=None, i=0, accessed_slots=None):
+    '''
+        Returns the minimum and the maximum gas of the executions of a sequence of instructions from position i on
+        on which the checks inserted by patches pass. A check passes if it jumps over its error handling sequence,
+        or if it does not jump to a shared block (shared error handlers). Calls of shared subroutines (outlined
+        patches) add the gas of the subroutine. Other conditional jumps inserted by patches are taken and not taken.
+    Returns:
+        int: the minimum gas.
+        int: the maximum gas.
+    '''
+    shared_blocks = shared_blocks or dict()
+    if accessed_slots is None:
+        accessed_slots = set()
+    gas = 0
+    while i < len(instructions):
+        instruction = instructions[i]
+        gas += gas_table.get_cost(instructions, i, accessed_slots)
+        if instruction.mnemonic == "JUMPI" and instruction.pc[1] == 0:
+            j = _get_jump_target(instructions, i)
+            if j is not None:
+                if instructions[j - 1].mnemonic in TERMINATING_MNEMONICS:
+                    i = j
+                    continue
+                taken = get_passing_gas(instructions, gas_table, shared_blocks, j, set(accessed_slots))
+                not_taken = get_passing_gas(instructions, gas_table, shared_blocks, i + 1, accessed_slots)
+                return gas + min(taken[0], not_taken[0]), gas + max(taken[1], not_taken[1])
+        elif instruction.mnemonic == "JUMP" and instruction.pc[1] == 0 and i > 0 and getattr(instructions[i - 1], "shared_label", None) in shared_blocks and i + 1 < len(instructions):
+            subroutine = get_passing_gas(shared_blocks[instructions[i - 1].shared_label], gas_table, shared_blocks, 0, accessed_slots)
+            rest = get_passing_gas(instructions, gas_table, shared_blocks, i + 1, accessed_slots)
+            return gas + subroutine[0] + rest[0], gas + subroutine[1] + rest[1]
+        elif instruction.mnemonic in TERMINATING_MNEMONICS:
+            break
+        i += 1
+    return gas, gas
+
+def get_basic_block_gas(cfg, gas_table):
+    '''
+    Returns:
+        dict: the minimum and maximum gas of the passing executions of every basic block (see get_passing_gas).
+    '''
+    shared_blocks = getattr(cfg, "shared_blocks", None) or dict()
+    return {basic_block: get_passing_gas(basic_block.instructions, gas_table, shared_blocks) for basic_block in cfg.basic_blocks}
+
+def estimate_gas_overhead(cfg, original_gas, patched_gas):
+    '''
+        Estimates the gas overhead of the patches for every function of a patched CFG, from the gas of its basic
+        blocks before and after patching (see get_basic_block_gas). The overhead of a path is the sum of the
+        overheads of its basic blocks, loops are counted once. Refunds are not subtracted, the dispatcher is a
+        function of its own, its overhead is paid by every call.
+    Returns:
+        list: dicts with the selector (None for the dispatcher and the fallback function), the name, the number
+        of patched basic blocks, the minimum overhead of the paths through a patched basic block and the maximum
+        overhead of all paths, for the functions with patched basic blocks.
+    '''
+    functions = list()
+    for function in cfg.functions:
+        key = function.key
+        order = get_reverse_post_order(function.entry, key)
+        priority = {basic_block: i for i, basic_block in enumerate(order)}
+        minimum, maximum = dict(), dict()
+        patched_basic_blocks = 0
+        for basic_block in reversed(order):
+            low = patched_gas[basic_block][0] - original_gas[basic_block][0]
+            high = patched_gas[basic_block][1] - original_gas[basic_block][1]
+            # Inserted instructions have no original pc, only the first instruction of the code is at 0 as well
+            patched = any(instruction.pc[1] == 0 and instruction.pc[0] != 0 for instruction in basic_block.instructions)
+            patched_basic_blocks += patched
+            # Back edges are ignored
+            successors = [successor for successor in basic_block.outgoing_basic_blocks(key) if priority.get(successor, -1) > priority[basic_block]]
+            any_minimum = min([minimum[successor][0] for successor in successors] or [0])
+            throughs = [minimum[successor][1] for successor in successors if minimum[successor][1] is not None]
+            if patched:
+                through = low + any_minimum
+            elif throughs:
+                through = low + min(throughs)
+            else:
+                through = None
+            minimum[basic_block] = (low + any_minimum, through)
+            maximum[basic_block] = high + max([maximum[successor] for successor in successors] or [0])
+        if patched_basic_blocks == 0:
+            continue
+        selector = None
+        if function.hash_id >= 0:
+            selector = "0x{:08x}".format(function.hash_id)
+        functions.append({
+            "selector": selector,
+            "name": function.name,
+            "patched_basic_blocks": patched_basic_blocks,
+            "min_gas_overhead": minimum[function.entry][1],
+            "max_gas_overhead": maximum[function.entry]
+        })
+    return functions
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from .bytecode_rewriter import TERMINATING_MNEMONICS, Patch, add_shared_block, assemble_patch_sequence
+
+# Labels are pushed with two bytes, runtime bytecodes are smaller than 64 KiB (EIP-170 limits them to 24 KiB)
+LABEL_PUSH_SIZE = 3
+
+# A call site is PUSH_jump_loc_1 PUSH_shared_<subroutine> JUMP JUMPDEST_jump_loc_1
+CALL_SITE_SEQUENCE = "PUSH_jump_loc_1 PUSH_shared_{} JUMP JUMPDEST_jump_loc_1"
+CALL_SITE_SIZE = 2 * LABEL_PUSH_SIZE + 2
+
+# Gas of a call: PUSH PUSH JUMP JUMPDEST at the call site and JUMPDEST JUMP in the subroutine
+CALL_GAS = 3 + 3 + 8 + 1 + 1 + 8
+
+def get_sequence_size(sequence):
+    """ Returns the size in bytes of an assembled patch sequence, labels are counted as two byte pushes. """
+    size = 0
+    for code in assemble_patch_sequence(sequence):
+        if isinstance(code, str):
+            size += 1 if code.startswith("JUMPDEST") else LABEL_PUSH_SIZE
+        else:
+            size += code.size
+    return size
+
+def get_subroutine_sequence(sequence):
+    """ Returns the sequence of a subroutine that executes a patch sequence while the return address is on
+    top of the stack: the DUPs and SWAPs that reach below the values pushed by the sequence are moved one
+    slot deeper. The subroutine jumps to the return address at its end.
+
+    Returns:
+        str: the sequence of the subroutine, None if the sequence cannot be outlined, i.e. if it is not
+        stack neutral, pops values that were on the stack before it or uses jumps other than to its own
+        labels and to shared blocks (e.g. shared error handlers, see share_error_handlers).
+    """
+    height = 0
+    label_heights = dict()
+    reachable = True
+    previous = None
+    codes = list()
+    for code in sequence.split(" "):
+        if not code:
+            continue
+        if code.startswith("JUMPDEST_jump_loc"):
+            label = code.replace("JUMPDEST_", "")
+            if not reachable:
+                if not label in label_heights:
+                    return None
+                height = label_heights[label]
+            elif label_heights.setdefault(label, height) != height:
+                return None
+            reachable = True
+        elif not reachable:
+            return None
+        elif code.startswith("PUSH_jump_loc") or code.startswith("PUSH_shared_"):
+            height += 1
+        else:
+            instruction = assemble_patch_sequence(code)[0]
+            mnemonic = instruction.mnemonic
+            if mnemonic.startswith("DUP"):
+                n = int(mnemonic[len("DUP"):])
+                if n > height:
+                    if n == 16:
+                        return None
+                    code = "DUP"+str(n + 1)
+            elif mnemonic.startswith("SWAP"):
+                n = int(mnemonic[len("SWAP"):])
+                if height == 0:
+                    return None
+                if n + 1 > height:
+                    if n == 16:
+                        return None
+                    code = "SWAP"+str(n + 1)
+            elif mnemonic == "JUMPI":
+                if previous is None or not (previous.startswith("PUSH_jump_loc") or previous.startswith("PUSH_shared_")):
+                    return None
+            elif mnemonic == "JUMP":
+                if previous is None or not previous.startswith("PUSH_shared_"):
+                    return None
+            elif mnemonic == "PC":
+                return None
+            # DUPs and SWAPs are modeled as popping and pushing the values they reach
+            if instruction.pops > height and not mnemonic.startswith("DUP") and not mnemonic.startswith("SWAP"):
+                return None
+            height += instruction.pushes - instruction.pops
+            if mnemonic == "JUMPI" and previous.startswith("PUSH_jump_loc") and label_heights.setdefault(previous.replace("PUSH_", ""), height) != height:
+                return None
+            if mnemonic in TERMINATING_MNEMONICS:
+                reachable = False
+        codes.append(code)
+        previous = code
+    if not reachable or height != 0:
+        return None
+    codes.append("JUMP")
+    return " ".join(codes)
+
+def outline_patches(cfg, patch_plan, min_bytes_saved=1):
+    """ Outlines the identical patches of a patch plan: every distinct insert sequence that is inserted at
+    several addresses is added once to the CFG as a shared subroutine (see get_subroutine_sequence), and
+    the patches are replaced by calls to it. A sequence is only outlined if this saves at least
+    min_bytes_saved bytes, every call costs CALL_GAS more gas than the inlined sequence.
+
+    Returns:
+        list: the patch plan with the calls instead of the outlined patches.
+        list: the outlined subroutines, dicts with the subroutine label, the sequence, the addresses of
+        the call sites, the bytes saved and the extra gas per call.
+    """
+    addresses = dict()
+    for address, patch in patch_plan:
+        if patch["delete"] == "" and not patch["constructor"] and getattr(patch, "instructions", None) is not None:
+            addresses.setdefault(patch["insert"], list()).append(address)
+
+    calls = dict()
+    subroutines = list()
+    for sequence in addresses:
+        if len(addresses[sequence]) < 2:
+            continue
+        subroutine_sequence = get_subroutine_sequence(sequence)
+        if subroutine_sequence is None:
+            continue
+        inlined_size = len(addresses[sequence]) * get_sequence_size(sequence)
+        outlined_size = len(addresses[sequence]) * CALL_SITE_SIZE + 1 + get_sequence_size(subroutine_sequence)
+        if inlined_size - outlined_size < min_bytes_saved:
+            continue
+        label = "subroutine_"+str(len(subroutines))
+        add_shared_block(cfg, label, subroutine_sequence)
+        calls[sequence] = CALL_SITE_SEQUENCE.format(label)
+        subroutines.append({
+            "subroutine": label,
+            "sequence": sequence,
+            "call_sites": addresses[sequence],
+            "bytes_saved": inlined_size - outlined_size,
+            "extra_gas_per_call": CALL_GAS
+        })
+
+    outlined_patch_plan = list()
+    for address, patch in patch_plan:
+        if patch["insert"] in calls and patch["delete"] == "" and not patch["constructor"]:
+            call = Patch(patch, assemble_patch_sequence(calls[patch["insert"]]))
+            call["insert"] = calls[patch["insert"]]
+            patch = call
+        outlined_patch_plan.append((address, patch))
+    return outlined_patch_plan, subroutines
+
+def _find_error_handlers(codes):
+    """ Returns the (i, j) positions of the error handlers in a list of patch codes: a check
+    PUSH_jump_loc_k JUMPI that jumps over an error handling sequence to JUMPDEST_jump_loc_k, where
+    codes[i] is the PUSH and codes[j] the JUMPDEST. The label must only be used by this check and the
+    error handling sequence must end the execution. """
+    error_handlers = list()
+    for i in range(len(codes) - 1):
+        if codes[i].startswith("PUSH_jump_loc") and codes[i + 1] == "JUMPI" and codes.count(codes[i]) == 1:
+            jumpdest = codes[i].replace("PUSH_", "JUMPDEST_")
+            if not jumpdest in codes[i + 2:]:
+                continue
+            j = codes.index(jumpdest, i + 2)
+            error_handling_sequence = codes[i + 2:j]
+            if not error_handling_sequence or any("_jump_loc" in code or code.startswith("PUSH_shared_") for code in error_handling_sequence):
+                continue
+            if assemble_patch_sequence(error_handling_sequence[-1])[0].mnemonic in TERMINATING_MNEMONICS:
+                error_handlers.append((i, j))
+    return error_handlers
+
+def share_error_handlers(cfg, patch_plan):
+    """ Emits every distinct error handling sequence of a patch plan once, as a shared block, instead of
+    inlining it into every patch. The check before an error handling sequence is inverted to jump to the
+    shared block: an ISZERO before it is removed or one is added, so the path that does not fail is not
+    longer than with the inlined sequence. A sequence is only shared if this makes the code smaller.
+
+    Returns:
+        list: the patch plan with the shared error handlers.
+        list: the shared error handlers, dicts with the label, the sequence, the addresses of the patches
+        that jump to it and the bytes saved compared to the inlined sequences.
+    """
+    bytes_saved = dict()
+    addresses = dict()
+    for address, patch in patch_plan:
+        if patch["constructor"] or getattr(patch, "instructions", None) is None:
+            continue
+        codes = patch["insert"].split(" ")
+        for i, j in _find_error_handlers(codes):
+            error_handling_sequence = " ".join(codes[i + 2:j])
+            # The inlined sequence and its JUMPDEST are removed, the ISZERO is removed or added
+            saved = get_sequence_size(error_handling_sequence) + 1 + (1 if i > 0 and codes[i - 1] == "ISZERO" else -1)
+            bytes_saved[error_handling_sequence] = bytes_saved.get(error_handling_sequence, 0) + saved
+            addresses.setdefault(error_handling_sequence, list()).append(address)
+
+    labels = dict()
+    error_handlers = list()
+    for error_handling_sequence in addresses:
+        # The shared block is the sequence with a JUMPDEST
+        saved = bytes_saved[error_handling_sequence] - get_sequence_size(error_handling_sequence) - 1
+        if saved <= 0:
+            continue
+        labels[error_handling_sequence] = "error_handler_"+str(len(error_handlers))
+        add_shared_block(cfg, labels[error_handling_sequence], error_handling_sequence)
+        error_handlers.append({
+            "error_handler": labels[error_handling_sequence],
+            "sequence": error_handling_sequence,
+            "call_sites": addresses[error_handling_sequence],
+            "bytes_saved": saved
+        })
+
+    shared_patch_plan = list()
+    for address, patch in patch_plan:
+        if not patch["constructor"] and getattr(patch, "instructions", None) is not None:
+            codes = patch["insert"].split(" ")
+            shared_codes = list()
+            k = 0
+            for i, j in _find_error_handlers(codes):
+                error_handling_sequence = " ".join(codes[i + 2:j])
+                if not error_handling_sequence in labels:
+                    continue
+                shared_codes += codes[k:i]
+                if shared_codes and shared_codes[-1] == "ISZERO":
+                    shared_codes.pop()
+                else:
+                    shared_codes.append("ISZERO")
+                shared_codes += ["PUSH_shared_"+labels[error_handling_sequence], "JUMPI"]
+                k = j + 1
+            if k > 0:
+                shared_codes += codes[k:]
+                shared_patch = Patch(patch, assemble_patch_sequence(" ".join(shared_codes)))
+                shared_patch["insert"] = " ".join(shared_codes)
+                patch = shared_patch
+        shared_patch_plan.append((address, patch))
+    return shared_patch_plan, error_handlers
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+
+from .bytecode_rewriter import Patch, assemble_patch_sequence
+
+TEMPLATES_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "templates")
+
+# Placeholders in the insert sequences of the templates that are filled when a patch is instantiated
+PLACEHOLDERS = ["free_storage_location", "error_handling_sequence", "integer_bounds", "push_int_max", "push_int_min"]
+
+class PatchTemplate(object):
+    """ A patch parsed from one line of a template file. Its insert sequence is split into segments of
+    codes, which are assembled when the template is loaded, and placeholders, which are assembled when
+    the patch is instantiated. """
+
+    def __init__(self, template):
+        self.template = template
+        self.segments = list()
+        codes = list()
+        for code in template["insert"].split(" "):
+            if code in PLACEHOLDERS:
+                if codes:
+                    self.segments.append((" ".join(codes), assemble_patch_sequence(" ".join(codes))))
+                    codes = list()
+                self.segments.append((code, None))
+            else:
+                codes.append(code)
+        if codes:
+            self.segments.append((" ".join(codes), assemble_patch_sequence(" ".join(codes))))
+
+    def instantiate(self, values=None):
+        """ Returns the patch with its placeholders replaced by the sequences in values. Placeholders
+        without a value are left in the insert sequence and the patch is not assembled. """
+        if values is None:
+            values = dict()
+        insert = list()
+        instructions = list()
+        for sequence, assembled_sequence in self.segments:
+            if assembled_sequence is None:
+                if sequence in values:
+                    sequence = values[sequence]
+                    assembled_sequence = assemble_patch_sequence(sequence)
+                else:
+                    instructions = None
+            insert.append(sequence)
+            if instructions is not None:
+                instructions += assembled_sequence
+        patch = Patch(self.template, instructions)
+        patch["insert"] = " ".join(insert)
+        return patch
+
+_patch_templates = dict()
+
+def get_patch_templates(name):
+    """ Returns the patch templates of a template file (e.g. "reentrancy_patch"). Every file is parsed
+    only once. """
+    if not name in _patch_templates:
+        with open(os.path.join(TEMPLATES_DIRECTORY, name+".json"), "r") as f:
+            lines = filter(None, (line.rstrip() for line in f))
+            _patch_templates[name] = [PatchTemplate(json.loads(line)) for line in lines]
+    return _patch_templates[name]
+
+def instantiate_patches(name, values=None):
+    """ Returns the patches of a template file with their placeholders replaced by the sequences in values. """
+    return [template.instantiate(values) for template in get_patch_templates(name)]
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from .bytecode_rewriter import TERMINATING_MNEMONICS, get_label
+
+# Instructions that change the state or whose result differs between two identical guards
+SIDE_EFFECT_MNEMONICS = ["SSTORE", "MSTORE", "MSTORE8", "CALLDATACOPY", "CODECOPY", "EXTCODECOPY", "RETURNDATACOPY", "LOG0", "LOG1", "LOG2", "LOG3", "LOG4", "CREATE", "CREATE2", "CALL", "CALLCODE", "DELEGATECALL", "STATICCALL", "SELFDESTRUCT", "GAS", "PC", "MSIZE"]
+
+def _is_inserted(instruction):
+    return isinstance(instruction.pc, tuple) and instruction.pc[1] == 0
+
+def _get_guard_length(instructions, i):
+    """ Returns the length of the guard that starts at position i, None if there is none. A guard computes
+    a condition without side effects and without changing the stack below it, then jumps if the condition
+    holds with PUSH <label> JUMPI. If the label is a JUMPDEST right after an error handling sequence that
+    ends the execution, the guard includes the sequence and the JUMPDEST. """
+    height = 0
+    k = i
+    while k < len(instructions):
+        instruction = instructions[k]
+        mnemonic = instruction.mnemonic
+        if mnemonic == "JUMPI":
+            break
+        if mnemonic == "JUMPDEST" or mnemonic in TERMINATING_MNEMONICS or mnemonic in SIDE_EFFECT_MNEMONICS:
+            return None
+        if mnemonic.startswith("DUP"):
+            height += 1
+        elif mnemonic.startswith("SWAP"):
+            if int(mnemonic[len("SWAP"):]) + 1 > height:
+                return None
+        else:
+            if instruction.pops > height:
+                return None
+            height += instruction.pushes - instruction.pops
+        k += 1
+    if k == len(instructions) or k == i or height != 2 or not instructions[k - 1].mnemonic.startswith("PUSH"):
+        return None
+    label = get_label(instructions[k - 1])
+    for j in range(k + 1, len(instructions)):
+        if instructions[j].mnemonic == "JUMPDEST":
+            if get_label(instructions[j]) == label and j > k + 1 and instructions[j - 1].mnemonic in TERMINATING_MNEMONICS:
+                return j - i + 1
+            break
+    return k - i + 1
+
+def _is_same_guard(instructions, i, j, length):
+    """ Returns True if the guards of the given length at the positions i and j are identical, up to the
+    label of the JUMPDEST that ends them. """
+    a, b = instructions[i:i + length], instructions[j:j + length]
+    local_label = a[-1].mnemonic == "JUMPDEST"
+    for k in range(length):
+        if a[k].mnemonic != b[k].mnemonic:
+            return False
+        if local_label and (k == length - 1 or (k + 1 < length and a[k + 1].mnemonic == "JUMPI" and get_label(a[k]) == get_label(a[-1]))):
+            continue
+        if get_label(a[k]) != get_label(b[k]):
+            return False
+    return True
+
+def _remove_double_iszero_before_jumpi(instructions, i):
+    # ISZERO ISZERO PUSH <label> JUMPI -> PUSH <label> JUMPI, JUMPI only tests for a value that is not zero
+    if [instruction.mnemonic for instruction in instructions[i:i + 2]] == ["ISZERO", "ISZERO"] and i + 3 < len(instructions) and instructions[i + 2].mnemonic.startswith("PUSH") and instructions[i + 3].mnemonic == "JUMPI":
+        return 2, list()
+    return None
+
+def _remove_triple_iszero(instructions, i):
+    # ISZERO ISZERO ISZERO -> ISZERO
+    if [instruction.mnemonic for instruction in instructions[i:i + 3]] == ["ISZERO", "ISZERO", "ISZERO"]:
+        return 3, [instructions[i + 2]]
+    return None
+
+def _remove_double_not(instructions, i):
+    # NOT NOT -> nothing
+    if [instruction.mnemonic for instruction in instructions[i:i + 2]] == ["NOT", "NOT"]:
+        return 2, list()
+    return None
+
+def _remove_dup_pop(instructions, i):
+    # DUPn POP, PUSHn POP -> nothing
+    if i + 1 < len(instructions) and (instructions[i].mnemonic.startswith("DUP") or instructions[i].mnemonic.startswith("PUSH")) and instructions[i + 1].mnemonic == "POP":
+        return 2, list()
+    return None
+
+def _remove_double_swap(instructions, i):
+    # SWAPn SWAPn -> nothing
+    if i + 1 < len(instructions) and instructions[i].mnemonic.startswith("SWAP") and instructions[i].mnemonic == instructions[i + 1].mnemonic:
+        return 2, list()
+    return None
+
+def _merge_identical_guards(instructions, i):
+    # A guard that directly follows an identical guard always passes, e.g. if a bug was reported twice
+    length = _get_guard_length(instructions, i)
+    if length is not None and _get_guard_length(instructions, i + length) == length and _is_same_guard(instructions, i, i + length, length):
+        return 2 * length, instructions[i:i + length]
+    return None
+
+# Rules of the peephole optimizer, a rule returns the number of instructions it replaces at a position and
+# the instructions that replace them, None if it does not apply. Rules only replace inserted instructions.
+PEEPHOLE_RULES = [
+    ("double_iszero_before_jumpi", _remove_double_iszero_before_jumpi),
+    ("triple_iszero", _remove_triple_iszero),
+    ("double_not", _remove_double_not),
+    ("dup_pop", _remove_dup_pop),
+    ("double_swap", _remove_double_swap),
+    ("identical_guards", _merge_identical_guards)
+]
+
+def optimize_instructions(instructions, rules=None):
+    """ Applies the rules of the peephole optimizer to a sequence of instructions until none applies anymore.
+
+    Returns:
+        list: the optimized instructions.
+        list: the names of the rules that were applied and the bytes they saved, as (rule, bytes saved) tuples.
+    """
+    instructions = list(instructions)
+    applied = list()
+    i = 0
+    while i < len(instructions):
+        for name, rule in rules or PEEPHOLE_RULES:
+            result = rule(instructions, i)
+            if result is None:
+                continue
+            length, replacement = result
+            if not all(_is_inserted(instruction) for instruction in instructions[i:i + length]):
+                continue
+            applied.append((name, sum(instruction.size for instruction in instructions[i:i + length]) - sum(instruction.size for instruction in replacement)))
+            instructions[i:i + length] = replacement
+            # A replacement can complete a pattern that started before it, e.g. a guard
+            i = -1
+            break
+        i += 1
+    return instructions, applied
+
+def optimize_patched_basic_blocks(cfg, rules=None):
+    """ Runs the peephole optimizer on every patched basic block and on every shared block of a CFG, after
+    the patches were applied and before the CFG is relocated. Only the instructions inserted by patches are
+    changed, the rewritten pcs of the remaining instructions are kept, so the labels stay the same.
+
+    Returns:
+        list: the applied rules, dicts with the rule, the original start pc of the basic block or the label of
+        the shared block and the bytes saved.
+    """
+    optimizations = list()
+    for basic_block in cfg.basic_blocks:
+        if not any(_is_inserted(instruction) for instruction in basic_block.instructions):
+            continue
+        # The first instruction of the code is at 0 as well, but it is not inserted
+        kept = 1 if basic_block.start.pc == (0, 0) else 0
+        instructions, applied = optimize_instructions(basic_block.instructions[kept:], rules)
+        if applied:
+            instructions = basic_block.instructions[:kept] + instructions
+            start = [instruction.pc[1] for instruction in instructions if not _is_inserted(instruction)][0]
+            basic_block._instructions = instructions
+            basic_block._symbolic_stack = None
+            optimizations += [{"rule": rule, "basic_block": start, "bytes_saved": bytes_saved} for rule, bytes_saved in applied]
+    shared_blocks = getattr(cfg, "shared_blocks", None) or dict()
+    for label in shared_blocks:
+        # The entry of a shared block is kept
+        instructions, applied = optimize_instructions(shared_blocks[label][1:], rules)
+        if applied:
+            shared_blocks[label] = shared_blocks[label][:1] + instructions
+            optimizations += [{"rule": rule, "basic_block": label, "bytes_saved": bytes_saved} for rule, bytes_saved in applied]
+    return optimizations
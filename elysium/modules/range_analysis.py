@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import heapq
+
+from .bytecode_rewriter import HALTING_MNEMONICS, get_reverse_post_order
+
+UINT256_MAX = 2 ** 256 - 1
+
+# Number of times the entry state of a basic block may grow before its intervals are widened to the full range
+WIDENING_THRESHOLD = 4
+
+# Maximum number of basic blocks processed per function, above that the function is not analyzed
+MAX_BASIC_BLOCK_VISITS = 20000
+
+# Instructions through which the result of an addition may be used before it is checked
+ESCAPING_MNEMONICS = ["MSTORE", "MSTORE8", "SSTORE", "SHA3", "LOG0", "LOG1", "LOG2", "LOG3", "LOG4", "CREATE", "CREATE2", "CALL", "CALLCODE", "DELEGATECALL", "STATICCALL", "RETURN", "SELFDESTRUCT", "JUMP"]
+
+UNKNOWN = (None, 0, UINT256_MAX, None)
+
+class RangeState(object):
+    '''
+        Abstract machine state at the entry of a basic block.
+
+        Stack elements are (identity, low, high, relation) tuples: the value lies in [low, high] and
+        elements with the same identity (not None) hold the same value. The identity of a computed
+        value is ("pc", pc) of the instruction that computed it. The relation of a comparison result
+        is ("lt", x, y) or ("le", x, y) for the (identity, low, high) of the elements x and y it
+        compared: the result is not zero if and only if x < y (x <= y). The stack only holds its top
+        elements, elements below are unknown. Facts are ("lt", i, j) and ("le", i, j) relations
+        between the identities i and j that hold on all paths to the basic block.
+    '''
+
+    def __init__(self, stack=(), facts=frozenset()):
+        self.stack = list(stack)
+        self.facts = frozenset(facts)
+
+    def copy(self):
+        return RangeState(self.stack, self.facts)
+
+    def join(self, other, basic_block, widen):
+        '''
+            Joins two states by aligning the stack tops. Elements with different identities get the
+            identity of their position in the basic block, only the facts of both states are kept.
+            If widen is True, intervals that grew are widened to the full range.
+        Returns:
+            RangeState: the joined state.
+        '''
+        height = min(len(self.stack), len(other.stack))
+        stack = list()
+        joined = list()
+        for depth in range(height, 0, -1):
+            a, b = self.stack[-depth], other.stack[-depth]
+            identity = a[0]
+            if a[0] != b[0]:
+                identity = ("join", _get_original_pc(basic_block.start), depth)
+            low, high = min(a[1], b[1]), max(a[2], b[2])
+            if widen and (low < a[1] or high > a[2]):
+                low, high = 0, UINT256_MAX
+            stack.append((identity, low, high, a[3] if a[3] == b[3] else None))
+            joined.append(a[0] != b[0])
+        # The identities joined here may name other values at other positions, e.g. in loops
+        merged = set(element[0] for element, j in zip(stack, joined) if j)
+        stack = [(None,) + element[1:] if element[0] in merged and not j else element for element, j in zip(stack, joined)]
+        identities = set(element[0] for element in stack if element[0] is not None)
+        facts = [fact for fact in self.facts & other.facts if fact[1] in identities and fact[2] in identities and not fact[1] in merged and not fact[2] in merged]
+        return RangeState(stack, facts)
+
+    def __eq__(self, other):
+        return self.stack == other.stack and self.facts == other.facts
+
+    def pop(self):
+        if self.stack:
+            return self.stack.pop()
+        return UNKNOWN
+
+    def push(self, element):
+        self.stack.append(element)
+
+    def produce(self, identity, low, high, relation=None):
+        '''
+            Pushes a newly computed value. Elements and facts of an earlier value with the same
+            identity (e.g. from a previous loop iteration) lose their identity.
+        '''
+        if any(element[0] == identity for element in self.stack):
+            self.stack = [(None,) + element[1:] if element[0] == identity else element for element in self.stack]
+        self.facts = frozenset(fact for fact in self.facts if fact[1] != identity and fact[2] != identity)
+        self.stack.append((identity, low, high, relation))
+
+    def assume(self, relation):
+        '''
+            Restricts the state to the executions in which a relation holds: records it as a fact and
+            narrows the intervals of the compared values.
+        '''
+        if relation is None:
+            return
+        operator, x, y = relation
+        if x[0] is not None and y[0] is not None:
+            self.facts = self.facts | frozenset([(operator, x[0], y[0])])
+        strict = 1 if operator == "lt" else 0
+        # x < y implies x <= high(y) - 1 and y >= low(x) + 1
+        self._narrow(x[0], 0, y[2] - strict)
+        self._narrow(y[0], x[1] + strict, UINT256_MAX)
+
+    def _narrow(self, identity, low, high):
+        if identity is None:
+            return
+        self.stack = [(e[0], max(e[1], low), min(e[2], high), e[3]) if e[0] == identity and max(e[1], low) <= min(e[2], high) else e for e in self.stack]
+
+def _get_original_pc(instruction):
+    if isinstance(instruction.pc, tuple):
+        return instruction.pc[1]
+    return instruction.pc
+
+def _negate(relation):
+    if relation is None:
+        return None
+    operator, x, y = relation
+    # not x < y is y <= x, not x <= y is y < x
+    return ("le" if operator == "lt" else "lt", y, x)
+
+def _holds(facts, x, y, strict=False):
+    ''' Returns True if the facts show that x <= y (x < y if strict). '''
+    if x is None or y is None:
+        return False
+    return ("lt", x, y) in facts or (not strict and ("le", x, y) in facts)
+
+class ValueRanges(object):
+    '''
+        Proofs that the arithmetic instructions of a contract cannot overflow or underflow, computed
+        by get_value_ranges. Every instruction is identified by its original pc.
+    '''
+
+    def __init__(self):
+        # Largest result of an ADD or MUL without wrapping around
+        self.maximum_results = dict()
+        # ADDs whose result is compared with an operand and reverts on overflow before it is used
+        self.checked_additions = dict()
+        # SUBs whose subtrahend is known to be at most the minuend, by their intervals or by a comparison
+        self.ordered_subtractions = dict()
+
+    def get_overflow_proof(self, pc, bound=UINT256_MAX):
+        '''
+        Returns:
+            str: the reason why the ADD or MUL at pc cannot exceed bound without reverting, None if
+            there is no proof.
+        '''
+        if self.checked_additions.get(pc) and bound == UINT256_MAX:
+            return "the result is compared with an operand and the execution reverts on overflow (SafeMath)"
+        if pc in self.maximum_results and self.maximum_results[pc] <= bound:
+            return "the operands are bounded, the result is at most "+hex(self.maximum_results[pc])
+        return None
+
+    def get_underflow_proof(self, pc):
+        '''
+        Returns:
+            str: the reason why the SUB at pc cannot underflow, None if there is no proof.
+        '''
+        return self.ordered_subtractions.get(pc)
+
+    def record_maximum_result(self, pc, maximum):
+        self.maximum_results[pc] = max(self.maximum_results.get(pc, 0), maximum)
+
+    def record_checked_addition(self, pc, checked):
+        self.checked_additions[pc] = self.checked_additions.get(pc, True) and checked
+
+    def record_ordered_subtraction(self, pc, reason):
+        if self.ordered_subtractions.get(pc, True):
+            self.ordered_subtractions[pc] = reason
+
+def _transfer(state, instruction, ranges, additions):
+    '''
+        Applies a single instruction to the abstract state (in place). The results of arithmetic
+        instructions are recorded in ranges, additions maps the identities of the results of the
+        ADDs of the basic block that were not used yet to their operands.
+    '''
+    mnemonic = instruction.mnemonic
+    pc = _get_original_pc(instruction)
+    identity = ("pc", pc)
+
+    if mnemonic in ESCAPING_MNEMONICS:
+        for addition in additions.values():
+            ranges.record_checked_addition(addition[0], False)
+        additions.clear()
+
+    if mnemonic.startswith("PUSH"):
+        state.push((None, instruction.operand, instruction.operand, None))
+
+    elif mnemonic.startswith("DUP"):
+        position = int(mnemonic.replace("DUP", ""))
+        if len(state.stack) < position:
+            state.stack = [UNKNOWN] * (position - len(state.stack)) + state.stack
+        state.push(state.stack[-position])
+
+    elif mnemonic.startswith("SWAP"):
+        position = int(mnemonic.replace("SWAP", "")) + 1
+        if len(state.stack) < position:
+            state.stack = [UNKNOWN] * (position - len(state.stack)) + state.stack
+        state.stack[-1], state.stack[-position] = state.stack[-position], state.stack[-1]
+
+    elif mnemonic == "ADD":
+        a, b = state.pop(), state.pop()
+        ranges.record_maximum_result(pc, a[2] + b[2])
+        if a[2] + b[2] <= UINT256_MAX:
+            state.produce(identity, a[1] + b[1], a[2] + b[2])
+        else:
+            state.produce(identity, 0, UINT256_MAX)
+        additions[identity] = (pc, a[0], b[0])
+
+    elif mnemonic == "MUL":
+        a, b = state.pop(), state.pop()
+        ranges.record_maximum_result(pc, a[2] * b[2])
+        if a[2] * b[2] <= UINT256_MAX:
+            state.produce(identity, a[1] * b[1], a[2] * b[2])
+        else:
+            state.produce(identity, 0, UINT256_MAX)
+
+    elif mnemonic == "SUB":
+        a, b = state.pop(), state.pop()
+        if b[2] <= a[1]:
+            ranges.record_ordered_subtraction(pc, "the subtrahend is at most "+hex(b[2])+" and the minuend at least "+hex(a[1]))
+            state.produce(identity, a[1] - b[2], a[2] - b[1])
+        elif _holds(state.facts, b[0], a[0]):
+            ranges.record_ordered_subtraction(pc, "an earlier comparison ensures that the subtrahend is at most the minuend")
+            state.produce(identity, 0, a[2])
+        else:
+            ranges.record_ordered_subtraction(pc, None)
+            state.produce(identity, 0, UINT256_MAX)
+
+    elif mnemonic == "DIV":
+        a, b = state.pop(), state.pop()
+        if b[1] > 0:
+            state.produce(identity, a[1] // b[2], a[2] // b[1])
+        else:
+            state.produce(identity, 0, a[2])
+
+    elif mnemonic == "MOD":
+        a, b = state.pop(), state.pop()
+        state.produce(identity, 0, min(a[2], max(b[2] - 1, 0)))
+
+    elif mnemonic == "AND":
+        a, b = state.pop(), state.pop()
+        state.produce(identity, 0, min(a[2], b[2]))
+
+    elif mnemonic in ["OR", "XOR"]:
+        a, b = state.pop(), state.pop()
+        state.produce(identity, 0, 2 ** max(a[2].bit_length(), b[2].bit_length()) - 1)
+
+    elif mnemonic == "SHR":
+        shift, value = state.pop(), state.pop()
+        state.produce(identity, value[1] >> shift[2] if shift[2] < 256 else 0, value[2] >> shift[1] if shift[1] < 256 else 0)
+
+    elif mnemonic == "BYTE":
+        state.pop(), state.pop()
+        state.produce(identity, 0, 255)
+
+    elif mnemonic in ["LT", "GT"]:
+        a, b = state.pop(), state.pop()
+        # LT is a < b, GT is b < a
+        x, y = (a, b) if mnemonic == "LT" else (b, a)
+        if x[2] < y[1]:
+            state.produce(identity, 1, 1)
+        elif x[1] >= y[2]:
+            state.produce(identity, 0, 0)
+        else:
+            state.produce(identity, 0, 1, ("lt", x[:3], y[:3]))
+
+    elif mnemonic == "ISZERO":
+        a = state.pop()
+        if a[1] > 0:
+            state.produce(identity, 0, 0)
+        elif a[2] == 0:
+            state.produce(identity, 1, 1)
+        else:
+            state.produce(identity, 0, 1, _negate(a[3]))
+
+    elif mnemonic in ["ADDRESS", "ORIGIN", "CALLER", "COINBASE"]:
+        state.produce(identity, 0, 2 ** 160 - 1)
+
+    else:
+        for _ in range(instruction.pops):
+            state.pop()
+        for _ in range(instruction.pushes):
+            state.produce(identity, 0, UINT256_MAX)
+
+def _always_reverts(basic_block):
+    return basic_block.end.mnemonic in ["REVERT", "INVALID"]
+
+def _analyze_function(function, ranges):
+    '''
+        Worklist dataflow analysis over the control-flow graph of a function that computes, at a fixed
+        point, the intervals of the stack elements at the entry of every basic block and records the
+        arithmetic instructions that cannot overflow or underflow in ranges. Basic blocks are processed
+        in reverse post-order and only revisited when their entry state changes.
+    '''
+    key = function.key
+    order = get_reverse_post_order(function.entry, key)
+    priority = {basic_block: i for i, basic_block in enumerate(order)}
+    states = {function.entry: RangeState()}
+    visits = dict()
+    worklist = [0]
+    queued = set([0])
+    total_visits = 0
+    while worklist:
+        total_visits += 1
+        if total_visits > MAX_BASIC_BLOCK_VISITS:
+            return False
+        i = heapq.heappop(worklist)
+        queued.remove(i)
+        basic_block = order[i]
+        state = states[basic_block].copy()
+        additions = dict()
+        instructions = basic_block.instructions
+        if instructions[-1].mnemonic == "JUMPI":
+            for instruction in instructions[:-1]:
+                _transfer(state, instruction, ranges, additions)
+            state.pop()
+            condition = state.pop()
+            fall_through_pc = _get_original_pc(instructions[-1]) + 1
+            successors = list()
+            for successor in basic_block.outgoing_basic_blocks(key):
+                successor_state = state.copy()
+                if _get_original_pc(successor.start) == fall_through_pc:
+                    successor_state.assume(_negate(condition[3]))
+                else:
+                    successor_state.assume(condition[3])
+                successors.append((successor, successor_state))
+            # Additions that are only continued if their result is not smaller than an operand
+            continued = [successor_state for successor, successor_state in successors if not _always_reverts(successor)]
+            for identity, (pc, a, b) in additions.items():
+                checked = len(continued) > 0 and len(continued) < len(successors)
+                for successor_state in continued:
+                    if not (_holds(successor_state.facts, a, identity) or _holds(successor_state.facts, b, identity)):
+                        checked = False
+                ranges.record_checked_addition(pc, checked)
+        else:
+            for instruction in instructions:
+                _transfer(state, instruction, ranges, additions)
+            for addition in additions.values():
+                ranges.record_checked_addition(addition[0], False)
+            successors = [(successor, state.copy()) for successor in basic_block.outgoing_basic_blocks(key)]
+            if instructions[-1].mnemonic in HALTING_MNEMONICS:
+                successors = list()
+        for successor, successor_state in successors:
+            if not successor in priority:
+                continue
+            if successor in states:
+                visits[successor] = visits.get(successor, 0) + 1
+                joined = states[successor].join(successor_state, successor, visits[successor] > WIDENING_THRESHOLD)
+                if joined == states[successor]:
+                    continue
+                states[successor] = joined
+            else:
+                states[successor] = successor_state
+            if not priority[successor] in queued:
+                heapq.heappush(worklist, priority[successor])
+                queued.add(priority[successor])
+    return True
+
+def get_value_ranges(cfg):
+    '''
+        Interval analysis of the stack values of every function of the control-flow graph. An
+        instruction is only proven safe if it is safe in every function that reaches it. Nothing is
+        proven if a function cannot be analyzed within MAX_BASIC_BLOCK_VISITS.
+    Returns:
+        ValueRanges: the proofs of the arithmetic instructions.
+    '''
+    value_ranges = ValueRanges()
+    for function in cfg.functions:
+        if not _analyze_function(function, value_ranges):
+            return ValueRanges()
+    return value_ranges
@@ -2,59 +2,312 @@
 # -*- coding: utf-8 -*-
 
 import sys
-import pyevmasm
+import heapq
 
-from .taint_analysis import TaintRunner
 sys.path.insert(0, '..')
 
 from utils.utils import *
 
-def get_free_storage_location(cfg):
-    all_execution_paths = get_all_execution_paths_accessing_storage(cfg.entry_point, execution_paths=list(), storage_accessed=list(), visited_basic_blocks=list(), current_execution_path=list())
-    print("Number of execution paths accessing storage:", len(all_execution_paths))
-    used_storage_locations = set()
-    for execution_path in all_execution_paths:
-        if any([True for ins in execution_path if ins.mnemonic in ["SLOAD", "SSTORE"]]):
-            taint_analysis = TaintRunner(debug=False)
-            instruction_sequence = ""
-            for instruction in execution_path:
-                instruction_sequence += str(instruction) + " "
-                if instruction.mnemonic.startswith("PUSH"):
-                    taint_analysis.introduce_taint(instruction, instruction)
-                elif instruction.mnemonic in ["SLOAD", "SSTORE"]:
-                    tainted_values, stack_values = taint_analysis.check_taint(instruction)
-                    if tainted_values and len([True for t in tainted_values if not isinstance(t, pyevmasm.evmasm.Instruction)]) == 0:
-                        fixed_array_size = list()
-                        fixed_array_size += re.compile("PUSH[0-9]+ (0x[A-Fa-f0-9]+) DUP[0-9]+ LT PUSH[0-9]+ 0x[A-Fa-f0-9]+ JUMPI JUMPDEST ADD .*?[SLOAD|SSTORE]").findall(instruction_sequence)
-                        fixed_array_size += re.compile("PUSH[0-9]+ (0x[A-Fa-f0-9]+) DUP[0-9]+ LT ISZERO PUSH[0-9]+ 0x[A-Fa-f0-9]+ JUMPI ADD PUSH[0-9]+ 0x[A-Fa-f0-9]+ JUMPDEST POP .*?[SLOAD|SSTORE]").findall(instruction_sequence)
-                        storage_slot = None
-                        try:
-                            if len(stack_values) == 1:
-                                if len([t.operand for t in tainted_values if isinstance(t, pyevmasm.evmasm.Instruction)]) > 0:
-                                    storage_slot = max([t.operand for t in tainted_values if isinstance(t, pyevmasm.evmasm.Instruction)])
-                            else:
-                                if not None in stack_values:
-                                    storage_slot = min([s for s in stack_values])
-                                else:
-                                    for s in stack_values:
-                                        if s != None and s in used_storage_locations and s != 0:
-                                            used_storage_locations.remove(s)
-                            if storage_slot != None and (len(used_storage_locations) == 0 or abs(max(list(used_storage_locations)) - storage_slot) <= 32):
-                                used_storage_locations.add(storage_slot)
-                                if fixed_array_size:
-                                    fixed_array_size = int(fixed_array_size[0], 16)
-                                    used_storage_locations.add(storage_slot + fixed_array_size - 1)
-                        except:
-                            pass
-                    instruction_sequence = ""
-                else:
-                    taint_analysis.propagate_taint(instruction)
-    if not 0 in used_storage_locations:
-        used_storage_locations = set()
-    if len(used_storage_locations) > 0:
-        free_storage_location = max(used_storage_locations) + 1
+from .bytecode_rewriter import get_reverse_post_order
+
+# Maximum number of abstract values tracked per stack element or memory word, above that the value is unknown (None)
+MAX_ABSTRACT_VALUES = 8
+
+# Maximum gap between two used storage slots for them to be considered part of the same storage layout
+MAX_STORAGE_SLOT_GAP = 32
+
+UINT256_MASK = 2 ** 256 - 1
+
+MEMORY_CLOBBERING_MNEMONICS = ["CALLDATACOPY", "CODECOPY", "EXTCODECOPY", "RETURNDATACOPY", "CALL", "CALLCODE", "DELEGATECALL", "STATICCALL"]
+
+class StorageState(object):
+    '''
+        Abstract machine state at the entry of a basic block.
+
+        Stack elements and memory words are either None (unknown) or a frozenset of abstract values:
+            ("const", c)        the concrete value c
+            ("hash", s)         a keccak256 derived location rooted at storage slot s (mappings and dynamic arrays)
+            ("array", s, n)     storage slot s plus an index smaller than n (fixed-size arrays)
+            ("value", pc)       an unknown value computed by the instruction at pc
+        The stack only holds its top elements, elements below are unknown. Memory maps
+        constant offsets to words, words that are not in memory are unknown.
+    '''
+
+    def __init__(self, stack=(), memory=None):
+        self.stack = list(stack)
+        self.memory = memory if memory is not None else dict()
+
+    def copy(self):
+        return StorageState(self.stack, dict(self.memory))
+
+    def join(self, other):
+        '''
+            Joins two states by aligning the stack tops and keeping only the memory words known in both.
+        Returns:
+            StorageState: the joined state.
+        '''
+        height = min(len(self.stack), len(other.stack))
+        stack = list()
+        if height > 0:
+            stack = [_join_values(a, b) for a, b in zip(self.stack[-height:], other.stack[-height:])]
+        memory = dict()
+        for offset in self.memory:
+            if offset in other.memory:
+                value = _join_values(self.memory[offset], other.memory[offset])
+                if value is not None:
+                    memory[offset] = value
+        return StorageState(stack, memory)
+
+    def __eq__(self, other):
+        return self.stack == other.stack and self.memory == other.memory
+
+    def pop(self):
+        if self.stack:
+            return self.stack.pop()
+        return None
+
+    def push(self, value):
+        if value is not None and len(value) > MAX_ABSTRACT_VALUES:
+            value = None
+        self.stack.append(value)
+
+def _join_values(a, b):
+    if a is None or b is None:
+        return None
+    value = a | b
+    if len(value) > MAX_ABSTRACT_VALUES:
+        return None
+    return value
+
+def _constants(value):
+    if value is None:
+        return None
+    constants = [v[1] for v in value if v[0] == "const"]
+    if len(constants) != len(value):
+        return None
+    return constants
+
+def _fold(value1, value2, operation):
+    constants1, constants2 = _constants(value1), _constants(value2)
+    if constants1 is None or constants2 is None or len(constants1) * len(constants2) > MAX_ABSTRACT_VALUES:
+        return None
+    return frozenset([("const", operation(c1, c2) & UINT256_MASK) for c1 in constants1 for c2 in constants2])
+
+def _add(value1, value2, bounds):
+    values = set()
+    for a, b in [(value1, value2), (value2, value1)]:
+        if a is None:
+            continue
+        for v in a:
+            if v[0] == "hash":
+                values.add(v)
+            elif v[0] == "const" and b is not None:
+                for w in b:
+                    if w[0] == "value" and w in bounds:
+                        values.add(("array", v[1], bounds[w]))
+                    elif w[0] == "array":
+                        values.add(("array", w[1], w[2] + v[1]))
+    if values:
+        return frozenset(values)
+    return _fold(value1, value2, lambda x, y: x + y)
+
+def _hash(word):
+    if word is None:
+        return None
+    values = set()
+    for v in word:
+        if v[0] in ["const", "hash", "array"]:
+            values.add(("hash", v[1]))
+        else:
+            return None
+    return frozenset(values)
+
+def _transfer(state, instruction, bounds, accesses):
+    '''
+        Applies a single instruction to the abstract state (in place). SLOAD and SSTORE
+        keys are joined into accesses and comparisons against constants are recorded
+        as upper bounds in bounds.
+    '''
+    mnemonic = instruction.mnemonic
+    unknown = frozenset([("value", instruction.pc)])
+
+    if mnemonic.startswith("PUSH"):
+        state.push(frozenset([("const", instruction.operand)]))
+
+    elif mnemonic.startswith("DUP"):
+        position = int(mnemonic.replace("DUP", ""))
+        if len(state.stack) >= position:
+            state.push(state.stack[-position])
+        else:
+            state.push(None)
+
+    elif mnemonic.startswith("SWAP"):
+        position = int(mnemonic.replace("SWAP", "")) + 1
+        if len(state.stack) < position:
+            state.stack = [None] * (position - len(state.stack)) + state.stack
+        state.stack[-1], state.stack[-position] = state.stack[-position], state.stack[-1]
+
+    elif mnemonic in ["SLOAD", "SSTORE"]:
+        key = state.pop()
+        if mnemonic == "SSTORE":
+            state.pop()
+        else:
+            state.push(unknown)
+        pc = instruction.pc
+        if pc in accesses:
+            accesses[pc] = instruction, _join_values(accesses[pc][1], key)
+        else:
+            accesses[pc] = instruction, key
+
+    elif mnemonic == "MSTORE":
+        offset, value = state.pop(), state.pop()
+        offsets = _constants(offset)
+        if offsets is not None and len(offsets) == 1:
+            if value is None:
+                state.memory.pop(offsets[0], None)
+            else:
+                state.memory[offsets[0]] = value
+        else:
+            state.memory = dict()
+
+    elif mnemonic == "MSTORE8":
+        offset, _ = state.pop(), state.pop()
+        offsets = _constants(offset)
+        if offsets is not None and len(offsets) == 1:
+            for word in range(offsets[0] - 31, offsets[0] + 1):
+                state.memory.pop(word, None)
+        else:
+            state.memory = dict()
+
+    elif mnemonic == "MLOAD":
+        offsets = _constants(state.pop())
+        if offsets is not None and len(offsets) == 1 and offsets[0] in state.memory:
+            state.push(state.memory[offsets[0]])
+        else:
+            state.push(unknown)
+
+    elif mnemonic == "SHA3":
+        offsets, sizes = _constants(state.pop()), _constants(state.pop())
+        value = None
+        if offsets is not None and sizes is not None and len(offsets) == 1 and len(sizes) == 1 and sizes[0] >= 32:
+            # Mappings hash the key followed by the slot, dynamic arrays only hash the slot
+            value = _hash(state.memory.get(offsets[0] + sizes[0] - 32))
+        state.push(value if value is not None else unknown)
+
+    elif mnemonic == "ADD":
+        value = _add(state.pop(), state.pop(), bounds)
+        state.push(value if value is not None else unknown)
+
+    elif mnemonic in ["SUB", "MUL", "AND", "OR"]:
+        a, b = state.pop(), state.pop()
+        if mnemonic == "SUB":
+            value = _fold(a, b, lambda x, y: x - y)
+        elif mnemonic == "MUL":
+            value = _fold(a, b, lambda x, y: x * y)
+        elif mnemonic == "AND":
+            value = _fold(a, b, lambda x, y: x & y)
+        else:
+            value = _fold(a, b, lambda x, y: x | y)
+        state.push(value if value is not None else unknown)
+
+    elif mnemonic in ["LT", "GT"]:
+        a, b = state.pop(), state.pop()
+        # index < size and size > index checks bound array indices
+        index, size = (a, b) if mnemonic == "LT" else (b, a)
+        sizes = _constants(size)
+        if index is not None and sizes:
+            for v in index:
+                if v[0] == "value":
+                    bounds[v] = max(bounds.get(v, 0), max(sizes))
+        state.push(unknown)
+
     else:
-        free_storage_location = 0
+        for _ in range(instruction.pops):
+            state.pop()
+        if mnemonic in MEMORY_CLOBBERING_MNEMONICS:
+            state.memory = dict()
+        for _ in range(instruction.pushes):
+            state.push(unknown)
+
+def get_function_storage_accesses(function):
+    '''
+        Worklist dataflow analysis over the control-flow graph of a function that computes,
+        at a fixed point, the storage locations accessed by every SLOAD and SSTORE of the
+        function. Basic blocks are processed in reverse post-order and only revisited when
+        their entry state changes.
+    Returns:
+        list: (instruction, locations) tuples, where locations is a frozenset of abstract
+        values (see StorageState) or None if the accessed location is unknown.
+    '''
+    key = function.key
+    order = get_reverse_post_order(function.entry, key)
+    priority = {basic_block: i for i, basic_block in enumerate(order)}
+    states = {function.entry: StorageState()}
+    bounds = dict()
+    accesses = dict()
+    worklist = [0]
+    queued = set([0])
+    while worklist:
+        i = heapq.heappop(worklist)
+        queued.remove(i)
+        basic_block = order[i]
+        state = states[basic_block].copy()
+        for instruction in basic_block.instructions:
+            _transfer(state, instruction, bounds, accesses)
+        for successor in basic_block.outgoing_basic_blocks(key):
+            if successor in states:
+                joined = states[successor].join(state)
+                if joined == states[successor]:
+                    continue
+                states[successor] = joined
+            else:
+                states[successor] = state.copy()
+            if not priority[successor] in queued:
+                heapq.heappush(worklist, priority[successor])
+                queued.add(priority[successor])
+    return list(accesses.values())
+
+def get_storage_accesses(cfg):
+    '''
+    Returns:
+        dict: the storage accesses of every function of the control-flow graph (see get_function_storage_accesses).
+    '''
+    storage_accesses = dict()
+    for function in cfg.functions:
+        storage_accesses[function] = get_function_storage_accesses(function)
+    return storage_accesses
+
+def get_storage_slots(locations):
+    '''
+    Returns:
+        list: (first, last) intervals of the storage slots used by locations, mappings
+        and dynamic arrays only occupy their root slot.
+    '''
+    slots = list()
+    if locations is not None:
+        for v in locations:
+            if v[0] in ["const", "hash"]:
+                slots.append((v[1], v[1]))
+            elif v[0] == "array" and v[2] > 0:
+                slots.append((v[1], v[1] + v[2] - 1))
+    return slots
+
+def get_free_storage_location(cfg, storage_accesses=None):
+    if storage_accesses is None:
+        storage_accesses = get_storage_accesses(cfg)
+    slots = list()
+    for function in storage_accesses:
+        for _, locations in storage_accesses[function]:
+            slots += get_storage_slots(locations)
+    # Solidity lays out state variables from slot 0 onwards, slots far away from the layout are hashes or constants
+    used_storage_locations = set()
+    free_storage_location = 0
+    for first, last in sorted(slots):
+        if first > free_storage_location - 1 + MAX_STORAGE_SLOT_GAP or (not used_storage_locations and first != 0):
+            break
+        used_storage_locations.add(first)
+        used_storage_locations.add(last)
+        free_storage_location = max(free_storage_location, last + 1)
     return free_storage_location, used_storage_locations
 
 def get_free_storage_location_sequence(free_storage_location):
@@ -67,39 +67,138 @@ def print_tainted_storage(storage):
     string += "}"
     print(string)
 
+class TaintStack:
+    """ Persistent stack that shares its cells with all of its copies """
+    __slots__ = ("_head", "_size")
+
+    def __init__(self, head=None, size=0):
+        # Cells are immutable (value, next) tuples. Cells that are missing
+        # below the last cell are implicit None values (stack padding).
+        self._head = head
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        values = list()
+        cell = self._head
+        while cell:
+            values.append(cell[0])
+            cell = cell[1]
+        values += [None] * (self._size - len(values))
+        return reversed(values)
+
+    def _depth(self, index):
+        depth = -index - 1 if index < 0 else self._size - 1 - index
+        if depth < 0 or depth >= self._size:
+            raise IndexError("stack index out of range")
+        return depth
+
+    def __getitem__(self, index):
+        cell = self._head
+        for _ in range(self._depth(index)):
+            if not cell:
+                return None
+            cell = cell[1]
+        return cell[0] if cell else None
+
+    def __setitem__(self, index, value):
+        values = list()
+        cell = self._head
+        for _ in range(self._depth(index)):
+            values.append(cell[0] if cell else None)
+            cell = cell[1] if cell else None
+        cell = (value, cell[1] if cell else None)
+        for v in reversed(values):
+            cell = (v, cell)
+        self._head = cell
+
+    def copy(self):
+        return TaintStack(self._head, self._size)
+
+    def append(self, value):
+        self._head = (value, self._head)
+        self._size += 1
+
+    def pop(self):
+        if self._size == 0:
+            raise IndexError("pop from empty stack")
+        self._size -= 1
+        if not self._head:
+            return None
+        value, self._head = self._head
+        return value
+
+    def insert(self, index, value):
+        if index != 0:
+            raise IndexError("values can only be inserted at the bottom of the stack")
+        if value is None:
+            self._size += 1
+        else:
+            values = list(self)
+            self._head, self._size = None, 0
+            for v in [value] + values:
+                self.append(v)
+
 class TaintRecord:
     def __init__(self):
         """ Builds a taint record """
         # Machine and world state
-        self.stack = list()
+        self.stack = TaintStack()
         self.memory = dict()
         self.storage = dict()
 
         # Tainted state
-        self.tainted_stack = list()
+        self.tainted_stack = TaintStack()
         self.tainted_memory = dict()
         self.tainted_storage = dict()
 
+        # Maps that are shared with another record and must be copied before being written
+        self.shared = set()
+
     def __str__(self):
         return json.dumps(self.__dict__)
 
-    def clone(self):
-        """ Clones this record"""
+    def clone(self, copy_on_write=True):
+        """ Clones this record in constant time.
+        Stacks are persistent and maps are only copied on their first write.
+        Without copy_on_write, the maps are handed over to the clone and this record must be discarded. """
         clone = TaintRecord()
-        clone.stack = copy.copy(self.stack)
-        clone.memory = copy.copy(self.memory)
-        clone.storage = copy.copy(self.storage)
-        clone.tainted_stack = copy.copy(self.tainted_stack)
-        clone.tainted_memory = copy.copy(self.tainted_memory)
-        clone.tainted_storage = copy.copy(self.tainted_storage)
+        clone.stack = self.stack.copy()
+        clone.memory = self.memory
+        clone.storage = self.storage
+        clone.tainted_stack = self.tainted_stack.copy()
+        clone.tainted_memory = self.tainted_memory
+        clone.tainted_storage = self.tainted_storage
+        if copy_on_write:
+            self.shared = {"memory", "storage", "tainted_memory", "tainted_storage"}
+            clone.shared = set(self.shared)
+        else:
+            clone.shared = set(self.shared)
         return clone
 
+    def writable(self, name):
+        """ Returns the map with the given name, copying it first if it is shared """
+        if name in self.shared:
+            setattr(self, name, copy.copy(getattr(self, name)))
+            self.shared.discard(name)
+        return getattr(self, name)
+
 class TaintRunner:
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, keep_trace=True):
         self.debug = debug
+        # Without keep_trace only the current record is kept in the execution trace
+        self.keep_trace = keep_trace
         self.execution_trace = list()
         self.storage = dict()
 
+    def _append_record(self, execution):
+        if self.keep_trace or len(self.execution_trace) == 0:
+            self.execution_trace.append(execution)
+        else:
+            self.execution_trace[-1] = execution
+
     def introduce_taint(self, taint, instruction):
         if self.debug:
             if isinstance(instruction.pc, int):
@@ -133,7 +232,7 @@ class TaintRunner:
                 else:
                     execution.stack.append(None)
                 execution.tainted_stack.append(tainted_elements)
-        self.execution_trace.append(execution)
+        self._append_record(execution)
         if self.debug:
             print_stack(execution.stack)
             print_tainted_stack(execution.tainted_stack)
@@ -156,7 +255,7 @@ class TaintRunner:
                 print(hex(instruction.pc[0]), instruction.mnemonic)
         if len(self.execution_trace) != 0:
             try:
-                execution = TaintRunner.execute(self.execution_trace[-1], self.storage, instruction)
+                execution = TaintRunner.execute(self.execution_trace[-1], self.storage, instruction, self.keep_trace)
                 if self.debug:
                     print_stack(execution.stack)
                     print_tainted_stack(execution.tainted_stack)
@@ -170,7 +269,7 @@ class TaintRunner:
                         print_storage(execution.storage)
                         print_tainted_storage(execution.tainted_storage)
                         print("----------------------------------------------------")
-                self.execution_trace.append(execution)
+                self._append_record(execution)
             except:
                 pass
 
@@ -210,8 +309,8 @@ class TaintRunner:
         self.call_stack = []
 
     @staticmethod
-    def execute(record, storage, instruction):
-        new_record = record.clone()
+    def execute(record, storage, instruction, copy_on_write=True):
+        new_record = record.clone(copy_on_write)
 
         op = instruction.mnemonic
         if op.startswith("DUP"):
@@ -384,8 +483,10 @@ class TaintRunner:
     def mutate_mstore(record, instruction):
         index = record.stack.pop()
         record.tainted_stack.pop()
-        record.memory[index] = record.stack.pop()
-        record.tainted_memory[index] = record.tainted_stack.pop()
+        value = record.stack.pop()
+        tainted_value = record.tainted_stack.pop()
+        record.writable("memory")[index] = value
+        record.writable("tainted_memory")[index] = tainted_value
 
     @staticmethod
     def mutate_sload(record, storage, instruction):
@@ -402,8 +503,10 @@ class TaintRunner:
     def mutate_sstore(record, storage, instruction):
         index = record.stack.pop()
         record.tainted_stack.pop()
-        record.storage[index] = record.stack.pop()
-        record.tainted_storage[index] = record.tainted_stack.pop()
+        value = record.stack.pop()
+        tainted_value = record.tainted_stack.pop()
+        record.writable("storage")[index] = value
+        record.writable("tainted_storage")[index] = tainted_value
 
     @staticmethod
     def mutate_log(record, op):
@@ -1,6 +1,32 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from web3 import Web3
+import os
 
-PROVIDER = Web3.WebsocketProvider("wss://mainnet.infura.io/ws/v3/41e2dadcce7245d986bbc9e1196ca43b")
+# Websocket endpoint used to retrieve the bytecode of an address (web3 is only imported for --address)
+PROVIDER_URL = "wss://mainnet.infura.io/ws/v3/41e2dadcce7245d986bbc9e1196ca43b"
+
+# Default deadlines of the detectors in seconds (can be changed with --detector-timeouts)
+DETECTOR_TIMEOUTS = {
+    "osiris": 1800,
+    "oyente": 1800,
+    "mythril": 600
+}
+
+# Directory and maximum size in bytes of the detector result cache (can be disabled with --disable-detector-cache)
+DETECTOR_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".elysium", "detectors")
+DETECTOR_CACHE_SIZE = 64 * 1024 * 1024
+
+# Directory and maximum size in bytes of the cache of recovered control-flow graphs (can be disabled with --disable-cfg-cache)
+CFG_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".elysium", "cfgs")
+CFG_CACHE_SIZE = 256 * 1024 * 1024
+
+# Default limits of every job of 'elysium.py batch': time in seconds and memory in megabytes
+BATCH_TIMEOUT = 120
+BATCH_MEMORY_LIMIT = 4096
+
+# Minimum number of bytes that identical patches have to save to be outlined into a shared subroutine (see --outline-patches)
+OUTLINE_MIN_BYTES_SAVED = 1
+
+# Fork of the gas costs of the static gas overhead estimate in the report (see --gas-fork)
+GAS_FORK = "cancun"
@@ -7,41 +7,9 @@ import copy
 import time
 import json
 import shlex
-import solcx
 import subprocess
 
-def get_all_execution_paths_accessing_storage(basic_block, depth=0, execution_paths=list(), storage_accessed=list(), visited_basic_blocks=list(), current_execution_path=list()):
-    if basic_block:
-        if not basic_block in visited_basic_blocks:
-            visited_basic_blocks.append(basic_block)
-            for instruction in basic_block.instructions:
-                current_execution_path.append(instruction)
-            if len(basic_block.all_outgoing_basic_blocks) == 0:
-                accessed_storage = [i.pc for i in current_execution_path if i.mnemonic in ["SLOAD", "SSTORE"]]
-                if any(accessed_storage) and accessed_storage not in storage_accessed:
-                    execution_paths.append(copy.copy(current_execution_path))
-                    storage_accessed.append(accessed_storage)
-            for outgoing_basic_block in basic_block.all_outgoing_basic_blocks:
-                if depth <= 7:
-                    get_all_execution_paths_accessing_storage(outgoing_basic_block, depth + 1, execution_paths, storage_accessed, copy.copy(visited_basic_blocks), copy.copy(current_execution_path))
-                else:
-                    get_all_execution_paths_accessing_storage(outgoing_basic_block, depth + 1, execution_paths, storage_accessed, visited_basic_blocks, copy.copy(current_execution_path))
-    return execution_paths
-
-def get_all_execution_paths(basic_block, depth=0, execution_paths=list(), visited_basic_blocks=list(), current_execution_path=list()):
-    if basic_block:
-        if not basic_block in visited_basic_blocks:
-            visited_basic_blocks.append(basic_block)
-            for instruction in basic_block.instructions:
-                current_execution_path.append(instruction)
-            if len(basic_block.all_outgoing_basic_blocks) == 0:
-                execution_paths.append(copy.copy(current_execution_path))
-            for outgoing_basic_block in basic_block.all_outgoing_basic_blocks:
-                if depth <= 7:
-                    get_all_execution_paths(outgoing_basic_block, depth + 1, execution_paths, copy.copy(visited_basic_blocks), copy.copy(current_execution_path))
-                else:
-                    get_all_execution_paths(outgoing_basic_block, depth + 1, execution_paths, visited_basic_blocks, copy.copy(current_execution_path))
-    return execution_paths
+from modules.bytecode_rewriter import get_basic_block_index
 
 def get_error_handlers(basic_block, error_handlers=list(), visited_basic_blocks=list(), previous_basic_block=None):
     if basic_block:
@@ -85,17 +53,12 @@ def get_all_codecopy_instructions(basic_block, visited_basic_blocks=list(), code
     return codecopy_instructions
 
 def get_basic_block(cfg, pc):
-    basic_block = None
-    for bb in cfg.basic_blocks:
-        if pc >= bb.start.pc[1] and pc <= bb.end.pc[1]:
-            basic_block = bb
-            break
-    return basic_block
+    return get_basic_block_index(cfg).get_basic_block(pc)
 
 def get_error_handling_sequence(basic_block, enable_error_handling_inference):
     error_handling_sequence = "PUSH1_0x0 DUP1 REVERT"
     if enable_error_handling_inference:
-        error_handlers = get_error_handlers(basic_block)
+        error_handlers = get_error_handlers(basic_block, list(), list())
         if len(error_handlers) > 0:
             error_handling_sequence = ""
             for i in range(len(error_handlers[0])):
@@ -157,6 +120,29 @@ def write_report_to_file(args, execution_start, report):
             with open(args.address + ".report.json", "w") as report_file:
                 json.dump(report, report_file, indent=4)
 
+def write_patched_bytecode_to_file(args, patched_bytecode):
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(patched_bytecode)
+    else:
+        if args.bytecode:
+            filename, file_extension = os.path.splitext(args.bytecode)
+            with open(filename + ".patched" + file_extension, "w") as file:
+                file.write(patched_bytecode)
+        elif args.source_code:
+            with open(args.source_code.replace(".sol", ".patched.bin"), "w") as file:
+                file.write(patched_bytecode)
+        elif args.address:
+            with open(args.address + ".patched.bin", "w") as file:
+                file.write(patched_bytecode)
+
+def split_bytecode(bytecode):
+    """ Returns the deployment bytecode (None if the bytecode only contains deployed bytecode) and the deployed bytecode. """
+    bytecode = bytecode.strip().replace("0x", "")
+    if contains_deployment_bytecode(bytecode):
+        return extract_deployment_bytecode(bytecode), extract_deployed_bytecode(bytecode)
+    return None, bytecode
+
 def contains_deployment_bytecode(bytecode):
     if re.search(r"^6080604052.*396000f3006080604052", bytecode) and re.search(r"^6080604052.*396000f3fe6080604052", bytecode):
         return True
@@ -232,6 +218,8 @@ def remove_metadata(bytecode):
     return runtime_bytecode
 
 def compile(source_code_file, solc_version=None):
+    # solcx is only needed to compile source code
+    import solcx
     out = None
     with open(source_code_file, 'r') as file:
         source_code = file.read()
@@ -299,6 +287,8 @@ def compile(source_code_file, solc_version=None):
     return out
 
 def get_storage_layout(source_code_file, solc_version=None):
+    # solcx is only needed to compile source code
+    import solcx
     out = dict()
     with open(source_code_file, 'r') as file:
         source_code = file.read()
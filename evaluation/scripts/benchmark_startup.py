@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ELYSIUM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "elysium", "elysium.py")
+
+# Small contract of the SmartBugs dataset with a bug report, patched on every run
+CONTRACT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "datasets", "SmartBugs", "reentrancy", "reentrance")
+
+# Budget in seconds for patching a small contract on the bytecode-only path (-b file -r report.json)
+STARTUP_BUDGET = 0.5
+
+# Dependencies that are only needed for --address, --source-code and to run the detectors
+HEAVY_MODULES = ["web3", "eth_utils", "solcx", "docker"]
+
+class colors:
+    INFO = '\033[94m'
+    OK = '\033[92m'
+    FAIL = '\033[91m'
+    END = '\033[0m'
+
+def measure_startup(runs):
+    """ Returns the median time of patching the contract with its bug report on the bytecode-only path,
+    None if a run fails. The patched bytecode and the report are written to a temporary directory. """
+    times = list()
+    with tempfile.TemporaryDirectory() as directory:
+        command = [sys.executable, ELYSIUM, "-b", CONTRACT+".bin", "-r", CONTRACT+".bugs.json", "-o", os.path.join(directory, "patched.bin"), "--disable-cfg-cache"]
+        for _ in range(runs):
+            start = time.time()
+            process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.time() - start)
+            if process.returncode != 0:
+                return None
+    return statistics.median(times)
+
+def get_loaded_heavy_modules():
+    code = "import sys; sys.path.insert(0, "+repr(os.path.dirname(ELYSIUM))+"); import elysium; print(' '.join(m for m in "+str(HEAVY_MODULES)+" if m in sys.modules))"
+    return subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().split()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--runs", type=int, default=10, help="Number of runs (default: 10)")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="Startup budget in seconds (default: "+str(STARTUP_BUDGET)+")")
+    args = parser.parse_args()
+
+    failed = False
+
+    loaded_modules = get_loaded_heavy_modules()
+    if loaded_modules:
+        print(colors.FAIL+"Modules loaded on the bytecode-only path: "+", ".join(loaded_modules)+colors.END)
+        failed = True
+    else:
+        print(colors.OK+"No heavy module loaded on the bytecode-only path."+colors.END)
+
+    startup_time = measure_startup(args.runs)
+    if startup_time is None:
+        print(colors.FAIL+"Patching "+os.path.basename(CONTRACT)+".bin failed."+colors.END)
+        failed = True
+    elif startup_time > args.budget:
+        print(colors.FAIL+"Startup time: "+str(round(startup_time, 3))+" second(s) (budget: "+str(args.budget)+" second(s))"+colors.END)
+        failed = True
+    else:
+        print(colors.OK+"Startup time: "+str(round(startup_time, 3))+" second(s) (budget: "+str(args.budget)+" second(s))"+colors.END)
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "elysium"))
+
+from pyevmasm import assemble_hex
+
+from modules.bytecode_rewriter import apply_patches, relocate_and_assemble
+from modules.patch_outlining import share_error_handlers
+from modules.patch_templates import instantiate_patches
+from modules.peephole_optimizer import PEEPHOLE_RULES, optimize_patched_basic_blocks
+from modules.evm_cfg_builder.cfg import CFG
+
+from eth import Chain
+from eth.chains.mainnet import MAINNET_GENESIS_HEADER
+from eth.constants import BLANK_ROOT_HASH
+from eth.db.atomic import AtomicDB
+from eth.vm.forks import IstanbulVM
+from eth.vm.message import Message
+
+# Loads four words of call data onto the stack, the patches are inserted after the last load (insert mode
+# 'after') or before the first instruction that returns the four words of the stack (insert mode 'before')
+BLOCK = [
+    "PUSH1 0x60", "CALLDATALOAD", "PUSH1 0x40", "CALLDATALOAD", "PUSH1 0x20", "CALLDATALOAD", "PUSH1 0x0", "CALLDATALOAD",
+    "PUSH1 0x0", "MSTORE", "PUSH1 0x20", "MSTORE", "PUSH1 0x40", "MSTORE", "PUSH1 0x60", "MSTORE", "PUSH1 0x80", "PUSH1 0x0", "RETURN"
+]
+AFTER_ADDRESS = 11
+BEFORE_ADDRESS = 12
+
+ERROR_HANDLING_SEQUENCE = "PUSH1_0x0 DUP1 REVERT"
+INTEGER_BOUNDS = "PUSH32_"+hex(2**256-1)
+
+def _patch(insert, insert_mode="before"):
+    return {"delete": "", "insert": insert, "insert_mode": insert_mode, "constructor": False}
+
+def _at(address, patches):
+    return [(address, patch) for patch in patches]
+
+# Patch plans on which the rules apply, the share flag runs share_error_handlers on the plan first
+SAMPLES = {
+    "double_iszero_before_jumpi": [
+        (_at(AFTER_ADDRESS, instantiate_patches("unhandled_exception_patch", {"error_handling_sequence": ERROR_HANDLING_SEQUENCE})), False)
+    ],
+    "triple_iszero": [
+        (_at(BEFORE_ADDRESS, [_patch("DUP1 ISZERO ISZERO ISZERO PUSH_jump_loc_1 JUMPI "+ERROR_HANDLING_SEQUENCE+" JUMPDEST_jump_loc_1")]), False)
+    ],
+    "double_not": [
+        (_at(BEFORE_ADDRESS, [_patch("DUP2 NOT NOT SWAP2 POP")]), False)
+    ],
+    "dup_pop": [
+        (_at(BEFORE_ADDRESS, [_patch("DUP2 POP DUP1 PUSH1_0x5 POP ADD")]), False)
+    ],
+    "double_swap": [
+        (_at(BEFORE_ADDRESS, [_patch("SWAP2 SWAP2 SWAP1")]), False)
+    ],
+    "identical_guards": [
+        (_at(BEFORE_ADDRESS, 2 * instantiate_patches("unsigned_integer_overflow_addition_patch", {"integer_bounds": INTEGER_BOUNDS, "error_handling_sequence": ERROR_HANDLING_SEQUENCE})), False),
+        (_at(BEFORE_ADDRESS, 2 * instantiate_patches("integer_underflow_patch", {"error_handling_sequence": ERROR_HANDLING_SEQUENCE})), False),
+        (_at(BEFORE_ADDRESS, 2 * instantiate_patches("integer_underflow_patch", {"error_handling_sequence": ERROR_HANDLING_SEQUENCE})), True)
+    ]
+}
+
+# Words of call data, most of them at the bounds of the checks
+WORDS = [0, 1, 2, 3, 2**128, 2**255 - 1, 2**255, 2**256 - 2, 2**256 - 1]
+
+def get_patched_bytecode(patch_plan, share, rules=None):
+    """ Patches the block with a patch plan and returns the patched bytecode and the applied rules, the
+    peephole optimizer runs with the given rules, not at all if rules is None. """
+    cfg = CFG(assemble_hex("\n".join(BLOCK)).replace("0x", ""), cache_directory=None)
+    for basic_block in cfg.basic_blocks:
+        for instruction in basic_block.instructions:
+            instruction.pc = instruction.pc, instruction.pc
+    if share:
+        patch_plan, _ = share_error_handlers(cfg, patch_plan)
+    conflicts = apply_patches(cfg, patch_plan)
+    if conflicts:
+        raise Exception("Patch could not be applied: "+conflicts[0]["reason"])
+    optimizations = list()
+    if rules is not None:
+        optimizations = optimize_patched_basic_blocks(cfg, rules)
+    bytecode, _ = relocate_and_assemble(cfg)
+    return bytes(bytecode), optimizations
+
+def execute(code, words):
+    """ Executes code on a local py-evm with the words as call data.
+
+    Returns:
+        bool: True if the execution succeeded.
+        bytes: the output.
+        int: the gas used.
+    """
+    # The mainnet genesis header with an empty state
+    chain = Chain.configure(vm_configuration=((0, IstanbulVM),)).from_genesis_header(AtomicDB(), MAINNET_GENESIS_HEADER.copy(state_root=BLANK_ROOT_HASH))
+    state = chain.get_vm().state
+    address = b"\x11" * 20
+    state.set_code(address, code)
+    message = Message(gas=1000000, to=address, sender=b"\x22" * 20, value=0, data=b"".join(word.to_bytes(32, "big") for word in words), code=code)
+    transaction_context = state.get_transaction_context_class()(gas_price=1, origin=b"\x22" * 20)
+    computation = state.computation_class.apply_computation(state, message, transaction_context)
+    return computation.is_success, bytes(computation.output), computation.get_gas_used()
+
+def validate_rule(name, rule, inputs):
+    """ Executes the block patched with every sample of a rule with and without the rule and compares the
+    executions. Returns True if all executions are identical. """
+    identical = True
+    for patch_plan, share in SAMPLES[name]:
+        original, _ = get_patched_bytecode(patch_plan, share)
+        optimized, optimizations = get_patched_bytecode(patch_plan, share, [(name, rule)])
+        if not optimizations:
+            print("\033[1m\033[91mWarning: Rule '"+name+"' does not apply to sample:", " | ".join(patch["insert"] for _, patch in patch_plan), "\033[0m")
+            identical = False
+            continue
+        gas_saved = list()
+        successful = 0
+        for words in inputs:
+            result_original, result_optimized = execute(original, words), execute(optimized, words)
+            if result_original[:2] != result_optimized[:2]:
+                print("\033[1m\033[91mWarning: Rule '"+name+"' changes the execution for call data:", [hex(word) for word in words], "\033[0m")
+                identical = False
+                break
+            gas_saved.append(result_original[2] - result_optimized[2])
+            successful += result_original[0]
+        if identical and successful == 0:
+            print("\033[1m\033[91mWarning: No execution of the sample of rule '"+name+"' succeeds.\033[0m")
+            identical = False
+            continue
+        print("Rule '"+name+"':", len(original) - len(optimized), "byte(s) saved,", min(gas_saved), "to", max(gas_saved), "gas saved on", len(gas_saved), "executions.")
+    return identical
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares executions of patched blocks with and without each rule of the peephole optimizer.")
+
+    parser.add_argument(
+        "-r", "--rule", type=str, help="Only validate this rule")
+    parser.add_argument(
+        "-n", "--inputs", type=int, default=200, help="Number of call data inputs per sample (default: 200)")
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the call data inputs (default: 0)")
+
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    inputs = [[random.choice(WORDS + [random.getrandbits(256)]) for _ in range(4)] for _ in range(args.inputs)]
+
+    success, failure = 0, 0
+    for name, rule in PEEPHOLE_RULES:
+        if args.rule and name != args.rule:
+            continue
+        if not name in SAMPLES:
+            print("\033[1m\033[91mWarning: Rule '"+name+"' has no samples.\033[0m")
+            failure += 1
+        elif validate_rule(name, rule, inputs):
+            success += 1
+        else:
+            failure += 1
+    print("Equivalent rules:", success, "-", "Failed rules:", failure)
+    if failure:
+        sys.exit(-1)
+
+if __name__ == '__main__':
+    main()
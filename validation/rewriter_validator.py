@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "elysium"))
+
+from pyevmasm import assemble_hex
+
+from modules.bytecode_rewriter import apply_patches, relocate_and_assemble
+from modules.evm_cfg_builder.cfg import CFG
+
+from peephole_validator import execute
+
+# Jumps over an INVALID to a JUMPDEST that starts the second basic block, then returns the first word of
+# call data. The first instruction of the code (pc 0) and the JUMPDEST (pc 4) are at position 0 of their
+# basic blocks.
+BLOCK = [
+    "PUSH1 0x4", "JUMP", "INVALID", "JUMPDEST", "PUSH1 0x0", "CALLDATALOAD", "PUSH1 0x0", "MSTORE", "PUSH1 0x20", "PUSH1 0x0", "RETURN"
+]
+
+# Reverts if the first word of call data is zero
+GUARD = "PUSH1_0x0 CALLDATALOAD PUSH_jump_loc_1 JUMPI PUSH1_0x0 DUP1 REVERT JUMPDEST_jump_loc_1"
+
+def _patch(insert, insert_mode="before", delete=""):
+    return {"delete": delete, "insert": insert, "insert_mode": insert_mode, "constructor": False}
+
+# Patches at the first position of a basic block, as (description, address, patch)
+SAMPLES = [
+    ("before the first instruction of the code", 0, _patch(GUARD)),
+    ("after the first instruction of the code", 0, _patch(GUARD, "after")),
+    ("after the JUMPDEST of a basic block", 4, _patch(GUARD, "after")),
+    ("replacing the JUMPDEST of a basic block", 4, _patch("JUMPDEST "+GUARD, delete="JUMPDEST"))
+]
+
+# Words of call data, the guard reverts on the first one
+WORDS = [0, 1, 2**256 - 1]
+
+def get_patched_bytecode(patch_plan):
+    cfg = CFG(assemble_hex("\n".join(BLOCK)).replace("0x", ""), cache_directory=None)
+    for basic_block in cfg.basic_blocks:
+        for instruction in basic_block.instructions:
+            instruction.pc = instruction.pc, instruction.pc
+    conflicts = apply_patches(cfg, patch_plan)
+    if conflicts:
+        raise Exception("Patch could not be applied: "+conflicts[0]["reason"])
+    bytecode, _ = relocate_and_assemble(cfg)
+    return bytes(bytecode)
+
+def validate_sample(description, address, patch):
+    """ Patches the block with a guard and checks that the guard is executed: the patched block reverts on
+    call data that is zero and returns the call data otherwise. Returns True if it does. """
+    try:
+        original, patched = get_patched_bytecode(list()), get_patched_bytecode([(address, patch)])
+    except Exception as e:
+        print("\033[1m\033[91mWarning: Patch "+description+" failed:", str(e), "\033[0m")
+        return False
+    if len(patched) <= len(original):
+        print("\033[1m\033[91mWarning: Patch "+description+" was not inserted.\033[0m")
+        return False
+    for word in WORDS:
+        success, output, _ = execute(patched, [word])
+        if success != (word != 0) or (success and output != word.to_bytes(32, "big")):
+            print("\033[1m\033[91mWarning: Patch "+description+" changes the execution for call data:", hex(word), "\033[0m")
+            return False
+    print("Patch "+description+":", len(patched) - len(original), "byte(s) inserted.")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks that patches at the first position of a basic block are applied and executed.")
+    parser.parse_args()
+
+    success, failure = 0, 0
+    for description, address, patch in SAMPLES:
+        if validate_sample(description, address, patch):
+            success += 1
+        else:
+            failure += 1
+    print("Applied patches:", success, "-", "Failed patches:", failure)
+    if failure:
+        sys.exit(-1)
+
+if __name__ == '__main__':
+    main()